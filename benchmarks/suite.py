@@ -0,0 +1,296 @@
+"""
+Benchmarks of the hot paths: collecting metrics, notifying observers and
+appending model events to the views. Results are saved as JSON so that
+runs can be compared, for example before a release:
+
+    python -m benchmarks.suite --output before.json
+    python -m benchmarks.suite --compare before.json
+"""
+
+import argparse
+import datetime as dt
+import io
+import json
+import os
+import platform
+import secrets
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.trees import SHAPES, build_tree
+from common.observer import Observable, Observer
+from controller.testcontroller import MockController
+from model.agent import AUTHKEY_ENV
+from model.model import Model
+
+# Relative slowdown over the compared run reported as a regression
+DEFAULT_TOLERANCE = 0.2
+OBSERVER_COUNTS = (1, 10, 100)
+NOTIFY_EVENTS = 20000
+VIEW_EVENTS = 50000
+
+
+class CountingObserver(Observer):
+    def __init__(self):
+        self.count = 0
+
+    def update(self, value):
+        self.count += 1
+
+    def update_batch(self, values):
+        self.count += len(values)
+
+
+def best_of(repeat, func):
+    """
+    Runs a function several times
+
+    :param repeat: the number of runs
+    :param func: the function
+    :return: the shortest time in seconds
+    """
+    best = None
+    for __ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_collection(workdir, shapes, workers, repeat):
+    """
+    Times full and incremental collections of each tree shape
+
+    :param workdir: the folder where the trees and outputs are created
+    :param shapes: the names of the shapes
+    :param workers: the number of worker processes
+    :param repeat: the number of runs of each measure
+    :return: dict with the results by shape
+    """
+    results = {}
+    model = Model()
+    for name in shapes:
+        root = os.path.join(workdir, name)
+        files, dirs, size = build_tree(root, SHAPES[name])
+        full = best_of(repeat, lambda: model.collect_metrics(workdir, [root], incremental=False,
+                                                             workers=workers))
+        model.collect_metrics(workdir, [root], workers=workers)
+        incremental = best_of(repeat, lambda: model.collect_metrics(workdir, [root], workers=workers))
+        results[name] = {
+            'files': files,
+            'dirs': dirs,
+            'seconds': full,
+            'files_per_s': files / full,
+            'mb_per_s': size / 2 ** 20 / full,
+            'incremental_seconds': incremental,
+        }
+    return results
+
+
+def start_agents(count, workers):
+    """
+    Starts agents listening on free ports of localhost
+
+    :param count: the number of agents
+    :param workers: the number of worker processes of each agent
+    :return: list of (process, 'host:port' address) tuples
+    """
+    main_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+    agents = []
+    for __ in range(count):
+        process = subprocess.Popen([sys.executable, main_path, 'agent', '--listen', '127.0.0.1:0',
+                                    '--workers', str(workers)],
+                                   stdout=subprocess.PIPE, text=True, env=os.environ.copy())
+        # Agent listening at <host>:<port>
+        agents.append((process, process.stdout.readline().split()[-1]))
+    return agents
+
+
+def bench_agents(workdir, shapes, counts, workers, repeat):
+    """
+    Times collections spread over several agents on localhost, with
+    a copy of every tree shape per agent so that each one gets the same work
+
+    :param workdir: the folder where the trees and outputs are created
+    :param shapes: the names of the shapes
+    :param counts: the numbers of agents
+    :param workers: the number of worker processes of each agent
+    :param repeat: the number of runs of each measure
+    :return: dict with the results by number of agents
+    """
+    results = {}
+    model = Model()
+    # The agents and this process share a key of their own
+    os.environ.setdefault(AUTHKEY_ENV, secrets.token_hex(16))
+    roots = []
+    files = 0
+    for copy in range(max(counts)):
+        for name in shapes:
+            root = os.path.join(workdir, 'agents', f'{name}{copy}')
+            files += build_tree(root, SHAPES[name])[0]
+            roots.append(root)
+    per_copy = files // max(counts)
+    for count in counts:
+        agents = start_agents(count, workers)
+        try:
+            addresses = [address for __, address in agents]
+            used = roots[:count * len(shapes)]
+            elapsed = best_of(repeat, lambda: model.collect_metrics(workdir, used, incremental=False,
+                                                                    agents=addresses))
+        finally:
+            for process, __ in agents:
+                process.terminate()
+                process.wait()
+        results[f'{count}_agents'] = {
+            'files': per_copy * count,
+            'seconds': elapsed,
+            'files_per_s': per_copy * count / elapsed,
+        }
+    return results
+
+
+def bench_notify(repeat):
+    """
+    Times the fan out of Observable.notify to several observers,
+    delivering each value at once and in batches
+
+    :param repeat: the number of runs of each measure
+    :return: dict with the nanoseconds per notified value
+    """
+    results = {}
+    for batch_size in (None, 256):
+        for count in OBSERVER_COUNTS:
+            observable = Observable(batch_size=batch_size)
+            for __ in range(count):
+                observable.register_observer(CountingObserver())
+
+            def notify_all():
+                for idx in range(NOTIFY_EVENTS):
+                    observable.notify(idx)
+                observable.flush()
+            elapsed = best_of(repeat, notify_all)
+            mode = 'batched' if batch_size else 'single'
+            results[f'{mode}_{count}_observers_ns'] = elapsed / NOTIFY_EVENTS * 1e9
+    return results
+
+
+def bench_views(repeat):
+    """
+    Times appending text events to the terminal view and,
+    if there is a display, to the GUI one
+
+    :param repeat: the number of runs of each measure
+    :return: dict with the microseconds per event, None for the skipped views
+    """
+    from view.terminal import TerminalView
+
+    events = [f'/some/path/{idx}: {idx} files, 3 dirs, 4096 bytes' for idx in range(VIEW_EVENTS)]
+    results = {}
+
+    terminal = TerminalView(MockController(), argv=['.'], out=io.StringIO())
+    results['terminal_us'] = best_of(repeat, lambda: terminal.update_batch(events)) / VIEW_EVENTS * 1e6
+
+    results['gui_us'] = None
+    try:
+        from view.view import GuiView
+        gui = GuiView(MockController())
+    except Exception:
+        # No display, or no tkinter at all
+        return results
+
+    def append_gui():
+        gui.update_batch(events)
+        gui.update_idletasks()
+    results['gui_us'] = best_of(repeat, append_gui) / VIEW_EVENTS * 1e6
+    gui.root.destroy()
+    return results
+
+
+def compare(current, previous, tolerance):
+    """
+    Finds the timings which got slower than in a previous run
+
+    :param current: the results of this run
+    :param previous: the results of the previous run
+    :param tolerance: the relative slowdown allowed
+    :return: list of (name, previous, current) tuples
+    """
+    regressions = []
+    for group, values in current.items():
+        for key, value in values.items():
+            if isinstance(value, dict):
+                for metric, measure in value.items():
+                    old = previous.get(group, {}).get(key, {}).get(metric)
+                    if _slower(metric, old, measure, tolerance):
+                        regressions.append((f'{group}.{key}.{metric}', old, measure))
+            else:
+                old = previous.get(group, {}).get(key)
+                if _slower(key, old, value, tolerance):
+                    regressions.append((f'{group}.{key}', old, value))
+    return regressions
+
+
+def _slower(metric, old, new, tolerance):
+    if old is None or new is None or metric in ('files', 'dirs'):
+        return False
+    if metric.endswith('_per_s'):
+        return new < old * (1 - tolerance)
+    return new > old * (1 + tolerance)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.suite',
+                                     description='Benchmarks of the hot paths')
+    parser.add_argument('-o', '--output', help='JSON file where the results are saved')
+    parser.add_argument('-c', '--compare', help='JSON file of a previous run to compare with')
+    parser.add_argument('-t', '--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='relative slowdown reported as a regression')
+    parser.add_argument('-s', '--shapes', nargs='+', default=list(SHAPES), choices=list(SHAPES))
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('-a', '--agents', type=int, nargs='+', default=[],
+                        help='numbers of local agents to collect with, for example 1 2 4')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='mvc-bench-')
+    try:
+        results = {
+            'collection': bench_collection(workdir, args.shapes, args.workers, args.repeat),
+            'notify': bench_notify(args.repeat),
+            'views': bench_views(args.repeat),
+        }
+        if args.agents:
+            results['agents'] = bench_agents(workdir, args.shapes, args.agents,
+                                             args.workers, args.repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'date': dt.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'workers': args.workers,
+        'results': results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)['results']
+        regressions = compare(results, previous, args.tolerance)
+        for name, old, new in regressions:
+            print(f'Regression in {name}: {old:.4g} -> {new:.4g}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,46 @@
+"""
+Synthetic directory trees for the benchmarks
+"""
+
+import os
+from collections import namedtuple
+
+# depth: levels of directories below the root
+# fanout: subdirectories of each directory above the last level
+# files: files in each directory
+# size: bytes of each file
+TreeShape = namedtuple('TreeShape', 'depth fanout files size')
+
+SHAPES = {
+    # Few levels with many directories each
+    'wide': TreeShape(depth=2, fanout=30, files=50, size=1024),
+    # Long chains of directories with few files each
+    'deep': TreeShape(depth=10, fanout=2, files=10, size=4096),
+    # Many empty files, dominated by the cost of listing
+    'tiny': TreeShape(depth=3, fanout=10, files=50, size=0),
+}
+
+
+def build_tree(root, shape):
+    """
+    Creates a tree of the given shape
+
+    :param root: the folder where the tree is created
+    :param shape: the TreeShape
+    :return: (files, dirs, bytes) tuple of what the tree holds, without the root
+    """
+    content = b'x' * shape.size
+    files = dirs = 0
+    pending = [(root, 0)]
+    while pending:
+        path, level = pending.pop()
+        os.makedirs(path, exist_ok=True)
+        for idx in range(shape.files):
+            with open(os.path.join(path, f'file{idx:05}.dat'), 'wb') as f:
+                f.write(content)
+        files += shape.files
+        if level < shape.depth:
+            for idx in range(shape.fanout):
+                pending.append((os.path.join(path, f'dir{idx:03}'), level + 1))
+            dirs += shape.fanout
+    return files, dirs, files * shape.size
@@ -1 +1,2 @@
 MISSING_DEPENDENCIES_ERROR_CODE = -1
+STARTUP_BUDGET_EXCEEDED_ERROR_CODE = -2
@@ -1,21 +1,36 @@
+import builtins
 import importlib
 import importlib.util
 import sys
+import time
+
+from common.constants import STARTUP_BUDGET_EXCEEDED_ERROR_CODE
 
 PLEASE_INSTALL_MODULES = "Please install dependency modules by doing this(use pip or pip3):\n"
 
 already_imported = {}
+lazy_modules = {}
+
+# Timings of the imports done since enable_startup_timing, as
+# (module name, self seconds, cumulative seconds, nesting level) tuples
+import_times = []
+startup_timer = None
+
+_original_import = builtins.__import__
+_import_stack = []
 
 
-def check_import(dependency):
+def check_import(dependency, verbose=False):
     """
     Checks for the existence and availability of the dependency module
+    without importing it
 
     :param dependency: the name of the dependency module to check for
+    :param verbose: True for printing the result even if the module is available
     :return: True if the module is available, False otherwise
     """
     result = False
-    spec_not_found = (spec := importlib.util.find_spec(dependency)) is None
+    spec_not_found = importlib.util.find_spec(dependency) is None
 
     if spec_not_found:
         print(PLEASE_INSTALL_MODULES)
@@ -23,7 +38,8 @@ def check_import(dependency):
     else:
         result = True
 
-    print(f'Checking dependency {dependency}: {result}')
+    if verbose or not result:
+        print(f'Checking dependency {dependency}: {result}')
     return result
 
 
@@ -43,3 +59,136 @@ def do_import(dependency):
         already_imported[dependency] = result_module
 
     return result_module
+
+
+class LazyModule(object):
+    """
+    Proxy for a module which is only imported on the first
+    access to any of its attributes
+    """
+
+    def __init__(self, dependency, on_error=None):
+        """
+        Initializes this proxy, without importing anything
+
+        :param dependency: the name of the module
+        :param on_error: optional callable receiving the ModuleNotFoundError
+            raised if the module cannot be imported
+        """
+        self._lazy_name = dependency
+        self._lazy_on_error = on_error
+        self._lazy_module = None
+
+    def _load(self):
+        if self._lazy_module is None:
+            try:
+                self._lazy_module = do_import(self._lazy_name)
+            except ModuleNotFoundError as e:
+                if self._lazy_on_error is not None:
+                    self._lazy_on_error(e)
+                raise
+        return self._lazy_module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __repr__(self):
+        state = 'loaded' if self._lazy_module is not None else 'not loaded'
+        return f'<lazy module {self._lazy_name!r} ({state})>'
+
+
+def lazy_import(dependency, on_error=None):
+    """
+    Gets a proxy which imports the dependency module on first use
+
+    :param dependency: the name of the dependency module
+    :param on_error: optional callable receiving the ModuleNotFoundError
+        raised if the module cannot be imported
+    :return: the LazyModule
+    """
+    if dependency not in lazy_modules:
+        lazy_modules[dependency] = LazyModule(dependency, on_error)
+    return lazy_modules[dependency]
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+
+    start = time.perf_counter()
+    _import_stack.append(0.0)
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - start
+        children = _import_stack.pop()
+        if _import_stack:
+            _import_stack[-1] += elapsed
+        import_times.append((name, elapsed - children, elapsed, len(_import_stack)))
+
+
+class StartupTimer(object):
+    """
+    Measures the time until the first window is shown and
+    reports the cost of every import done until then
+    """
+
+    def __init__(self, budget, exit_after=False):
+        """
+        Initializes this timer
+
+        :param budget: the seconds allowed until the first window
+        :param exit_after: True for exiting once the first window is shown,
+            with an error code if the budget was exceeded
+        """
+        self.budget = budget
+        self.exit_after = exit_after
+        self.started = time.perf_counter()
+
+    def report(self, label):
+        """
+        Prints the import times and the elapsed time against the budget
+
+        :param label: the name of the point reached
+        :return: True if the budget was met, False otherwise
+        """
+        elapsed = time.perf_counter() - self.started
+        print(f'{"self [us]":>10} | {"cumulative":>10} | imported package')
+        for name, own, cumulative, level in import_times:
+            print(f'{own * 1e6:10.0f} | {cumulative * 1e6:10.0f} | {"  " * level}{name}')
+        within_budget = elapsed <= self.budget
+        verdict = 'OK' if within_budget else 'EXCEEDED'
+        print(f'Time to {label}: {elapsed * 1000:.0f} ms (budget {self.budget * 1000:.0f} ms) {verdict}')
+        return within_budget
+
+
+def enable_startup_timing(budget, exit_after=False):
+    """
+    Starts timing every import and the time until startup_checkpoint,
+    like python -X importtime does
+
+    :param budget: the seconds allowed until the first window
+    :param exit_after: True for exiting at the first checkpoint,
+        with an error code if the budget was exceeded
+    """
+    global startup_timer
+    startup_timer = StartupTimer(budget, exit_after)
+    builtins.__import__ = _timed_import
+
+
+def startup_checkpoint(label):
+    """
+    Reports the startup costs if startup timing is enabled, and stops
+    timing the imports. Does nothing otherwise
+
+    :param label: the name of the point reached
+    """
+    global startup_timer
+    if startup_timer is None:
+        return
+
+    builtins.__import__ = _original_import
+    timer, startup_timer = startup_timer, None
+    within_budget = timer.report(label)
+    if timer.exit_after:
+        sys.exit(0 if within_budget else STARTUP_BUDGET_EXCEEDED_ERROR_CODE)
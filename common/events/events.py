@@ -1,13 +1,69 @@
+from array import array
+
+
 class Event(object):
+    # Without a __dict__ the many events of a collection are smaller and faster to build
+    __slots__ = ('info',)
+
     def __init__(self, info):
         self.info = info
 
 
 class SetPathEvent(Event):
+    __slots__ = ()
+
     def __init__(self, info, *args, **kwargs):
         super().__init__(info)
 
 
 class EndTaskEvent(Event):
+    __slots__ = ()
+
+    def __init__(self, info):
+        super().__init__(info)
+
+
+class ProgressBatchEvent(Event):
+    """
+    Running totals of a collection after a batch of files is done. The
+    counters are a single array of integers instead of an object per value,
+    info is the path of the last subtree done
+    """
+    __slots__ = ('counters',)
+    FIELDS = ('subtrees', 'files', 'dirs', 'size')
+    FIELD_INDEX = {name: idx for idx, name in enumerate(FIELDS)}
+
+    def __init__(self, counters, path=None):
+        """
+        Initializes this event
+
+        :param counters: array('q') with a value for each name in FIELDS
+        :param path: the path of the last subtree done
+        """
+        super().__init__(path)
+        self.counters = counters
+
+    @staticmethod
+    def new_counters():
+        return array('q', bytes(8 * len(ProgressBatchEvent.FIELDS)))
+
+    def __getitem__(self, name):
+        return self.counters[ProgressBatchEvent.FIELD_INDEX[name]]
+
+
+class SamplesEvent(Event):
+    __slots__ = ()
+
+    def __init__(self, info):
+        super().__init__(info)
+
+
+class MetricsDeltaEvent(Event):
+    """
+    Change of the metrics of a watched root, info is a dict with the root,
+    the changed directories, the delta and the new totals
+    """
+    __slots__ = ()
+
     def __init__(self, info):
         super().__init__(info)
@@ -1,3 +1,8 @@
 class MvcError(Exception):
     def __init__(self, *messages):
         self.messages = messages
+
+
+class CollectionCancelled(MvcError):
+    def __init__(self, *messages):
+        super().__init__(*(messages or ('Collection cancelled',)))
@@ -0,0 +1,222 @@
+"""
+Optional timers and counters for the hot paths, enabled from main.py with
+--instrument or MVC_INSTRUMENT=1. While disabled nothing is wrapped and
+stage is a shared no-op context manager, so the cost is a global lookup
+"""
+
+import contextlib
+import functools
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+enabled = False
+# Path where the cProfile stats of each run are dumped, None for not profiling
+cprofile_path = None
+
+# Calls and seconds by timer name
+timers = defaultdict(lambda: [0, 0.0])
+counters = Counter()
+_lock = threading.Lock()
+_wrapped_classes = set()
+_NULL_STAGE = contextlib.nullcontext()
+
+
+def enable(profile_path=None):
+    """
+    Enables the instrumentation, wrapping the notifications of the observables
+
+    :param profile_path: optional path where the cProfile stats of each run are dumped
+    """
+    global enabled, cprofile_path
+    from common.observer import Observable, QueuedObserver
+
+    enabled = True
+    cprofile_path = profile_path
+    wrap_method(Observable, 'notify', counter='events')
+    # Includes the time the view takes to render the events it gets
+    wrap_method(QueuedObserver, 'drain')
+    _wrap_register(Observable)
+
+
+def reset():
+    with _lock:
+        timers.clear()
+        counters.clear()
+
+
+def add_time(name, seconds, calls=1):
+    with _lock:
+        timer = timers[name]
+        timer[0] += calls
+        timer[1] += seconds
+
+
+def count(name, amount=1):
+    with _lock:
+        counters[name] += amount
+
+
+class Stage(object):
+    """
+    Context manager timing a stage of a run
+    """
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        add_time(f'stage {self.name}', time.perf_counter() - self.started)
+        return False
+
+
+def stage(name):
+    """
+    Times a stage of a run, when the instrumentation is enabled
+
+    :param name: the name of the stage
+    :return: the context manager
+    """
+    return Stage(name) if enabled else _NULL_STAGE
+
+
+def wrap_method(cls, attr, name=None, counter=None):
+    """
+    Replaces a method of a class with one timing its calls
+
+    :param cls: the class
+    :param attr: the name of the method
+    :param name: the name of the timer, 'Class.method' by default
+    :param counter: optional counter increased on every call
+    """
+    func = cls.__dict__[attr]
+    if getattr(func, 'instrumented', False):
+        return
+    name = name or f'{cls.__name__}.{attr}'
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            add_time(name, time.perf_counter() - started)
+            if counter is not None:
+                count(counter)
+    wrapper.instrumented = True
+    setattr(cls, attr, wrapper)
+
+
+def _wrap_register(observable_cls):
+    """
+    Wraps register_observer so that the update methods of the class
+    of every observer are timed from then on
+    """
+    register = observable_cls.register_observer
+
+    @functools.wraps(register)
+    def wrapper(self, observer):
+        cls = type(observer)
+        if cls not in _wrapped_classes:
+            _wrapped_classes.add(cls)
+            for attr in ('update', 'update_batch'):
+                owner = next((c for c in cls.__mro__ if attr in c.__dict__), None)
+                if owner is not None and owner.__module__ != 'abc':
+                    wrap_method(owner, attr, name=f'{cls.__name__}.{attr}')
+        return register(self, observer)
+    observable_cls.register_observer = wrapper
+
+
+def wrap_run(cls, attr):
+    """
+    Replaces the method running a whole collection of an Observable class
+    with one which resets the stats, profiles the run if requested and
+    notifies the summary table at the end
+
+    :param cls: the Observable class
+    :param attr: the name of the method
+    """
+    func = cls.__dict__[attr]
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        reset()
+        usage = _usage()
+        profiler = None
+        if cprofile_path is not None:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        started = time.perf_counter()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(cprofile_path)
+            add_time(f'{cls.__name__}.{attr}', elapsed)
+            for key, value in _usage().items():
+                count(key, value - usage.get(key, value))
+            self.notify(summary())
+            if profiler is not None:
+                self.notify(f'cProfile stats saved to {cprofile_path}')
+            self.flush()
+    setattr(cls, attr, wrapper)
+
+
+def _usage():
+    """
+    Gets the resource usage of this process and its finished children, which
+    include the scan workers once their pool is shut down. The read syscalls
+    and bytes are the ones of this process, only where the OS counts them
+
+    :return: dict of counters, empty where there is no resource module
+    """
+    try:
+        import resource
+    except ModuleNotFoundError:
+        return {}
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    usage = {
+        'cpu user s': own.ru_utime + children.ru_utime,
+        'cpu system s': own.ru_stime + children.ru_stime,
+        'block reads': own.ru_inblock + children.ru_inblock,
+        'block writes': own.ru_oublock + children.ru_oublock,
+        'context switches': own.ru_nvcsw + own.ru_nivcsw + children.ru_nvcsw + children.ru_nivcsw,
+    }
+    try:
+        with open(f'/proc/{os.getpid()}/io') as f:
+            io = dict(line.split(': ') for line in f.read().splitlines())
+        usage['read syscalls'] = int(io['syscr'])
+        usage['bytes read'] = int(io['rchar'])
+    except (OSError, KeyError, ValueError):
+        pass
+    return usage
+
+
+def summary():
+    """
+    Formats the timers and counters as a table
+
+    :return: the table, one line per row
+    """
+    with _lock:
+        rows = sorted(timers.items(), key=lambda item: item[1][1], reverse=True)
+        lines = [f'{"timer":<40} {"calls":>10} {"total ms":>12} {"per call us":>12}']
+        for name, (calls, seconds) in rows:
+            lines.append(f'{name:<40} {calls:>10} {seconds * 1000:>12.1f} '
+                         f'{seconds / max(calls, 1) * 1e6:>12.1f}')
+        lines.append(f'{"counter":<40} {"value":>10}')
+        for name, value in sorted(counters.items()):
+            value = f'{value:.2f}' if isinstance(value, float) else value
+            lines.append(f'{name:<40} {value:>10}')
+    return '\n'.join(lines)
@@ -1,9 +1,33 @@
+import asyncio
+import inspect
+import queue
+import threading
+import time
+from collections import deque
 from abc import ABC, abstractmethod
 
 
+_NOT_RESOLVED = object()
+
+
 class Observable(ABC):
-    def __init__(self):
+    def __init__(self, batch_size=None, batch_interval=None):
+        """
+        Initializes this observable. When any threshold is given, the
+        notified values are buffered and the observers get them as a
+        list through update_batch once a threshold is reached
+
+        :param batch_size: number of values which flushes the buffer
+        :param batch_interval: seconds since the first buffered value
+            which flush the buffer on the next notify or flush_expired
+        """
         self.__observers = []
+        self.__batch = []
+        self.__batch_started = 0.0
+        self.__batch_lock = threading.Lock()
+        self.__deliver_lock = threading.Lock()
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
 
     def register_observer(self, observer):
         self.__observers.append(observer)
@@ -13,11 +37,349 @@ class Observable(ABC):
             self.__observers.remove(observer)
 
     def notify(self, value):
+        if self.batch_size is None and self.batch_interval is None:
+            for o in self.__observers:
+                o.update(value)
+            return
+
+        with self.__batch_lock:
+            if not self.__batch:
+                self.__batch_started = time.monotonic()
+            self.__batch.append(value)
+            if not self._batch_full():
+                return
+        self.__deliver()
+
+    def flush(self):
+        """
+        Delivers the buffered values, if any. Values notified after the
+        last one which reached a threshold wait here until flushed
+        """
+        self.__deliver()
+
+    def flush_expired(self):
+        """
+        Delivers the buffered values if batch_interval has passed since
+        the first one, without waiting for the next notify. Meant to be
+        called by the consumers on every pump, so a burst followed by
+        silence does not wait for the end of the collection
+        """
+        with self.__batch_lock:
+            expired = self.batch_interval is not None and self.__batch \
+                and time.monotonic() - self.__batch_started >= self.batch_interval
+        # Whoever is delivering already takes the buffered values
+        if expired:
+            self.__deliver(blocking=False)
+
+    def __deliver(self, blocking=True):
+        # Taking the buffer and delivering it under the same lock keeps
+        # the batches of different threads in notification order
+        if not self.__deliver_lock.acquire(blocking):
+            return
+        try:
+            with self.__batch_lock:
+                batch, self.__batch = self.__batch, []
+            if batch:
+                self.__notify_batch(batch)
+        finally:
+            self.__deliver_lock.release()
+
+    def _batch_full(self):
+        if self.batch_size is not None and len(self.__batch) >= self.batch_size:
+            return True
+        return self.batch_interval is not None \
+            and time.monotonic() - self.__batch_started >= self.batch_interval
+
+    def __notify_batch(self, batch):
         for o in self.__observers:
-            o.update(value)
+            o.update_batch(batch)
 
 
 class Observer(ABC):
+    # Handlers of the notified values by type, see dispatch
+    handlers = None
+
     @abstractmethod
     def update(self, value):
         pass
+
+    def dispatch(self, value):
+        """
+        Calls the handler in self.handlers for the type of the value. The
+        handlers of the base classes are only looked up the first time a
+        type is seen, later values of that type take a single dict lookup
+
+        :param value: the notified value
+        :return: what the handler returns, None if there is no handler
+        """
+        handler = self.handlers.get(type(value), _NOT_RESOLVED)
+        if handler is _NOT_RESOLVED:
+            handler = next((self.handlers[t] for t in type(value).__mro__
+                            if t in self.handlers), None)
+            self.handlers[type(value)] = handler
+        return handler(value) if handler is not None else None
+
+    def update_batch(self, values):
+        """
+        Receives several values at once. Observers which can render
+        them in a single operation should override this
+
+        :param values: the list of values, in notification order
+        """
+        for value in values:
+            self.update(value)
+
+
+class QueuedObserver(Observer):
+    """
+    Observer which can be notified from any thread. The values are
+    queued and delivered as a single batch to the target observer by
+    whichever thread calls drain, usually the GUI one
+    """
+
+    def __init__(self, target):
+        """
+        Initializes this observer
+
+        :param target: the observer the values are delivered to
+        """
+        self.target = target
+        self.queue = queue.SimpleQueue()
+
+    def update(self, value):
+        self.queue.put([value])
+
+    def update_batch(self, values):
+        self.queue.put(values)
+
+    def drain(self, max_values=None):
+        """
+        Delivers the queued values to the target observer with
+        a single call to its update_batch
+
+        :param max_values: number of values after which no more batches
+            are taken from the queue, all by default
+        :return: the number of values delivered
+        """
+        batch = []
+        while max_values is None or len(batch) < max_values:
+            try:
+                batch.extend(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self.target.update_batch(batch)
+        return len(batch)
+
+
+class Subscription(object):
+    """
+    An observer of an AsyncObserverBus with its own bounded buffer. The
+    policy is applied by the producers, which wake the loop once per batch
+    """
+    # When the buffer is full the producer waits for the observer
+    BLOCK = 'block'
+    # When the buffer is full the oldest values are dropped
+    DROP_OLDEST = 'drop_oldest'
+
+    def __init__(self, observer, maxsize, policy, types):
+        if policy not in (Subscription.BLOCK, Subscription.DROP_OLDEST):
+            raise ValueError(f'Unknown policy: {policy}')
+        self.observer = observer
+        self.maxsize = maxsize
+        self.policy = policy
+        self.types = types
+        self.buffer = deque(maxlen=maxsize if policy == Subscription.DROP_OLDEST else None)
+        self.condition = threading.Condition()
+        # Set by the loop when there are values, and whether a producer already asked for it
+        self.ready = asyncio.Event()
+        self.wake_pending = False
+        self.dropped = 0
+        self.closed = False
+        self.task = None
+
+    def accepts(self, value):
+        return self.types is None or isinstance(value, self.types)
+
+    def put(self, values, wait, wake):
+        """
+        Buffers values, in the producer thread
+
+        :param values: the values
+        :param wait: False in the thread running the loop, which never
+            waits for room since it is the one which makes it
+        :param wake: callable receiving this subscription when the loop
+            has to be woken up
+        """
+        with self.condition:
+            if self.policy == Subscription.DROP_OLDEST:
+                self.dropped += max(0, len(self.buffer) + len(values) - self.maxsize)
+                self.buffer.extend(values)
+            else:
+                start = 0
+                while start < len(values):
+                    room = self.maxsize - len(self.buffer)
+                    if not wait or self.closed:
+                        room = len(values)
+                    elif room <= 0:
+                        self._wake(wake)
+                        self.condition.wait()
+                        continue
+                    self.buffer.extend(values[start:start + room])
+                    start += room
+            self._wake(wake)
+
+    def _wake(self, wake):
+        if not self.wake_pending:
+            self.wake_pending = True
+            wake(self)
+
+    def close(self):
+        """
+        Releases the producers waiting for room
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    async def consume(self):
+        """
+        Delivers the buffered values to the observer, all the ones
+        available at once, until the subscription is cancelled
+        """
+        deliver = getattr(self.observer, 'update_batch', self.observer)
+        while True:
+            await self.ready.wait()
+            with self.condition:
+                self.ready.clear()
+                self.wake_pending = False
+                batch = list(self.buffer)
+                self.buffer.clear()
+                self.condition.notify_all()
+            if batch:
+                result = deliver(batch)
+                if inspect.isawaitable(result):
+                    await result
+
+
+class AsyncObserverBus(Observer):
+    """
+    Observer which fans the values out to subscribers running in an asyncio
+    event loop, each one with its own bounded buffer, so that a slow subscriber
+    does not stall the producer nor the other subscribers.
+
+    The loop runs in its own thread, or in the thread which calls step, like
+    the Tk one, so that subscribers can use the widgets of that thread
+    """
+    # Iterations of the loop run by each step
+    STEP_ITERATIONS = 3
+
+    def __init__(self, threaded=False):
+        """
+        Initializes this bus
+
+        :param threaded: True for running the loop in a thread of its own,
+            False for running it only while step is called, by default in
+            the thread creating the bus
+        """
+        self.loop = asyncio.new_event_loop()
+        self.subscriptions = []
+        self.loop_thread = None
+        # The thread running the loop, producers in any other one wait for room
+        self.runner = threading.current_thread()
+        if threaded:
+            started = threading.Event()
+            self.loop_thread = threading.Thread(target=self._run, args=(started,),
+                                                name='observer-bus', daemon=True)
+            self.runner = self.loop_thread
+            self.loop_thread.start()
+            started.wait()
+
+    def _run(self, started):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(started.set)
+        self.loop.run_forever()
+
+    def subscribe(self, observer, maxsize=1024, policy=Subscription.BLOCK, types=None):
+        """
+        Subscribes an observer, called in the thread of the loop
+
+        :param observer: an Observer, whose update_batch may be a coroutine
+            function, or a function or coroutine function receiving a list of values
+        :param maxsize: the number of values buffered for the observer
+        :param policy: Subscription.BLOCK or Subscription.DROP_OLDEST, for
+            when the buffer is full
+        :param types: the types of the values the observer gets, all by default
+        :return: the Subscription
+        """
+        subscription = Subscription(observer, maxsize, policy, types)
+        self.subscriptions.append(subscription)
+
+        def start():
+            subscription.task = self.loop.create_task(subscription.consume())
+        self._call_in_loop(start)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        if subscription in self.subscriptions:
+            self.subscriptions.remove(subscription)
+            subscription.close()
+            self._call_in_loop(lambda: subscription.task.cancel())
+
+    def _call_in_loop(self, callback, *args):
+        if threading.current_thread() is self.runner:
+            self.loop.call_soon(callback, *args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def _wake(self, subscription):
+        self._call_in_loop(subscription.ready.set)
+
+    def update(self, value):
+        self.update_batch([value])
+
+    def update_batch(self, values):
+        """
+        Buffers the values for every subscriber, from any thread. With the
+        BLOCK policy this waits while the buffer of that subscriber is full,
+        unless it is called from the thread running the loop
+        """
+        wait = threading.current_thread() is not self.runner
+        for subscription in self.subscriptions:
+            accepted = [v for v in values if subscription.accepts(v)]
+            if accepted:
+                subscription.put(accepted, wait, self._wake)
+
+    def step(self):
+        """
+        Runs the callbacks and subscribers which are ready, in the calling
+        thread. Used when the bus is not threaded, on every turn of the GUI loop
+        """
+        if self.loop_thread is None:
+            self.runner = threading.current_thread()
+        # A value buffered in one iteration reaches its subscriber in the next one
+        for __ in range(AsyncObserverBus.STEP_ITERATIONS):
+            self.loop.call_soon(self.loop.stop)
+            self.loop.run_forever()
+
+    def close(self):
+        """
+        Cancels the subscribers and stops the loop
+        """
+        subscriptions, self.subscriptions = self.subscriptions, []
+        for subscription in subscriptions:
+            subscription.close()
+
+        async def cancel_all():
+            tasks = [s.task for s in subscriptions if s.task is not None]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if self.loop_thread is not None:
+            asyncio.run_coroutine_threadsafe(cancel_all(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop_thread.join()
+        else:
+            self.loop.run_until_complete(cancel_all())
+        self.loop.close()
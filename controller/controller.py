@@ -1,23 +1,172 @@
+import threading
+
+from common.observer import AsyncObserverBus, QueuedObserver, Subscription
 from model.model import Model
+from model.profiles import PROFILES
 
 
 class Controller(object):
-    def __init__(self, model: Model, class_view):
+    # Maximum number of model events delivered to the view on each pump
+    MAX_EVENTS_PER_PUMP = 500
+
+    def __init__(self, model: Model, class_view, agents=None):
+        """
+        Initializes this controller
+
+        :param model: the model
+        :param class_view: the class of the view, built with this controller
+        :param agents: the 'host:port' addresses of the agents which
+            collect the metrics, None for collecting in this host
+        """
         self.model = model
+        self.agents = agents or None
+        self.worker = None
+        # Subscribers with their own bounded queues, run by process_events
+        # in the thread of the view, so a slow one does not stall the model
+        self.bus = AsyncObserverBus()
+        self.model.register_observer(self.bus)
         self.view = class_view(self)
 
-        self.model.register_observer(self.view)
+        # The model notifies from the worker thread, the view drains
+        # the queue from its own thread by calling process_events
+        self.events = QueuedObserver(self.view)
+        self.model.register_observer(self.events)
 
     @staticmethod
     def get_combo_options():
         """
         Returns options for the combo box in the GUI
-        :return:
+        :return: the names of the collection profiles
         """
-        return 'option1', 'option2', 'option3', 'option4'
+        return tuple(PROFILES)
+
+    @staticmethod
+    def get_query_options():
+        """
+        Returns options for the query combo box in the GUI
+        :return: the names of the queries
+        """
+        from model.query import QUERIES
+        return QUERIES
 
     def start(self):
         self.view.start()
+        self.bus.close()
+
+    def is_collecting(self):
+        """
+        Tells whether a collection is running
+
+        :return: True if the worker thread is alive, False otherwise
+        """
+        return self.worker is not None and self.worker.is_alive()
+
+    def collect_metrics(self, destiny_path, paths, selected_profile=None):
+        """
+        Collects the metrics of paths in a worker thread saving the
+        result in destiny_path. The results reach the view through
+        process_events
+
+        :param destiny_path: the folder where the result is saved
+        :param paths: the paths to collect metrics from
+        :param selected_profile: the profile selected in the view
+        :return: True if the collection started, False if one was running
+        """
+        return self._start_worker(self.model.collect_metrics, 'collect-metrics',
+                                  destiny_path, list(paths), profile=selected_profile,
+                                  agents=self.agents)
+
+    def watch_metrics(self, destiny_path, paths, selected_profile=None):
+        """
+        Collects the metrics of paths like collect_metrics and keeps them
+        up to date in the worker thread until the collection is cancelled
+
+        :param destiny_path: the folder where the result is saved
+        :param paths: the paths to collect metrics from
+        :param selected_profile: the profile selected in the view
+        :return: True if the collection started, False if one was running
+        """
+        return self._start_worker(self.model.watch_metrics, 'watch-metrics',
+                                  destiny_path, list(paths), profile=selected_profile)
+
+    def query_metrics(self, destiny_path, query, cutoff=None):
+        """
+        Answers a query over the file records of the last collection
+        saved in destiny_path, in the worker thread
+
+        :param destiny_path: the folder where the collection was saved
+        :param query: one of model.query.QUERIES
+        :param cutoff: the datetime of the older_than query
+        :return: True if the query started, False if a task was running
+        """
+        return self._start_worker(self.model.query_metrics, 'query-metrics',
+                                  destiny_path, query, cutoff=cutoff)
+
+    def create_layouts(self, projects_path, template_path, projects, prefix='', suffix='',
+                       when=None, hardlink_seeds=False):
+        """
+        Creates the folder layout of a template for several projects in a
+        worker thread. The results reach the view through process_events
+
+        :param projects_path: the folder where the layouts are created
+        :param template_path: the template file
+        :param projects: the project codes, without prefix and suffix
+        :param prefix: the prefix of every project code
+        :param suffix: the suffix of every project code
+        :param when: the datetime of the placeholders, now by default
+        :param hardlink_seeds: True for sharing the seed files of the
+            template between the projects as hard links
+        :return: True if the creation started, False if a task was running
+        """
+        return self._start_worker(self.model.create_layouts, 'create-layouts',
+                                  projects_path, template_path, list(projects),
+                                  prefix=prefix, suffix=suffix, when=when,
+                                  hardlink_seeds=hardlink_seeds)
+
+    def _start_worker(self, target, name, *args, **kwargs):
+        """
+        Runs a model task in the worker thread, unless one is running
+
+        :return: True if the task started, False otherwise
+        """
+        if self.is_collecting():
+            return False
 
-    def collect_metrics(self, *args, **kwargs):
-        pass
+        self.worker = threading.Thread(target=target, args=args, kwargs=kwargs,
+                                       name=name, daemon=True)
+        self.worker.start()
+        return True
+
+    def cancel_collection(self):
+        """
+        Cancels the running collection, if any
+        """
+        if self.is_collecting():
+            self.model.cancel_collection()
+
+    def subscribe(self, observer, maxsize=1024, policy=Subscription.BLOCK, types=None):
+        """
+        Subscribes an observer of the model events which is called
+        in the thread of the view with its own bounded queue
+
+        :param observer: an Observer or a function or coroutine function
+            receiving a list of events
+        :param maxsize: the number of events queued for the observer
+        :param policy: Subscription.BLOCK for making the model wait when the
+            queue is full, Subscription.DROP_OLDEST for dropping events
+        :param types: the types of the events the observer gets, all by default
+        :return: the Subscription
+        """
+        return self.bus.subscribe(observer, maxsize, policy, types)
+
+    def process_events(self, max_events=MAX_EVENTS_PER_PUMP):
+        """
+        Delivers the pending model events to the view and the
+        subscribers in the calling thread
+
+        :param max_events: maximum number of events delivered to the view
+        :return: the number of events delivered to the view
+        """
+        self.model.flush_expired()
+        self.bus.step()
+        return self.events.drain(max_events)
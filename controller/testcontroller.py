@@ -6,5 +6,27 @@ class MockController(object):
     def get_combo_options():
         return 'fake1', 'fake2', 'fake3', 'fake4'
 
+    @staticmethod
+    def get_query_options():
+        return 'fake1', 'fake2'
+
     def collect_metrics(self, *args, **kwargs):
-        pass
\ No newline at end of file
+        pass
+
+    def watch_metrics(self, *args, **kwargs):
+        pass
+
+    def query_metrics(self, *args, **kwargs):
+        pass
+
+    def create_layouts(self, *args, **kwargs):
+        pass
+
+    def cancel_collection(self):
+        pass
+
+    def subscribe(self, *args, **kwargs):
+        pass
+
+    def process_events(self, *args, **kwargs):
+        return 0
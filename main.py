@@ -1,39 +1,85 @@
+import os
 import sys
 
+from common import deputils
 from common.constants import MISSING_DEPENDENCIES_ERROR_CODE
-from common.deputils import check_import, do_import
+
+# Milliseconds allowed until the first window is shown. With --importtime the
+# cost of every import is reported, with --startup-check we also exit there
+STARTUP_BUDGET_MS = int(os.environ.get('MVC_STARTUP_BUDGET_MS', 1000))
+
+if '--importtime' in sys.argv or '--startup-check' in sys.argv:
+    deputils.enable_startup_timing(STARTUP_BUDGET_MS / 1000,
+                                   exit_after='--startup-check' in sys.argv)
+
+# With --instrument or MVC_INSTRUMENT=1 the hot paths are timed and a summary
+# is shown at the end of each collection, --cprofile=<file> or
+# MVC_CPROFILE=<file> also dump the cProfile stats of the collection there
+CPROFILE_PATH = os.environ.get('MVC_CPROFILE')
+INSTRUMENT = os.environ.get('MVC_INSTRUMENT', '') not in ('', '0') or CPROFILE_PATH is not None
+# With --agents=<host:port>,... or MVC_AGENTS the roots are collected by
+# the agents run with 'main.py agent' on those hosts
+AGENTS = [a for a in os.environ.get('MVC_AGENTS', '').split(',') if a]
+# With --max-iops=<n> or MVC_MAX_IOPS the local collections state at most n
+# entries per second, and with --max-bandwidth=<bytes> or MVC_MAX_BANDWIDTH
+# the hashing profiles and the search of duplicates read at most those bytes
+# per second
+MAX_IOPS = int(os.environ.get('MVC_MAX_IOPS') or 0) or None
+MAX_BANDWIDTH = int(os.environ.get('MVC_MAX_BANDWIDTH') or 0) or None
+for arg in list(sys.argv[1:]):
+    if arg == '--instrument':
+        INSTRUMENT = True
+    elif arg.startswith('--cprofile='):
+        INSTRUMENT = True
+        CPROFILE_PATH = arg.split('=', 1)[1]
+    elif arg.startswith('--agents='):
+        AGENTS = [a for a in arg.split('=', 1)[1].split(',') if a]
+    elif arg.startswith('--max-iops='):
+        MAX_IOPS = int(arg.split('=', 1)[1]) or None
+    elif arg.startswith('--max-bandwidth='):
+        MAX_BANDWIDTH = int(arg.split('=', 1)[1]) or None
+    elif arg not in ('--importtime', '--startup-check'):
+        continue
+    sys.argv.remove(arg)
+
+from common import instrumentation
+from common.deputils import check_import
 from controller.controller import Controller
 from model.model import Model
 
-PLEASE_INSTALL_MODULES = "Please install dependency modules by doing this(use pip or pip3):\n"
+if INSTRUMENT:
+    instrumentation.enable(CPROFILE_PATH)
+    instrumentation.wrap_method(Controller, 'collect_metrics')
+    instrumentation.wrap_run(Model, 'collect_metrics')
 
-dependencies = ['tkfilebrowser', 'tkcalendar']
+# The terminal view and the agents run on servers without a display,
+# so neither tkinter nor the GUI dependencies are loaded for them
+AGENT_MODE = sys.argv[1:2] == ['agent']
+TEXT_MODE = 'text' in sys.argv or AGENT_MODE
 
-warning = not all([check_import(dep) for dep in dependencies])
+dependencies = ['tkfilebrowser', 'tkcalendar', 'psutil']
 
-if warning:
-    sys.exit(MISSING_DEPENDENCIES_ERROR_CODE)
+if TEXT_MODE:
+    from view.terminal import TerminalView
+else:
+    # Only looks for the dependencies, they are imported the first time they are used
+    warning = not all([check_import(dep) for dep in dependencies])
 
-from view.view import GuiView
+    if warning:
+        sys.exit(MISSING_DEPENDENCIES_ERROR_CODE)
 
-try:
-    for i in range(len(dependencies)):
-        d = dependencies[i]
-        do_import(d)
-except ModuleNotFoundError as e:
-    print(PLEASE_INSTALL_MODULES)
-    if e.name == 'win32com':
-        print(f"C:\> pip install pywin32")
-        print(f"$ pip install pywin32")
-    else:
-        print(f"C:\> pip install {d}")
-        print(f"$ pip install {d}")
-    sys.exit(0)
-
-if __name__ == '__main__':
-    model = Model()
-    if 'text' in sys.argv:
-        controller = Controller(model, TerminalView)
+    from view.view import GuiView
+
+if __name__ == '__main__' and AGENT_MODE:
+    from model import agent
+    agent.main(sys.argv[2:])
+elif __name__ == '__main__':
+    # Only the GUI charts the usage of the system while collecting
+    model = Model(batch_size=256, batch_interval=0.05,
+                  sample_interval=None if TEXT_MODE else 1.0,
+                  max_iops=MAX_IOPS, max_bandwidth=MAX_BANDWIDTH)
+    if TEXT_MODE:
+        controller = Controller(model, TerminalView, agents=AGENTS)
     else:
-        controller = Controller(model, GuiView)
+        controller = Controller(model, GuiView, agents=AGENTS)
     controller.start()
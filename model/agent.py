@@ -0,0 +1,346 @@
+"""
+Module for collecting metrics on several hosts. An agent is this same
+code run headless on a file server:
+
+    MVC_AGENT_KEY=secret python main.py agent --listen 0.0.0.0:7400
+
+and the model of the controlling host spreads the roots of a collection
+over the agents, round robin, merging what they stream back into a single
+output. The roots are paths on the agents, so they must be absolute.
+
+The protocol runs over multiprocessing connections, authenticated with
+the shared key. Each connection does a single collection:
+
+    -> ('collect', roots, profile, incremental)
+    <- ('progress', root index, path, metrics JSON)   for each subtree done
+    <- ('records', zlib compressed JSON lines)        every BATCH_LINES records
+    <- ('done', [metrics JSON of each root])
+    <- ('error', message) or ('cancelled',)           instead of done
+    -> ('cancel',)                                    at any moment
+
+The messages are pickled, so every host needs the key, loopback ones
+included: the controlling host takes it from MVC_AGENT_KEY, and an agent
+started without it generates a random one and prints it
+"""
+
+import argparse
+import os
+import queue
+import secrets
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener, answer_challenge, deliver_challenge
+
+from common.exceptions.exceptions import CollectionCancelled, MvcError
+from model.index import MetricsIndex
+from model.profiles import compile_profile
+from model.scanner import CANCEL_POLL_INTERVAL, Metrics, scan_roots
+
+AUTHKEY_ENV = 'MVC_AGENT_KEY'
+DEFAULT_PORT = 7400
+# Records sent together, and seconds after which a partial batch is sent anyway
+BATCH_LINES = 4096
+BATCH_INTERVAL = 0.5
+COMPRESSION_LEVEL = 1
+# Seconds a new connection has for authenticating and sending its command
+HANDSHAKE_TIMEOUT = 10
+
+
+def parse_address(address):
+    """
+    Parses a 'host:port' address, the port is DEFAULT_PORT if missing
+
+    :param address: the address
+    :return: (host, port) tuple
+    """
+    host, __, port = address.rpartition(':') if ':' in address else (address, None, '')
+    return host.strip('[]') or 'localhost', int(port or DEFAULT_PORT)
+
+
+def get_authkey():
+    """
+    Gets the key shared by the agents and the controlling host
+
+    :raise: MvcError if there is no key
+    :return: the key
+    """
+    key = os.environ.get(AUTHKEY_ENV)
+    if not key:
+        raise MvcError(f'Set {AUTHKEY_ENV} to the key of the agents')
+    return key.encode('utf-8')
+
+
+def set_recv_timeout(conn, timeout):
+    """
+    Makes the reads of a connection fail with an OSError after some time
+    without data, multiprocessing connections have no timeout of their own
+
+    :param conn: the socket connection
+    :param timeout: the seconds, 0 for waiting forever
+    """
+    if sys.platform == 'win32':
+        value = struct.pack('L', int(timeout * 1000))
+    else:
+        value = struct.pack('ll', int(timeout), int(timeout % 1 * 1000000))
+    # The duplicate shares the socket, and the option, with the connection
+    with socket.socket(fileno=os.dup(conn.fileno())) as sock:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, value)
+
+
+class Agent(object):
+    """
+    Serves collections to the controlling hosts, one thread per connection
+    """
+
+    def __init__(self, address, authkey, workers=None, index_dir=None, iops=None, bandwidth=None):
+        """
+        Initializes this agent
+
+        :param address: the 'host:port' address to listen at
+        :param authkey: the key the controlling hosts must know, as bytes
+        :param workers: number of worker processes of each collection
+        :param index_dir: folder for the indexes of the incremental
+            collections, None for scanning everything every time
+        :param iops: optional cap of the entries stated per second by each collection
+        :param bandwidth: optional cap of the bytes read per second by each collection
+        """
+        host, port = parse_address(address)
+        # The connections are authenticated in their own threads, so
+        # that a client which never answers does not block the others
+        self.listener = Listener((host, port))
+        self.authkey = authkey
+        self.workers = workers
+        self.index_dir = index_dir
+        self.iops = iops
+        self.bandwidth = bandwidth
+        self.closed = False
+
+    @property
+    def address(self):
+        return self.listener.address
+
+    def serve_forever(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                # The listener was closed
+                if self.closed:
+                    return
+                continue
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def close(self):
+        self.closed = True
+        self.listener.close()
+
+    def handle(self, conn):
+        """
+        Runs the collection requested through a connection
+
+        :param conn: the connection
+        """
+        cancel = threading.Event()
+        with conn:
+            try:
+                set_recv_timeout(conn, HANDSHAKE_TIMEOUT)
+                deliver_challenge(conn, self.authkey)
+                answer_challenge(conn, self.authkey)
+                command, roots, profile, incremental = conn.recv()
+                set_recv_timeout(conn, 0)
+            except (EOFError, OSError, ValueError, AuthenticationError):
+                # A client which failed the authentication or stayed silent
+                return
+            if command != 'collect':
+                self._send(conn, ('error', f'Unknown command: {command}'))
+                return
+            try:
+                visitor = compile_profile(profile)
+            except KeyError:
+                self._send(conn, ('error', f'Unknown profile: {profile}'))
+                return
+            threading.Thread(target=self._wait_cancel, args=(conn, cancel), daemon=True).start()
+            batch = []
+            last_send = [time.monotonic()]
+
+            def send_records():
+                if batch:
+                    conn.send(('records', zlib.compress('\n'.join(batch).encode('utf-8'),
+                                                         COMPRESSION_LEVEL)))
+                    batch.clear()
+                last_send[0] = time.monotonic()
+
+            def emit(line):
+                batch.append(line)
+                if len(batch) >= BATCH_LINES or time.monotonic() - last_send[0] >= BATCH_INTERVAL:
+                    send_records()
+
+            def progress(idx, path, metrics):
+                conn.send(('progress', idx, path, metrics.to_json()))
+
+            index = None
+            try:
+                missing = [root for root in roots if not os.path.isdir(root)]
+                if missing:
+                    raise MvcError(f'Not a directory: {missing[0]}')
+                if self.index_dir is not None and incremental and not visitor.hashing:
+                    index = MetricsIndex(os.path.join(self.index_dir,
+                                                      MetricsIndex.FILE_NAME.format(profile=visitor.name)))
+                with tempfile.TemporaryDirectory(prefix='.agent-') as parts_dir:
+                    per_root = scan_roots(roots, workers=self.workers, index=index, progress=progress,
+                                          emit=emit, parts_dir=parts_dir, cancel=cancel,
+                                          profile=visitor.name, iops=self.iops,
+                                          bandwidth=self.bandwidth)
+                send_records()
+                conn.send(('done', [metrics.to_json() for metrics in per_root]))
+            except CollectionCancelled:
+                self._send(conn, ('cancelled',))
+            except MvcError as e:
+                self._send(conn, ('error', e.messages[0]))
+            except Exception as e:
+                self._send(conn, ('error', f'{type(e).__name__}: {e}'))
+            finally:
+                if index is not None:
+                    index.close()
+
+    @staticmethod
+    def _wait_cancel(conn, cancel):
+        """
+        Cancels the collection when the controlling host asks for it or goes away
+        """
+        try:
+            while conn.recv() != ('cancel',):
+                pass
+        except (EOFError, OSError):
+            pass
+        cancel.set()
+
+    @staticmethod
+    def _send(conn, message):
+        try:
+            conn.send(message)
+        except OSError:
+            pass
+
+
+def _stream(address, roots, profile, incremental, messages, clients, stop):
+    """
+    Runs a collection on an agent, putting what it sends in a queue
+    """
+    try:
+        host, port = parse_address(address)
+        with Client((host, port), authkey=get_authkey()) as conn:
+            clients.append(conn)
+            if stop.is_set():
+                return
+            conn.send(('collect', roots, profile, incremental))
+            while True:
+                message = conn.recv()
+                messages.put((address, message))
+                if message[0] in ('done', 'error', 'cancelled'):
+                    return
+    except MvcError as e:
+        messages.put((address, ('error', e.messages[0])))
+    except AuthenticationError:
+        messages.put((address, ('error', f'wrong key, set {AUTHKEY_ENV} to the key of the agent')))
+    except (OSError, EOFError) as e:
+        messages.put((address, ('error', getattr(e, 'strerror', None) or str(e) or 'connection lost')))
+
+
+def scan_agents(roots, agents, profile=None, incremental=True, progress=None,
+                emit=None, cancel=None):
+    """
+    Computes the metrics of several directory trees on the agents, spreading
+    the roots round robin, like scan_roots does with its workers
+
+    :param roots: the absolute root paths, in the agents
+    :param agents: the 'host:port' addresses of the agents
+    :param profile: the name of the profile
+    :param incremental: False for making the agents scan everything
+    :param progress: optional callable receiving (root index, path, metrics)
+        as each subtree is done
+    :param emit: optional callable receiving the JSON line of every record
+    :param cancel: optional event for cancelling the collection
+    :raise: MvcError if an agent fails, CollectionCancelled if cancel is set
+    :return: list with the metrics of each root
+    """
+    assigned = {}
+    for idx, root in enumerate(roots):
+        assigned.setdefault(agents[idx % len(agents)], []).append(idx)
+
+    messages = queue.Queue()
+    clients = []
+    stop = threading.Event()
+    for address, indexes in assigned.items():
+        threading.Thread(target=_stream, name=f'agent-{address}', daemon=True,
+                         args=(address, [roots[idx] for idx in indexes], profile,
+                               incremental, messages, clients, stop)).start()
+
+    results = [None] * len(roots)
+    pending = len(assigned)
+    try:
+        while pending:
+            if cancel is not None and cancel.is_set():
+                raise CollectionCancelled()
+            try:
+                address, message = messages.get(timeout=CANCEL_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            kind = message[0]
+            if kind == 'records':
+                if emit is not None:
+                    for line in zlib.decompress(message[1]).decode('utf-8').split('\n'):
+                        emit(line)
+            elif kind == 'progress':
+                if progress is not None:
+                    __, idx, path, raw = message
+                    progress(assigned[address][idx], path, Metrics.from_json(raw))
+            elif kind == 'done':
+                for idx, raw in zip(assigned[address], message[1]):
+                    results[idx] = Metrics.from_json(raw)
+                pending -= 1
+            elif kind == 'error':
+                raise MvcError(f'Agent {address}: {message[1]}')
+            else:
+                raise CollectionCancelled(f'Collection cancelled by the agent {address}')
+    finally:
+        stop.set()
+        # Each connection is closed by its own thread once the agent stops
+        if pending:
+            for conn in clients:
+                Agent._send(conn, ('cancel',))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='main.py agent',
+                                     description='Collects metrics for other hosts')
+    parser.add_argument('-l', '--listen', default=f'127.0.0.1:{DEFAULT_PORT}',
+                        help='the host:port to listen at')
+    parser.add_argument('-w', '--workers', type=int, help='worker processes of each collection')
+    parser.add_argument('-i', '--index-dir',
+                        help='folder for the indexes of the incremental collections')
+    parser.add_argument('--max-iops', type=int, help='entries stated per second at most')
+    parser.add_argument('--max-bandwidth', type=int,
+                        help='bytes read per second at most by the hashing profiles')
+    args = parser.parse_args(argv)
+    key = os.environ.get(AUTHKEY_ENV)
+    if not key:
+        key = secrets.token_hex(16)
+        print(f'Generated key, set {AUTHKEY_ENV}={key} on the controlling host', flush=True)
+    try:
+        agent = Agent(args.listen, key.encode('utf-8'), args.workers, args.index_dir,
+                      args.max_iops, args.max_bandwidth)
+    except OSError as e:
+        parser.error(f'Cannot listen at {args.listen}: {e.strerror or e}')
+    print(f'Agent listening at {agent.address[0]}:{agent.address[1]}', flush=True)
+    try:
+        agent.serve_forever()
+    except KeyboardInterrupt:
+        agent.close()
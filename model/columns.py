@@ -0,0 +1,377 @@
+"""
+Module for saving a record per file and directory in a columnar store,
+compact enough for trees with tens of millions of entries.
+
+A store is a folder with one file per column of fixed width values, in
+the native byte order, plus a blob with every distinct name once:
+
+    meta.json           version, byte order, record count, roots and columns
+    size.col            bytes of each file, 0 for directories
+    mtime_ns.col        modification time in nanoseconds
+    inode.col           inode number
+    depth.col           levels below its root, 0 for the roots
+    parent.col          record number of the enclosing directory, -1 for the roots
+    name.col            number of the name in the blob
+    kind.col            FILE, DIR or OTHER
+    names.blob          the distinct names, UTF-8 encoded one after the other
+    name_offsets.col    start of each name in names.blob, and its end
+
+Records are written in chunks with a single write per column, and read
+back through mmap, as NumPy arrays when NumPy is installed, so opening a
+store costs the same whatever its size. Parents always come before their
+entries, the roots are recorded with their whole path as name.
+
+The records are added by Visitor.scan_dir while the trees are scanned,
+see TreeColumns. Each worker process writes the subtrees it scans to a
+part store of its own, which is appended to the store of the collection
+shifting its record and name numbers. Names are only unique within a part
+"""
+
+import json
+import mmap
+import os
+import shutil
+import sys
+from array import array
+
+from common import deputils
+from common.exceptions.exceptions import MvcError
+
+# Only imported when a column is read
+numpy = deputils.lazy_import('numpy')
+
+VERSION = 1
+META_NAME = 'meta.json'
+NAMES_NAME = 'names.blob'
+COLUMN_SUFFIX = '.col'
+# Suffix of the folders of the part stores written by the workers
+COLUMNS_PART_SUFFIX = '.columns-part'
+# Name and array typecode of each column
+COLUMNS = (
+    ('size', 'q'),
+    ('mtime_ns', 'q'),
+    ('inode', 'Q'),
+    ('depth', 'H'),
+    ('parent', 'q'),
+    ('name', 'I'),
+    ('kind', 'B'),
+)
+NAME_OFFSETS = ('name_offsets', 'Q')
+# Records kept in memory before they are written
+CHUNK_RECORDS = 1 << 16
+
+FILE = 0
+DIR = 1
+OTHER = 2
+
+
+class ColumnWriter(object):
+    """
+    Writes the records of a store, appending them to the column files a chunk at a time
+    """
+
+    def __init__(self, path):
+        """
+        Creates the store folder, replacing any previous store
+
+        :param path: the store folder
+        """
+        self.path = path
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+        self.count = 0
+        self.columns = {name: array(code) for name, code in COLUMNS + (NAME_OFFSETS,)}
+        self.files = {name: open(os.path.join(path, name + COLUMN_SUFFIX), 'wb')
+                      for name, __ in COLUMNS + (NAME_OFFSETS,)}
+        self.names_file = open(os.path.join(path, NAMES_NAME), 'wb')
+        self.names_blob = bytearray()
+        self.names_size = 0
+        # Number of each distinct name, and of the names appended from parts
+        self.names = {}
+        self.name_count = 0
+        self.columns['name_offsets'].append(0)
+        self.roots = []
+
+    def add(self, name, parent, depth, kind, size, mtime_ns, inode):
+        """
+        Appends a record
+
+        :param name: the entry name, the whole path for the roots
+        :param parent: the record number of the enclosing directory, -1 for the roots
+        :return: the record number
+        """
+        name_id = self.names.get(name)
+        if name_id is None:
+            name_id = self.names[name] = self.name_count
+            self.name_count += 1
+            encoded = name.encode('utf-8', 'surrogateescape')
+            self.names_blob += encoded
+            self.names_size += len(encoded)
+            self.columns['name_offsets'].append(self.names_size)
+        columns = self.columns
+        columns['size'].append(size)
+        columns['mtime_ns'].append(mtime_ns)
+        columns['inode'].append(inode)
+        columns['depth'].append(depth)
+        columns['parent'].append(parent)
+        columns['name'].append(name_id)
+        columns['kind'].append(kind)
+        if parent < 0:
+            self.roots.append(self.count)
+        self.count += 1
+        if len(columns['size']) >= CHUNK_RECORDS:
+            self.flush()
+        return self.count - 1
+
+    def flush(self):
+        for name, values in self.columns.items():
+            values.tofile(self.files[name])
+            del values[:]
+        self.names_file.write(self.names_blob)
+        self.names_blob.clear()
+
+    def close(self, **meta):
+        """
+        Writes the pending records and the metadata of the store
+
+        :param meta: more values saved in the metadata
+        """
+        if self.names_file.closed:
+            return
+        self.flush()
+        self.abort()
+        meta.update(version=VERSION, byteorder=sys.byteorder, count=self.count,
+                    names=self.name_count, roots=self.roots, columns=dict(COLUMNS + (NAME_OFFSETS,)))
+        # The metadata goes last, a store without it was interrupted
+        with open(os.path.join(self.path, META_NAME), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+    def abort(self):
+        """
+        Closes the files without writing the metadata, so the store
+        is known to be incomplete. Does nothing once closed
+        """
+        for f in self.files.values():
+            f.close()
+        self.names_file.close()
+
+    def append(self, path, root_parent):
+        """
+        Appends the records of a part store, written by a worker for a subtree
+
+        :param path: the folder of the part
+        :param root_parent: the record number in this store of the root of
+            the subtree, the parent of the part records without one
+        :return: the number of records appended
+        """
+        with open(os.path.join(path, META_NAME), encoding='utf-8') as f:
+            meta = json.load(f)
+        self.flush()
+        for name, code in COLUMNS + (NAME_OFFSETS,):
+            with open(os.path.join(path, name + COLUMN_SUFFIX), 'rb') as f:
+                data = f.read()
+            if name == 'parent':
+                data = _shift(data, code, self.count, root_parent)
+            elif name == 'name':
+                data = _shift(data, code, self.name_count)
+            elif name == 'name_offsets':
+                # The leading 0 of the part is the end of the names already written
+                data = _shift(data[array(code).itemsize:], code, self.names_size)
+            self.files[name].write(data)
+        with open(os.path.join(path, NAMES_NAME), 'rb') as f:
+            self.names_size += self.names_file.write(f.read())
+        self.count += meta['count']
+        self.name_count += meta['names']
+        return meta['count']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def _shift(data, code, shift, negative=None):
+    """
+    Adds a number to every value of a column
+
+    :param data: the bytes of the column
+    :param code: the array typecode of the column
+    :param shift: the number added
+    :param negative: the value replacing the negative values, None for shifting them too
+    :return: the bytes of the shifted column
+    """
+    try:
+        values = numpy.frombuffer(data, dtype=numpy.dtype(code)).astype(numpy.int64)
+        shifted = values + shift
+        if negative is not None:
+            shifted[values < 0] = negative
+        return shifted.astype(numpy.dtype(code)).tobytes()
+    except ModuleNotFoundError:
+        values = array(code)
+        values.frombytes(data)
+        if negative is None:
+            return array(code, [v + shift for v in values]).tobytes()
+        return array(code, [v + shift if v >= 0 else negative for v in values]).tobytes()
+
+
+class TreeColumns(object):
+    """
+    Adds a record to a ColumnWriter for each entry listed by Visitor.scan_dir,
+    remembering the record number of the directories waiting to be listed
+    so that their entries point to them
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.add = writer.add
+        # Record number of each directory found but not listed yet
+        self.pending = {}
+
+    def add_root(self, root):
+        """
+        Adds the record of a root, named after its whole path
+        """
+        try:
+            st = os.stat(root, follow_symlinks=False)
+        except OSError:
+            return
+        self.pending[root] = self.add(root, -1, 0, DIR, 0, st.st_mtime_ns, st.st_ino)
+
+    def parent_of(self, path):
+        """
+        Gets the record number of a directory which is about to be listed
+
+        :return: the number, -1 when it is the root of a part whose
+            record is in the store the part is appended to
+        """
+        return self.pending.pop(path, -1)
+
+    def append_part(self, path, root):
+        """
+        Appends the part store written by a worker for a subtree
+
+        :param path: the folder of the part
+        :param root: the root of the subtree, which was found by this instance
+        :return: the number of records appended
+        """
+        return self.writer.append(path, self.pending.pop(root, -1))
+
+
+class ColumnStore(object):
+    """
+    A store opened for reading. The columns are mapped, not read, so only
+    the pages which are used are loaded
+    """
+
+    def __init__(self, path):
+        """
+        Opens a store
+
+        :param path: the store folder
+        :raise: MvcError if it is not a complete store of this version and byte order
+        """
+        self.path = path
+        try:
+            with open(os.path.join(path, META_NAME), encoding='utf-8') as f:
+                self.meta = json.load(f)
+        except (OSError, ValueError) as e:
+            raise MvcError(f'Not a complete column store: {path} ({e})')
+        if self.meta.get('version') != VERSION or self.meta.get('byteorder') != sys.byteorder:
+            raise MvcError(f'Unsupported column store: {path}')
+        self.count = self.meta['count']
+        self._maps = {}
+        self._columns = {}
+        self.blob = self._map(NAMES_NAME)
+        self.name_offsets = self.column('name_offsets')
+
+    def __len__(self):
+        return self.count
+
+    def _map(self, file_name):
+        """
+        Maps a file of the store, read only
+
+        :return: the mmap, or empty bytes for empty files which cannot be mapped
+        """
+        with open(os.path.join(self.path, file_name), 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                return b''
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps[file_name] = mapped
+        return mapped
+
+    def column(self, name):
+        """
+        Gets a column without copying it
+
+        :param name: the column name
+        :raise: KeyError if there is no such column
+        :return: a NumPy array, or a memoryview of the values without NumPy
+        """
+        values = self._columns.get(name)
+        if values is None:
+            code = self.meta['columns'][name]
+            data = self._map(name + COLUMN_SUFFIX)
+            try:
+                values = numpy.frombuffer(data, dtype=numpy.dtype(code))
+            except ModuleNotFoundError:
+                values = memoryview(data).cast('B').cast(code)
+            self._columns[name] = values
+        return values
+
+    def name_of(self, record):
+        """
+        Gets the name of a record, the whole path for the roots
+        """
+        name_id = int(self.column('name')[record])
+        start, end = int(self.name_offsets[name_id]), int(self.name_offsets[name_id + 1])
+        return bytes(self.blob[start:end]).decode('utf-8', 'surrogateescape')
+
+    def path_of(self, record):
+        """
+        Builds the whole path of a record from the names of its parents
+        """
+        parents = self.column('parent')
+        names = []
+        while record >= 0:
+            names.append(self.name_of(record))
+            record = int(parents[record])
+        return os.path.join(*reversed(names))
+
+    def close(self):
+        # Arrays still referencing a map keep it open until they are collected
+        self._columns.clear()
+        self.name_offsets = None
+        for mapped in self._maps.values():
+            try:
+                mapped.close()
+            except BufferError:
+                pass
+        self._maps.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == '__main__':
+    import tempfile
+    from model.scanner import scan_roots
+
+    root = sys.argv[1] if len(sys.argv) > 1 else os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        store_path = os.path.join(tmp, 'metrics.columns')
+        with ColumnWriter(store_path) as column_writer:
+            scan_roots([os.path.abspath(root)], profile='deep', columns=TreeColumns(column_writer))
+        print(column_writer.count, 'records')
+        with ColumnStore(store_path) as store:
+            sizes = store.column('size')
+            biggest = max(range(len(store)), key=sizes.__getitem__)
+            print('biggest:', store.path_of(biggest), sizes[biggest])
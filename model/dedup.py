@@ -0,0 +1,206 @@
+"""
+Module for finding the files with the same content. Files are grouped by
+size first, then by a hash of their first and last chunks, and only the
+ones still sharing both are hashed completely. The files are listed
+by the scan of the collection, see the files argument of scan_roots
+"""
+
+import hashlib
+import multiprocessing
+import os
+import time
+from collections import defaultdict, deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from common.exceptions.exceptions import CollectionCancelled
+from model import scanner
+from model.profiles import HASH_BUFFER_SIZE, hash_file
+from model.scanner import CANCEL_POLL_INTERVAL, check_cancel, init_worker
+
+# Bytes read from the start and from the end of a file for its partial hash
+CHUNK_SIZE = 64 * 1024
+# Files hashed by each task of the pool
+BATCH_FILES = 64
+
+DuplicateGroup = namedtuple('DuplicateGroup', 'size digest paths')
+
+# Buffer reused by the full hashes of a process
+hash_buffer = None
+
+
+def size_buckets(files):
+    """
+    Groups the files by size, keeping a single path for each inode so that
+    hard links and overlapping roots are not reported as duplicates
+
+    :param files: the (size, path, device, inode) tuples
+    :return: list of (path, size) lists, only for the sizes shared by several files
+    """
+    by_size = defaultdict(dict)
+    for size, path, device, inode in files:
+        if size:
+            by_size[size].setdefault((device, inode), path)
+    return [[(path, size) for path in inodes.values()]
+            for size, inodes in by_size.items() if len(inodes) > 1]
+
+
+def partial_hash(path, size):
+    """
+    Hashes the first and the last CHUNK_SIZE bytes of a file. For files up to
+    twice CHUNK_SIZE this reads every byte once and is their full hash
+
+    :param path: the file path
+    :param size: the file size
+    :return: the hexadecimal blake2b digest
+    """
+    digest = hashlib.blake2b()
+    with open(path, 'rb', buffering=0) as f:
+        digest.update(f.read(CHUNK_SIZE))
+        if size > CHUNK_SIZE:
+            f.seek(max(size - CHUNK_SIZE, CHUNK_SIZE))
+            digest.update(f.read(CHUNK_SIZE))
+    return digest.hexdigest()
+
+
+def hash_batch(items, full, cancel=None):
+    """
+    Hashes several files, in a worker process or inline
+
+    :param items: the (path, size) tuples
+    :param full: True for hashing the whole content, False for the partial hash
+    :param cancel: optional event for cancelling the collection, the one
+        of the worker process by default
+    :return: list of (path, size, digest) tuples, without the unreadable
+        files, and stopping early if cancelled
+    """
+    global hash_buffer
+    if full and hash_buffer is None:
+        hash_buffer = bytearray(HASH_BUFFER_SIZE)
+    cancel = cancel or scanner.worker_cancel
+    results = []
+    for path, size in items:
+        if cancel is not None and cancel.is_set():
+            break
+        try:
+            digest = hash_file(path, hash_buffer, cancel) if full else partial_hash(path, size)
+        except CollectionCancelled:
+            break
+        except OSError:
+            continue
+        results.append((path, size, digest))
+    return results
+
+
+def batch_bytes(batch, full):
+    """
+    Gets the bytes read for hashing a batch
+
+    :param batch: the (path, size) tuples
+    :param full: True for the whole content, False for the partial hash
+    :return: the bytes
+    """
+    if full:
+        return sum(size for __, size in batch)
+    return sum(min(size, 2 * CHUNK_SIZE) for __, size in batch)
+
+
+def hash_groups(groups, full, executor=None, cancel=None, limiter=None):
+    """
+    Hashes every file of the groups and splits them by digest
+
+    :param groups: the (path, size) lists of files which may be equal
+    :param full: True for hashing the whole content, False for the partial hash
+    :param executor: the process pool, None for hashing inline
+    :param cancel: optional event for cancelling the collection
+    :param limiter: optional RateLimiter capping the files opened and the
+        bytes read per second, each batch is started once it fits
+    :raise: CollectionCancelled if cancel is set
+    :return: dict with the (path, size) lists by (size, digest), only for
+        the digests shared by several files
+    """
+    items = [item for group in groups for item in group]
+    batches = deque(items[i:i + BATCH_FILES] for i in range(0, len(items), BATCH_FILES))
+    by_digest = defaultdict(list)
+
+    def batch_done(results):
+        for path, size, digest in results:
+            by_digest[(size, digest)].append((path, size))
+
+    if executor is None:
+        for batch in batches:
+            check_cancel(cancel)
+            if limiter is not None:
+                limiter.wait(cancel, CANCEL_POLL_INTERVAL)
+                limiter.add(len(batch), batch_bytes(batch, full))
+            batch_done(hash_batch(batch, full, cancel))
+        # The last batch may have stopped early
+        check_cancel(cancel)
+    else:
+        pending = set()
+
+        def submit_ready():
+            while batches and (limiter is None or limiter.ready()):
+                batch = batches.popleft()
+                if limiter is not None:
+                    limiter.add(len(batch), batch_bytes(batch, full))
+                pending.add(executor.submit(hash_batch, batch, full))
+
+        submit_ready()
+        while pending or batches:
+            if pending:
+                done, __ = wait(pending, timeout=CANCEL_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            else:
+                # Everything left waits for the rate cap
+                done = ()
+                time.sleep(min(CANCEL_POLL_INTERVAL, limiter.delay()))
+            for future in done:
+                pending.discard(future)
+                batch_done(future.result())
+            check_cancel(cancel)
+            submit_ready()
+    return {key: group for key, group in by_digest.items() if len(group) > 1}
+
+
+def find_duplicates(files, workers=None, cancel=None, progress=None, limiter=None):
+    """
+    Finds the files with the same content among the ones listed by a
+    scan, reading only the files whose size and partial hash match another file
+
+    :param files: the (size, path, device, inode) tuples of the regular files
+    :param workers: number of worker processes, the cpu count by default
+    :param cancel: optional event for cancelling the collection
+    :param progress: optional callable receiving (stage, candidates) before
+        each stage, with stage being 'partial' or 'full'
+    :param limiter: optional RateLimiter capping the files opened and the bytes read
+    :raise: CollectionCancelled if cancel is set
+    :return: list of DuplicateGroup, the ones wasting more bytes first
+    """
+    workers = workers or os.cpu_count() or 1
+    groups = size_buckets(files)
+    if progress is not None:
+        progress('partial', sum(len(g) for g in groups))
+
+    executor = None
+    stop_workers = multiprocessing.Event()
+    if workers > 1 and groups:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                       initargs=(stop_workers,))
+    try:
+        partial = hash_groups(groups, False, executor, cancel, limiter)
+        # The partial hash of the small files already covers all their content
+        equal = {key: group for key, group in partial.items() if key[0] <= 2 * CHUNK_SIZE}
+        large = [group for key, group in partial.items() if key[0] > 2 * CHUNK_SIZE]
+        if progress is not None:
+            progress('full', sum(len(g) for g in large))
+        equal.update(hash_groups(large, True, executor, cancel, limiter))
+    except CollectionCancelled:
+        stop_workers.set()
+        raise
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    duplicates = [DuplicateGroup(size, digest, sorted(path for path, __ in group))
+                  for (size, digest), group in equal.items()]
+    duplicates.sort(key=lambda d: d.size * (len(d.paths) - 1), reverse=True)
+    return duplicates
@@ -0,0 +1,142 @@
+"""
+Module for the persistent index of directory mtimes and metrics
+which allows collecting metrics incrementally
+"""
+
+import json
+import os
+import sqlite3
+from collections import namedtuple
+
+IndexEntry = namedtuple('IndexEntry', 'mtime_ns subdirs direct tree')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    subdirs TEXT NOT NULL,
+    direct TEXT NOT NULL,
+    tree TEXT NOT NULL
+) WITHOUT ROWID
+"""
+
+
+def subtree_bounds(path):
+    """
+    Gets the range of the paths inside a directory, which
+    all sort between 'path/' and 'path0'
+
+    :param path: the directory path
+    :return: (lower inclusive, upper exclusive) tuple
+    """
+    prefix = path.rstrip(os.sep) + os.sep
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+class MetricsIndex(object):
+    """
+    SQLite index storing for every directory its mtime, the names of its
+    subdirectories, the metrics of its direct entries and the metrics of
+    its whole subtree
+    """
+    # Each profile computes different metrics, so each one has its own index
+    FILE_NAME = '.metrics_index-{profile}.sqlite'
+
+    # Read only indexes opened by this process, by path
+    shared_indexes = {}
+
+    def __init__(self, path, readonly=False):
+        """
+        Opens the index, creating it if needed
+
+        :param path: the path of the SQLite file
+        :param readonly: True for opening it read only
+        """
+        self.path = str(path)
+        if readonly:
+            self.conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)
+        else:
+            self.conn = sqlite3.connect(self.path)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute(SCHEMA)
+            self.conn.commit()
+
+    @staticmethod
+    def shared(path):
+        """
+        Gets a read only index shared by every scan in this process
+
+        :param path: the path of the SQLite file
+        :return: the index
+        """
+        index = MetricsIndex.shared_indexes.get(path)
+        if index is None:
+            index = MetricsIndex(path, readonly=True)
+            MetricsIndex.shared_indexes[path] = index
+        return index
+
+    def get(self, dirpath):
+        """
+        Gets the entry stored for a directory
+
+        :param dirpath: the directory path
+        :return: the IndexEntry, None if the directory is not indexed
+        """
+        row = self.conn.execute('SELECT mtime_ns, subdirs, direct, tree FROM dirs WHERE path = ?',
+                                (dirpath,)).fetchone()
+        if row is None:
+            return None
+        return IndexEntry(row[0], json.loads(row[1]), row[2], row[3])
+
+    def subtree(self, dirpath):
+        """
+        Gets the entries of a directory and of every directory below it
+
+        :param dirpath: the directory path
+        :return: iterator of (path, IndexEntry) tuples
+        """
+        prefix, upper = subtree_bounds(dirpath)
+        rows = self.conn.execute('SELECT path, mtime_ns, subdirs, direct, tree FROM dirs '
+                                 'WHERE path = ? OR (path >= ? AND path < ?)',
+                                 (dirpath, prefix, upper))
+        for row in rows:
+            yield row[0], IndexEntry(row[1], json.loads(row[2]), row[3], row[4])
+
+    def update(self, rows, removed=()):
+        """
+        Stores the rows and forgets the removed directories
+        and their subtrees in a single transaction
+
+        :param rows: iterable of (path, mtime_ns, subdirs, direct, tree) tuples
+        :param removed: the paths of the removed directories
+        """
+        with self.transaction():
+            self.write(rows, removed)
+
+    def transaction(self):
+        """
+        Gets a context manager committing the writes done inside it when it
+        ends, or discarding them all if it ends with an error, so that a
+        cancelled scan leaves the index untouched
+
+        :return: the context manager
+        """
+        return self.conn
+
+    def write(self, rows, removed=()):
+        """
+        Stores the rows and forgets the removed directories and their
+        subtrees in the current transaction. They are kept in the SQLite
+        journal until it is committed, not in memory
+
+        :param rows: iterable of (path, mtime_ns, subdirs, direct, tree) tuples
+        :param removed: the paths of the removed directories
+        """
+        self.conn.executemany('INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?, ?)', rows)
+        for path in removed:
+            prefix, upper = subtree_bounds(path)
+            self.conn.execute('DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)',
+                              (path, prefix, upper))
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,222 @@
+"""
+Module for pacing the scans of each device. A spinning disk gets slower
+when it is asked for more directories at once, while an NVMe drive needs
+many of them in flight to be busy, so the number of subtrees scanned at
+once on a device is found while scanning, AIMD style like the congestion
+window of TCP: it grows by one after each round of subtrees which got
+more done per second, and is halved when the time per operation grows
+well above the best seen
+
+Operations are the directories listed and the entries stated, the
+bandwidth is the one of the file contents read by hashing profiles
+"""
+
+import os
+import time
+from collections import deque
+
+from common.exceptions.exceptions import CollectionCancelled
+
+# Subtrees in flight per device at first
+INITIAL_LIMIT = 2
+# Seconds per operation over the best ones which mean the device is congested
+CONGESTION_FACTOR = 2.0
+# Fraction of the limit kept on congestion
+DECREASE = 0.5
+# Relative growth of the operations per second which is worth another subtree in flight
+MIN_GAIN = 0.05
+# Subtrees with fewer operations are too short for measuring the device
+MIN_OPS = 64
+# Weight of each new measure in the smoothed seconds per operation
+SMOOTHING = 0.3
+# Seconds slept at once while waiting for the caps, between checks for cancellation
+WAIT_SLICE = 0.02
+
+
+class AdaptiveLimit(object):
+    """
+    The number of subtrees of a device scanned at once
+    """
+
+    def __init__(self, maximum, initial=INITIAL_LIMIT):
+        """
+        Initializes the limit
+
+        :param maximum: the upper bound, the workers of the pool of the device
+        :param initial: the first limit
+        """
+        self.maximum = max(1, maximum)
+        self.limit = min(initial, self.maximum)
+        self.in_flight = 0
+        self.best_latency = None
+        self.latency = None
+        # Operations and start of the current round, and throughput of the last one
+        self.round_ops = 0
+        self.round_done = 0
+        self.round_started = time.monotonic()
+        self.last_throughput = 0.0
+        # Subtrees started before the last decrease do not decrease it again
+        self.decreased_at = 0.0
+        self.decreases = 0
+
+    def started(self):
+        """
+        Accounts for a subtree being submitted
+
+        :return: the time it started
+        """
+        self.in_flight += 1
+        return time.monotonic()
+
+    def done(self, started, ops):
+        """
+        Accounts for a finished subtree, adjusting the limit
+
+        :param started: the time returned by started
+        :param ops: the operations the subtree took
+        """
+        now = time.monotonic()
+        self.in_flight -= 1
+        self.round_ops += ops
+        self.round_done += 1
+        if ops >= MIN_OPS:
+            latency = (now - started) / ops
+            self.latency = latency if self.latency is None else \
+                SMOOTHING * latency + (1 - SMOOTHING) * self.latency
+            if self.best_latency is None or self.latency < self.best_latency:
+                self.best_latency = self.latency
+            elif self.latency > self.best_latency * CONGESTION_FACTOR and started >= self.decreased_at:
+                self.limit = max(1, int(self.limit * DECREASE))
+                self.decreased_at = now
+                self.decreases += 1
+                self._new_round(now, 0.0)
+                return
+
+        if self.round_done >= self.limit:
+            throughput = self.round_ops / max(now - self.round_started, 1e-6)
+            if throughput > self.last_throughput * (1 + MIN_GAIN) and self.limit < self.maximum:
+                self.limit += 1
+            self._new_round(now, throughput)
+
+    def _new_round(self, now, throughput):
+        self.round_ops = 0
+        self.round_done = 0
+        self.round_started = now
+        self.last_throughput = throughput
+
+    def ready(self):
+        return self.in_flight < self.limit
+
+
+class RateLimiter(object):
+    """
+    Global cap of the operations and bytes per second of a collection, on
+    average since it started. The cost of a subtree is only known when it is
+    done, so it is estimated when submitted and corrected afterwards
+    """
+
+    def __init__(self, iops=None, bandwidth=None):
+        """
+        Initializes the limiter
+
+        :param iops: the maximum operations per second, None for no limit
+        :param bandwidth: the maximum bytes read per second, None for no limit
+        """
+        self.iops = iops
+        self.bandwidth = bandwidth
+        self.started = time.monotonic()
+        self.ops = 0
+        self.bytes = 0
+        self.tasks = 0
+        # Times the caps held work back, and whether they are doing it now
+        self.waits = 0
+        self.waiting = False
+
+    def delay(self):
+        """
+        Gets the seconds until more work can start without exceeding the caps
+        """
+        elapsed = time.monotonic() - self.started
+        delay = 0.0
+        if self.iops:
+            delay = max(delay, self.ops / self.iops - elapsed)
+        if self.bandwidth:
+            delay = max(delay, self.bytes / self.bandwidth - elapsed)
+        return delay
+
+    def ready(self):
+        if self.delay() > 0:
+            if not self.waiting:
+                self.waiting = True
+                self.waits += 1
+            return False
+        self.waiting = False
+        return True
+
+    def estimate(self):
+        """
+        Accounts for a subtree being submitted with the average cost of the finished ones
+
+        :return: the (operations, bytes) estimated
+        """
+        estimate = (self.ops // self.tasks, self.bytes // self.tasks) if self.tasks else (MIN_OPS, 0)
+        self.ops += estimate[0]
+        self.bytes += estimate[1]
+        return estimate
+
+    def add(self, ops, size):
+        """
+        Accounts for work whose cost is known before it starts
+        """
+        self.ops += ops
+        self.bytes += size
+
+    def done(self, estimate, ops, size):
+        """
+        Replaces the estimate of a finished subtree with its cost
+        """
+        self.ops += ops - estimate[0]
+        self.bytes += size - estimate[1]
+        self.tasks += 1
+
+    def wait(self, cancel=None, interval=WAIT_SLICE):
+        """
+        Sleeps until more work can start, a slice at a time
+
+        :param cancel: optional event checked between the slices
+        :param interval: the seconds of each slice
+        :raise: CollectionCancelled if cancel is set
+        """
+        delay = self.delay()
+        if delay > 0:
+            self.waits += 1
+        while delay > 0:
+            if cancel is not None and cancel.is_set():
+                raise CollectionCancelled()
+            time.sleep(min(delay, interval))
+            delay = self.delay()
+
+
+def device_of(path):
+    """
+    Gets the device of a path
+
+    :return: its st_dev, None if it cannot be stated
+    """
+    try:
+        return os.stat(path, follow_symlinks=False).st_dev
+    except OSError:
+        return None
+
+
+def group_by_device(tasks):
+    """
+    Groups the subtrees of a collection by the device they are on
+
+    :param tasks: the (root index, path) tasks
+    :return: dict of device to deque of its tasks
+    """
+    devices = {}
+    for task in tasks:
+        devices.setdefault(device_of(task[1]), deque()).append(task)
+    return devices
@@ -0,0 +1,336 @@
+"""
+Module for creating project folder layouts from templates.
+
+A template is a text file with a line per folder or file, indented
+below the folder it belongs to. Folders end with '/', files may have
+a line of content after ' = ' or be a copy of a seed file, relative to
+the template folder, after ' < '. Lines starting with '#' are comments:
+
+    {code}/
+        docs/
+            README.md = {code} {project} created on {datetime:%Y-%m-%d %H:%M}
+        data/
+            reference.db < seeds/reference.db
+        src/
+        notes.txt
+
+Seed files are cloned where the file system supports it, so they take
+no extra space until modified, and copied in the kernel otherwise
+
+Names and contents may use the placeholders code, prefix, project,
+suffix, date and datetime, with the format specs of str.format
+"""
+
+import datetime as dt
+import errno
+import os
+import shutil
+import sys
+import threading
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from common.exceptions.exceptions import MvcError
+
+try:
+    import fcntl
+except ModuleNotFoundError:
+    fcntl = None
+
+TemplateEntry = namedtuple('TemplateEntry', 'path is_dir content source')
+# methods counts the seed files by how they were created, see copy_seed
+LayoutResult = namedtuple('LayoutResult', 'projects dirs files skipped methods')
+
+# Files written by each task of the pool
+FILES_PER_TASK = 64
+CONTENT_SEPARATOR = ' = '
+SEED_SEPARATOR = ' < '
+
+# Seed files are copied as hard links when the layout is created with
+# hardlink_seeds, otherwise they are cloned or copied
+HARDLINK = 'hardlink'
+REFLINK = 'reflink'
+COPY_FILE_RANGE = 'copy_file_range'
+SENDFILE = 'sendfile'
+BUFFERED = 'buffered'
+
+# ioctl of Linux cloning a whole file, for btrfs, xfs and others
+FICLONE = 0x40049409
+# Errors telling that the file system or the platform cannot do a copy method
+UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.EOPNOTSUPP,
+                      errno.ENOSYS, errno.EPERM, errno.EBADF}
+# Suffix of the seed copies in progress, hidden by a leading dot
+PARTIAL_SUFFIX = '.part'
+# Devices which failed to clone, they are not asked again
+_no_reflink_devices = set()
+
+# Parsed templates by path, with the mtime they were parsed at
+_templates = {}
+
+
+def parse_template(text):
+    """
+    Parses a template into its entries, parents before their children
+
+    :param text: the template
+    :raise: MvcError if an entry is indented below a file
+    :return: list of TemplateEntry with the paths relative to the project
+        folder and the seed paths relative to the template folder
+    """
+    entries = []
+    # (indentation, path) of the folders enclosing the current line
+    parents = [(-1, '')]
+    last_indent = -1
+    for number, line in enumerate(text.expandtabs(4).splitlines(), 1):
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#'):
+            continue
+        indent = len(line) - len(line.lstrip())
+        if entries and not entries[-1].is_dir and indent > last_indent:
+            raise MvcError(f'Line {number} of the template is inside a file')
+        while parents[-1][0] >= indent:
+            parents.pop()
+
+        name, __, source = stripped.partition(SEED_SEPARATOR)
+        name, __, content = name.partition(CONTENT_SEPARATOR)
+        is_dir = name.endswith('/')
+        path = os.path.join(parents[-1][1], name.rstrip('/'))
+        entries.append(TemplateEntry(path, is_dir, None if is_dir else content,
+                                     None if is_dir else source or None))
+        if is_dir:
+            parents.append((indent, path))
+        last_indent = indent
+    return entries
+
+
+def load_template(path):
+    """
+    Gets the entries of a template file, parsing it again only if it changed
+
+    :param path: the template path
+    :raise: MvcError if the template cannot be read or parsed
+    :return: list of TemplateEntry
+    """
+    path = os.path.abspath(path)
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+        cached = _templates.get(path)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1]
+        with open(path, encoding='utf-8') as f:
+            entries = parse_template(f.read())
+    except OSError as e:
+        raise MvcError(f'Cannot read the template {path}: {e.strerror}')
+    folder = os.path.dirname(path)
+    entries = [entry._replace(source=os.path.join(folder, entry.source)) if entry.source else entry
+               for entry in entries]
+    _templates[path] = (mtime_ns, entries)
+    return entries
+
+
+def project_code(prefix, project, suffix):
+    """
+    Builds the code of a project, like the key of its JIRA issue
+
+    :return: the non empty parts joined by '-'
+    """
+    return '-'.join(part for part in (prefix, project, suffix) if part)
+
+
+def render(entries, projects_path, fields):
+    """
+    Resolves the placeholders of a template for a project
+
+    :param entries: the TemplateEntry list
+    :param projects_path: the folder where the layouts are created
+    :param fields: the values of the placeholders
+    :raise: MvcError for unknown placeholders or paths outside projects_path
+    :return: (folders, files) tuple, files being (path, content, seed path) tuples
+    """
+    dirs = []
+    files = []
+    root = os.path.abspath(projects_path)
+    for entry in entries:
+        try:
+            path = os.path.normpath(os.path.join(root, entry.path.format_map(fields)))
+            content = entry.content.format_map(fields) if entry.content is not None else None
+        except (KeyError, ValueError) as e:
+            raise MvcError(f'Wrong placeholder in the template entry {entry.path}: {e}')
+        if os.path.commonpath((root, path)) != root or path == root:
+            raise MvcError(f'The template entry {entry.path} is outside the projects folder')
+        if entry.is_dir:
+            dirs.append(path)
+        else:
+            dirs.append(os.path.dirname(path))
+            files.append((path, content, entry.source))
+    return dirs, files
+
+
+def leaf_dirs(dirs):
+    """
+    Gets the folders which are not the parent of any other,
+    creating them with os.makedirs creates every folder
+
+    :param dirs: the folder paths
+    :return: list of the leaf folders
+    """
+    ordered = sorted(set(dirs), key=lambda p: p.split(os.sep))
+    return [path for path, following in zip(ordered, ordered[1:] + [None])
+            if following is None or not following.startswith(path + os.sep)]
+
+
+def copy_seed(source, path, hardlink=False):
+    """
+    Copies a seed file with the cheapest method the file system supports:
+    a hard link if allowed, a reflink clone sharing the blocks until they
+    are modified, a copy inside the kernel or a buffered copy. The copy is
+    made under a temporary name and only linked to its path once complete,
+    so a failed copy never leaves a truncated file which later runs keep
+
+    :param source: the seed file
+    :param path: the new file, which must not exist
+    :param hardlink: True for linking the file instead of copying it, so every
+        project shares it. Falls back to copying across file systems
+    :raise: FileExistsError if the new file exists
+    :return: the method used
+    """
+    if hardlink:
+        try:
+            os.link(source, path)
+            return HARDLINK
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS:
+                raise
+
+    if os.path.lexists(path):
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), path)
+    folder, name = os.path.split(path)
+    # The workers are threads of a single process
+    temp = os.path.join(folder, f'.{name}.{os.getpid()}.{threading.get_ident()}{PARTIAL_SUFFIX}')
+    try:
+        method = _copy_file(source, temp)
+        try:
+            # Unlike a rename, a link does not replace a file created meanwhile
+            os.link(temp, path)
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS:
+                raise
+            if os.path.lexists(path):
+                raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), path)
+            os.replace(temp, path)
+    finally:
+        try:
+            os.unlink(temp)
+        except FileNotFoundError:
+            pass
+    return method
+
+
+def _copy_file(source, path):
+    """
+    Copies a file to a new path with the first method that works, see copy_seed
+
+    :return: the method used
+    """
+    with open(source, 'rb') as src, open(path, 'xb') as dst:
+        device = os.fstat(dst.fileno()).st_dev
+        if fcntl is not None and sys.platform.startswith('linux') and device not in _no_reflink_devices:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return REFLINK
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRNOS:
+                    raise
+                _no_reflink_devices.add(device)
+
+        for method, copy_chunk in ((COPY_FILE_RANGE, getattr(os, 'copy_file_range', None)),
+                                   (SENDFILE, _sendfile if hasattr(os, 'sendfile') else None)):
+            if copy_chunk is None:
+                continue
+            try:
+                while copy_chunk(src.fileno(), dst.fileno(), 1 << 30):
+                    pass
+                return method
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRNOS:
+                    raise
+                # Nothing was copied if the first call failed, otherwise start again
+                src.seek(0)
+                dst.seek(0)
+                dst.truncate()
+
+        shutil.copyfileobj(src, dst, 1 << 20)
+        return BUFFERED
+
+
+def _sendfile(src_fd, dst_fd, count):
+    return os.sendfile(dst_fd, src_fd, None, count)
+
+
+def write_files(files, hardlink_seeds=False):
+    """
+    Creates several files, keeping the ones which already exist
+
+    :param files: the (path, content, seed path) tuples
+    :param hardlink_seeds: True for creating the seed files as hard links
+    :return: Counter of the seed files by copy method, with the number of
+        files which already existed as 'skipped'
+    """
+    methods = Counter()
+    for path, content, source in files:
+        try:
+            if source is not None:
+                methods[copy_seed(source, path, hardlink_seeds)] += 1
+                continue
+            with open(path, 'x', encoding='utf-8') as f:
+                if content:
+                    f.write(content + '\n')
+        except FileExistsError:
+            methods['skipped'] += 1
+    return methods
+
+
+def create_layouts(projects_path, template_path, projects, prefix='', suffix='',
+                   when=None, workers=None, hardlink_seeds=False):
+    """
+    Creates the layout of a template for several projects at once. The
+    template is parsed once, the folders are created with a single makedirs
+    per leaf folder and the files are written in parallel. Existing files are not modified
+
+    :param projects_path: the folder where the layouts are created
+    :param template_path: the template file
+    :param projects: the project codes, without prefix and suffix
+    :param prefix: the prefix of every project code
+    :param suffix: the suffix of every project code
+    :param when: the datetime of the placeholders, now by default
+    :param workers: the number of threads writing files
+    :param hardlink_seeds: True for sharing the seed files between the
+        projects as hard links instead of cloning or copying them
+    :raise: MvcError if the template is wrong, OSError if a folder or file cannot be created
+    :return: the LayoutResult
+    """
+    entries = load_template(template_path)
+    when = when or dt.datetime.now()
+    dirs = []
+    files = []
+    for project in projects:
+        fields = {'code': project_code(prefix, project, suffix), 'prefix': prefix,
+                  'project': project, 'suffix': suffix, 'date': when.date(), 'datetime': when}
+        project_dirs, project_files = render(entries, projects_path, fields)
+        dirs.extend(project_dirs)
+        files.extend(project_files)
+
+    for path in leaf_dirs(dirs):
+        os.makedirs(path, exist_ok=True)
+
+    chunks = [files[i:i + FILES_PER_TASK] for i in range(0, len(files), FILES_PER_TASK)]
+    methods = Counter()
+    if len(chunks) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for counts in executor.map(write_files, chunks, [hardlink_seeds] * len(chunks)):
+                methods.update(counts)
+    else:
+        for chunk in chunks:
+            methods.update(write_files(chunk, hardlink_seeds))
+    skipped = methods.pop('skipped', 0)
+    return LayoutResult(len(projects), len(set(dirs)), len(files) - skipped, skipped, dict(methods))
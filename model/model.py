@@ -1,11 +1,432 @@
+import datetime as dt
+import os
+import sqlite3
+import threading
+import time
 from pathlib import Path
 
+from common import instrumentation
+from common.events.events import EndTaskEvent, MetricsDeltaEvent, ProgressBatchEvent
+from common.exceptions.exceptions import CollectionCancelled, MvcError
 from common.observer import Observable
+from model.agent import scan_agents
+from model.dedup import find_duplicates
+from model.index import MetricsIndex
+from model.iosched import RateLimiter
+from model.layout import create_layouts
+from model.output import open_writer
+from model.profiles import compile_profile
+from model.scanner import Metrics, scan_roots
+from model.watcher import LiveTree, PollingWatcher, make_watcher
 
 
 class Model(Observable):
-    def __init__(self, *args, **kwargs):
+    OUTPUT_NAME = 'metrics{suffix}'
+    # Suffix of the columnar store of the profiles saving file records
+    COLUMNS_SUFFIX = '.columns'
+    # Rows notified by the queries which list directories or files
+    QUERY_ROWS = 100
+    # Seconds between checks for cancellation while watching
+    WATCH_TIMEOUT = 0.25
+
+    def __init__(self, *args, sample_interval=None, max_iops=None, max_bandwidth=None, **kwargs):
+        """
+        Initializes this model
+
+        :param sample_interval: seconds between the samples of system usage
+            taken while collecting, None for not sampling
+        :param max_iops: optional cap of the directories and entries stated
+            per second by the local collections
+        :param max_bandwidth: optional cap of the bytes per second read by
+            the local collections of hashing profiles and by the search of duplicates
+        """
         super().__init__(*args, **kwargs)
+        self.max_iops = max_iops
+        self.max_bandwidth = max_bandwidth
+        self._cancel = threading.Event()
+        self.sampler = None
+        if sample_interval is not None:
+            from model.sampler import Sampler
+            self.sampler = Sampler(self.notify, interval=sample_interval)
+
+    def cancel_collection(self):
+        """
+        Cancels the running collection, its workers stop
+        after the directory they are listing
+        """
+        self._cancel.set()
+
+    def _progress_notifier(self):
+        """
+        Builds the progress callback of a collection, which notifies a
+        ProgressBatchEvent with the running totals each time a subtree is done
+
+        :return: the callback for scan_roots
+        """
+        counters = ProgressBatchEvent.new_counters()
+
+        def progress(__, path, metrics):
+            counters[0] += 1
+            counters[1] += metrics.files
+            counters[2] += metrics.dirs
+            counters[3] += metrics.size
+            self.notify(ProgressBatchEvent(counters[:], path))
+        return progress
+
+    def collect_metrics(self, destiny_path, paths, output_name=None,
+                        profile=None, workers=None, incremental=True, agents=None):
+        """
+        Collects file counts, byte totals and extension histograms for every
+        path and streams them to an output file inside destiny_path, NDJSON or
+        a JSON array depending on its extension
+
+        While collecting, the usage of the system is published as SamplesEvent
+        if the model samples it
+
+        An index of directory mtimes is kept next to the output file so that
+        later runs only list again the directories which changed, except for
+        profiles which hash the files or save file records
+
+        Profiles with columns also save a record per file and directory in a
+        columnar store with the name of the output file and COLUMNS_SUFFIX,
+        in the same pass over the trees
+
+        :param destiny_path: the folder where the output file is saved
+        :param paths: the root paths to collect metrics from
+        :param output_name: the name of the output file, by default
+            'metrics' with the extension of the profile output format
+        :param profile: the name of the profile, the default one if empty
+        :param workers: number of worker processes, the cpu count by default
+        :param incremental: False for ignoring the index and scanning everything
+        :param agents: the 'host:port' addresses of the agents the roots are
+            spread over, see model.agent, None for collecting in this host.
+            The duplicates and the file records are only found locally
+        :return: dict with the metrics per root and the total, None on error
+            or when cancelled
+        """
+        if self.sampler is not None:
+            self.sampler.start()
+        try:
+            return self._collect_metrics(destiny_path, paths, output_name,
+                                         profile, workers, incremental, agents)
+        finally:
+            if self.sampler is not None:
+                self.sampler.stop()
+            self.flush()
+
+    def _collect_metrics(self, destiny_path, paths, output_name, profile, workers, incremental, agents):
+        self._cancel.clear()
+        if agents:
+            # The roots are checked by the agents, in their hosts
+            roots = [os.path.normpath(p) for p in paths]
+            missing = [r for r in roots if not os.path.isabs(r)]
+        else:
+            roots = [str(Path(p).resolve()) for p in paths]
+            missing = [r for r in roots if not Path(r).is_dir()]
+        if not roots or missing:
+            self.notify(MvcError(f'Not {"an absolute path" if agents else "a directory"}: {missing[0]}'
+                                 if missing else 'No paths to collect metrics from'))
+            return None
+
+        try:
+            visitor = compile_profile(profile)
+        except KeyError:
+            self.notify(MvcError(f'Unknown profile: {profile}'))
+            return None
+
+        output_name = output_name or Model.OUTPUT_NAME.format(suffix=visitor.suffix)
+        output_path = Path(destiny_path) / output_name
+        try:
+            writer = open_writer(output_path)
+        except OSError as e:
+            self.notify(MvcError(f'Cannot write {output_path}: {e.strerror}'))
+            return None
+
+        self.notify(f'Collecting metrics for {len(roots)} paths ({visitor.name})'
+                    + (f' on {len(agents)} agents' if agents else ''))
+        index = None
+        # Hashes, duplicates and file records need every file, so those profiles list every directory
+        if incremental and not (visitor.hashing or visitor.duplicates or visitor.columns) and not agents:
+            try:
+                index = MetricsIndex(Path(destiny_path) / MetricsIndex.FILE_NAME.format(profile=visitor.name))
+            except sqlite3.Error as e:
+                self.notify(f'Index not available, scanning everything: {e}')
+        column_writer = None
+        try:
+            writer.write({'type': 'run', 'profile': visitor.name, 'definition': visitor.definition,
+                          'roots': roots, 'agents': agents or [],
+                          'started': dt.datetime.now().isoformat(timespec='seconds')})
+            # The regular files are listed by the scan for finding the duplicates afterwards
+            files = [] if visitor.duplicates and not agents else None
+            tree_columns = None
+            if visitor.columns and not agents:
+                from model.columns import ColumnWriter, TreeColumns
+                columns_path = Model.columns_path(destiny_path, output_name)
+                column_writer = ColumnWriter(columns_path)
+                tree_columns = TreeColumns(column_writer)
+            with instrumentation.stage('scan'):
+                if agents:
+                    per_root = scan_agents(roots, agents, profile=visitor.name, incremental=incremental,
+                                           progress=self._progress_notifier(),
+                                           emit=writer.write_raw, cancel=self._cancel)
+                else:
+                    per_root = scan_roots(roots, workers=workers, index=index,
+                                          progress=self._progress_notifier(),
+                                          emit=writer.write_raw, parts_dir=destiny_path,
+                                          cancel=self._cancel, profile=visitor.name,
+                                          iops=self.max_iops, bandwidth=self.max_bandwidth,
+                                          columns=tree_columns, files=files)
+
+            total = Metrics()
+            for root, metrics in zip(roots, per_root):
+                total.merge(metrics)
+                writer.write(dict(type='root', path=root, **metrics.to_dict()))
+                self.notify(f'{root}: {metrics.files} files, {metrics.dirs} dirs, {metrics.size} bytes')
+            writer.write(dict(type='total', **total.to_dict()))
+            duplicates = None
+            if agents and (visitor.duplicates or visitor.columns):
+                self.notify('Duplicates and file records are not collected on agents')
+            elif visitor.duplicates:
+                with instrumentation.stage('duplicates'):
+                    duplicates = self._find_duplicates(files, workers, writer)
+            columns = None
+            if column_writer is not None:
+                column_writer.close(profile=visitor.name)
+                columns = {'path': str(columns_path), 'records': column_writer.count}
+                self.notify(f'{columns["records"]} records saved to {columns_path}')
+        except CollectionCancelled as e:
+            self.notify(e.messages[0])
+            return None
+        except MvcError as e:
+            self.notify(e)
+            return None
+        except OSError as e:
+            self.notify(MvcError(f'Cannot write {output_path}: {e.strerror}'))
+            return None
+        finally:
+            with instrumentation.stage('close'):
+                writer.close()
+                if index is not None:
+                    index.close()
+                # Without its metadata, a store of a failed collection is known to be incomplete
+                if column_writer is not None:
+                    column_writer.abort()
+
+        result = {
+            'profile': visitor.name,
+            'roots': {root: metrics.to_dict() for root, metrics in zip(roots, per_root)},
+            'total': total.to_dict(),
+        }
+        if duplicates is not None:
+            result['duplicates'] = duplicates
+        if columns is not None:
+            result['columns'] = columns
+        self.notify(f'Metrics saved to {output_path}')
+        self.notify(EndTaskEvent(result))
+        return result
+
+    def watch_metrics(self, destiny_path, paths, profile=None, workers=None):
+        """
+        Collects the metrics of the paths and keeps them up to date until
+        the collection is cancelled, notifying a MetricsDeltaEvent for
+        each root whose totals change
+
+        :param destiny_path: the folder where the output file is saved
+        :param paths: the root paths to collect metrics from
+        :param profile: the name of the profile, the default one if empty
+        :param workers: number of worker processes, the cpu count by default
+        """
+        if self.collect_metrics(destiny_path, paths, profile=profile, workers=workers) is None:
+            return
+        visitor = compile_profile(profile)
+        roots = [str(Path(p).resolve()) for p in paths]
+        trees = [LiveTree(root, visitor) for root in roots]
+        index = None
+        index_path = Path(destiny_path) / MetricsIndex.FILE_NAME.format(profile=visitor.name)
+        if index_path.exists():
+            try:
+                index = MetricsIndex(index_path, readonly=True)
+            except sqlite3.Error:
+                pass
+        watcher = make_watcher()
+        try:
+            for tree in trees:
+                for path in tree.load(index):
+                    watcher = self._watch(watcher, path, trees)
+            if index is not None:
+                index.close()
+            self.notify(f'Watching {sum(len(t.nodes) for t in trees)} folders '
+                        f'({"polling" if isinstance(watcher, PollingWatcher) else "inotify"})')
+            self.flush()
+
+            while not self._cancel.is_set():
+                changed = watcher.wait(Model.WATCH_TIMEOUT)
+                if not changed:
+                    continue
+                for tree in trees:
+                    before = tree.tree.files, tree.tree.dirs, tree.tree.size
+                    added, removed = tree.update(changed)
+                    for path in removed:
+                        watcher.remove(path)
+                    for path in added:
+                        watcher = self._watch(watcher, path, trees)
+                    totals = tree.tree
+                    delta = dict(zip(('files', 'dirs', 'size'),
+                                     (totals.files - before[0], totals.dirs - before[1],
+                                      totals.size - before[2])))
+                    if any(delta.values()) or added or removed:
+                        self.notify(MetricsDeltaEvent({
+                            'root': tree.root,
+                            'changed': sorted(p for p in changed if p in tree.nodes),
+                            'delta': delta,
+                            'total': {'files': totals.files, 'dirs': totals.dirs, 'size': totals.size},
+                        }))
+                self.flush()
+            self.notify('Stopped watching')
+        finally:
+            watcher.close()
+            self.flush()
+
+    def _watch(self, watcher, path, trees):
+        """
+        Starts watching a directory, moving to a polling watcher
+        when inotify runs out of watches
+
+        :return: the watcher in use
+        """
+        try:
+            watcher.add(path)
+        except OSError as e:
+            self.notify(f'{e.strerror}, polling instead')
+            watcher.close()
+            watcher = PollingWatcher()
+            for tree in trees:
+                for watched in tree.nodes:
+                    watcher.add(watched)
+        return watcher
+
+    @staticmethod
+    def columns_path(destiny_path, output_name=None):
+        """
+        Gets the path of the columnar store saved along an output file
+
+        :param destiny_path: the folder of the output file
+        :param output_name: the name of the output file, 'metrics' with
+            any extension by default
+        :return: the Path
+        """
+        output_name = output_name or Model.OUTPUT_NAME.format(suffix='')
+        return (Path(destiny_path) / output_name).with_suffix(Model.COLUMNS_SUFFIX)
+
+    def query_metrics(self, destiny_path, query, cutoff=None, count=QUERY_ROWS, output_name=None):
+        """
+        Answers a query over the columnar store of the last collection
+        saved in destiny_path, notifying its result as a table
+
+        :param destiny_path: the folder where the collection was saved
+        :param query: one of model.query.QUERIES
+        :param cutoff: the datetime of the older_than query
+        :param count: the number of directories or files listed
+        :param output_name: the name given to the output file of the
+            collection, by default 'metrics' with any extension
+        :return: the rows of the result, None on error
+        """
+        store_path = Model.columns_path(destiny_path, output_name)
+        if not store_path.is_dir():
+            self.notify(MvcError(f'No file records in {destiny_path}, '
+                                 f'collect them with a profile which saves them'))
+            return None
+        # NumPy and the stores are only loaded by the queries
+        from model import query as queries
+        from model.columns import ColumnStore
+        started = time.perf_counter()
+        try:
+            with ColumnStore(store_path) as store:
+                if query == queries.LARGEST_DIRS:
+                    rows = queries.largest_dirs(store, count)
+                    lines = [f'{row.size:>16} {row.files:>10}  {row.path}' for row in rows]
+                elif query == queries.EXTENSIONS_BY_MONTH:
+                    rows = queries.extensions_by_month(store)
+                    lines = [f'{row.extension or "(none)":<16} {row.month}  {row.files:>10} {row.size:>16}'
+                             for row in rows]
+                elif query == queries.OLDER_THAN:
+                    if cutoff is None:
+                        raise MvcError('The older_than query needs a date')
+                    old = queries.files_older_than(store, cutoff, count)
+                    rows = [(store.path_of(record), int(store.column('size')[record])) for record in old.oldest]
+                    lines = [f'{old.files} files, {old.size} bytes modified before {cutoff:%Y-%m-%d %H:%M}']
+                    lines.extend(f'{size:>16}  {path}' for path, size in rows)
+                else:
+                    raise MvcError(f'Unknown query: {query}')
+        except MvcError as e:
+            self.notify(e)
+            self.flush()
+            return None
+        lines.append(f'{query}: {len(rows)} rows in {time.perf_counter() - started:.3f} s')
+        self.notify('\n'.join(lines))
+        self.flush()
+        return rows
+
+    def create_layouts(self, projects_path, template_path, projects, prefix='', suffix='',
+                       when=None, hardlink_seeds=False):
+        """
+        Creates the folder layout of a template for several projects
+
+        :param projects_path: the folder where the layouts are created
+        :param template_path: the template file
+        :param projects: the project codes, without prefix and suffix
+        :param prefix: the prefix of every project code
+        :param suffix: the suffix of every project code
+        :param when: the datetime of the placeholders, now by default
+        :param hardlink_seeds: True for sharing the seed files of the
+            template between the projects as hard links
+        :return: the LayoutResult, None on error
+        """
+        result = None
+        try:
+            result = create_layouts(projects_path, template_path, projects, prefix, suffix, when,
+                                    hardlink_seeds=hardlink_seeds)
+        except MvcError as e:
+            self.notify(e)
+        except OSError as e:
+            self.notify(MvcError(f'Cannot create the layout in {projects_path}: {e.strerror}'))
+        else:
+            self.notify(f'Created the layout of {result.projects} projects in {projects_path}: '
+                        f'{result.dirs} folders, {result.files} files, {result.skipped} existing files kept')
+            if result.methods:
+                self.notify('Seed files: ' + ', '.join(f'{count} by {method}'
+                                                       for method, count in result.methods.items()))
+        self.flush()
+        return result
+
+    def _find_duplicates(self, files, workers, writer):
+        """
+        Finds the files with the same content and writes a record
+        for each set of them and another one with the summary
+
+        :param files: the (size, path, device, inode) tuples listed by the scan
+        :param workers: number of worker processes, the cpu count by default
+        :param writer: the output writer
+        :raise: CollectionCancelled if the collection is cancelled
+        :return: dict with the summary
+        """
+        def progress(stage, candidates):
+            self.notify(f'Comparing {stage} hashes of {candidates} files')
+
+        limiter = None
+        if self.max_iops or self.max_bandwidth:
+            limiter = RateLimiter(self.max_iops, self.max_bandwidth)
+        groups = find_duplicates(files, workers, self._cancel, progress, limiter)
+        summary = {'groups': len(groups), 'files': 0, 'reclaimable': 0}
+        for group in groups:
+            summary['files'] += len(group.paths)
+            summary['reclaimable'] += group.size * (len(group.paths) - 1)
+            writer.write({'type': 'duplicates', 'size': group.size,
+                          'blake2b': group.digest, 'paths': group.paths})
+        writer.write(dict(type='duplicates_total', **summary))
+        self.notify(f'{summary["files"]} files in {summary["groups"]} sets of duplicates, '
+                    f'{summary["reclaimable"]} bytes reclaimable')
+        return summary
 
 
 if __name__ == '__main__':
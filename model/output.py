@@ -0,0 +1,126 @@
+"""
+Module for writing the collected metrics while they are being collected,
+so that memory does not grow with the size of the trees and the output
+file can be read even if the collection is interrupted
+"""
+
+import json
+import time
+
+# Seconds between flushes of the output file
+FLUSH_INTERVAL = 1.0
+
+
+def dumps(record):
+    """
+    Serializes a record as a single line of compact JSON
+
+    :param record: the record dict
+    :return: the JSON line, without the line break
+    """
+    return json.dumps(record, separators=(',', ':'))
+
+
+class NdjsonWriter(object):
+    """
+    Writes one JSON record per line
+    """
+
+    def __init__(self, path):
+        """
+        Opens the output file, truncating it
+
+        :param path: the output file path
+        """
+        self.path = path
+        self.file = open(path, 'w', encoding='utf-8')
+        self.count = 0
+        self.last_flush = time.monotonic()
+
+    def write(self, record):
+        """
+        Writes a record
+
+        :param record: the record dict
+        """
+        self.write_raw(dumps(record))
+
+    def write_raw(self, line):
+        """
+        Writes an already serialized record
+
+        :param line: the JSON object, in a single line without the line break
+        """
+        self._write_line(line)
+        self.count += 1
+        now = time.monotonic()
+        if now - self.last_flush >= FLUSH_INTERVAL:
+            self.file.flush()
+            self.last_flush = now
+
+    def _write_line(self, line):
+        self.file.write(line)
+        self.file.write('\n')
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class JsonArrayWriter(NdjsonWriter):
+    """
+    Writes a JSON array with one record per line. Every line but the
+    brackets holds a whole record, so an interrupted file can still be
+    read line by line with read_records
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.file.write('[\n')
+
+    def _write_line(self, line):
+        if self.count:
+            self.file.write(',')
+        super()._write_line(line)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.write(']\n')
+        super().close()
+
+
+def open_writer(path):
+    """
+    Opens the writer matching the extension of path: NDJSON for .ndjson
+    and .jsonl files, a JSON array otherwise
+
+    :param path: the output file path
+    :return: the writer
+    """
+    if str(path).endswith(('.ndjson', '.jsonl')):
+        return NdjsonWriter(path)
+    return JsonArrayWriter(path)
+
+
+def read_records(path):
+    """
+    Reads the records of a file written by any of the writers,
+    skipping a last record cut by an interruption
+
+    :param path: the file path
+    :return: generator of record dicts
+    """
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip().lstrip(',')
+            if not line or line in ('[', ']'):
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                return
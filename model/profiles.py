@@ -0,0 +1,258 @@
+"""
+Module for the collection profiles. Each profile is a declarative definition
+which is compiled once into a visitor computing everything it asks for in a
+single pass over the entries of each directory
+"""
+
+import fnmatch
+import functools
+import hashlib
+import os
+import re
+
+from common.exceptions.exceptions import CollectionCancelled
+from model.columns import DIR, FILE, OTHER
+from model.output import dumps
+
+DEFAULT_PROFILE = 'quick'
+
+# Keys of a profile definition:
+#   stats: which metrics are computed besides file counts and byte totals,
+#       'extensions' for the extension histogram and 'mtime' for the mtime range
+#   include: globs a file name must match to be accounted, every file if empty
+#   exclude: globs of the file and directory names which are skipped entirely
+#   max_depth: how many levels below each root are walked, None for no limit
+#   hashing: True for hashing the content of every file in the same pass
+#   duplicates: True for finding the files with the same content after the scan,
+#       hashing only the ones which share their size with another file
+#   columns: True for also saving a record per file and directory in a
+#       columnar store next to the output, in the same pass, see model.columns
+#   output: 'ndjson' or 'json'
+PROFILES = {
+    'quick': {
+        'stats': ('extensions',),
+        'include': (),
+        'exclude': (),
+        'max_depth': None,
+        'hashing': False,
+        'duplicates': False,
+        'columns': False,
+        'output': 'ndjson',
+    },
+    'deep': {
+        'stats': ('extensions', 'mtime'),
+        'include': (),
+        'exclude': (),
+        'max_depth': None,
+        'hashing': True,
+        'duplicates': False,
+        'columns': True,
+        'output': 'ndjson',
+    },
+    'sources': {
+        'stats': ('extensions', 'mtime'),
+        'include': ('*.py', '*.c', '*.h', '*.cpp', '*.java', '*.js', '*.ts', '*.go', '*.rs'),
+        'exclude': ('.git', '.hg', '.svn', '__pycache__', 'node_modules', '.venv', 'venv'),
+        'max_depth': None,
+        'hashing': False,
+        'duplicates': False,
+        'columns': False,
+        'output': 'ndjson',
+    },
+    'shallow': {
+        'stats': ('extensions',),
+        'include': (),
+        'exclude': (),
+        'max_depth': 2,
+        'hashing': False,
+        'duplicates': False,
+        'columns': False,
+        'output': 'json',
+    },
+    'duplicates': {
+        'stats': ('extensions',),
+        'include': (),
+        'exclude': ('.git', '.hg', '.svn'),
+        'max_depth': None,
+        'hashing': False,
+        'duplicates': True,
+        'columns': False,
+        'output': 'ndjson',
+    },
+}
+
+OUTPUT_SUFFIXES = {'ndjson': '.ndjson', 'json': '.json'}
+
+# Size of the buffer reused for hashing file contents
+HASH_BUFFER_SIZE = 1 << 20
+# Buffers hashed between checks for cancellation, so a large file stops within 16 MiB
+HASH_CANCEL_BUFFERS = 16
+
+
+def glob_matcher(globs):
+    """
+    Compiles several globs into a single regular expression
+
+    :param globs: the globs
+    :return: callable telling whether a name matches any glob, None if there are no globs
+    """
+    if not globs:
+        return None
+    return re.compile('|'.join(fnmatch.translate(g) for g in globs)).match
+
+
+def hash_file(path, buffer, cancel=None):
+    """
+    Hashes the whole content of a file reusing a buffer
+
+    :param path: the file path
+    :param buffer: the bytearray used for reading
+    :param cancel: optional event for cancelling the collection, checked
+        every HASH_CANCEL_BUFFERS buffers
+    :raise: CollectionCancelled if cancel is set
+    :return: the hexadecimal blake2b digest
+    """
+    digest = hashlib.blake2b()
+    view = memoryview(buffer)
+    buffers = 0
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            digest.update(view[:read])
+            buffers += 1
+            if cancel is not None and buffers % HASH_CANCEL_BUFFERS == 0 and cancel.is_set():
+                raise CollectionCancelled()
+    return digest.hexdigest()
+
+
+class Visitor(object):
+    """
+    A compiled profile. Its scan_dir lists a directory once, applying the
+    filters and computing every requested stat for each entry
+    """
+
+    def __init__(self, name, definition):
+        self.name = name
+        self.definition = definition
+        self.max_depth = definition['max_depth']
+        self.hashing = definition['hashing']
+        self.duplicates = definition['duplicates']
+        self.columns = definition['columns']
+        self.suffix = OUTPUT_SUFFIXES[definition['output']]
+        self.scan_dir = self._compile()
+
+    def _compile(self):
+        """
+        Builds the scan_dir function of this profile, with the options
+        bound as locals so that nothing is looked up per entry
+
+        :return: the function
+        """
+        include = glob_matcher(self.definition['include'])
+        exclude = glob_matcher(self.definition['exclude'])
+        stats = self.definition['stats']
+        extensions = 'extensions' in stats
+        mtimes = 'mtime' in stats
+        max_depth = self.max_depth
+        hashing = self.hashing
+        buffer = bytearray(HASH_BUFFER_SIZE) if hashing else None
+        splitext = os.path.splitext
+        sep = os.sep
+
+        def scan_dir(path, base, metrics, subdirs, emit=None, files=None, columns=None, cancel=None):
+            """
+            Scans the direct entries of a directory, without recursing
+
+            :param path: the directory path
+            :param base: the number of separators in the root path
+            :param metrics: the metrics where files and subdirectories are accounted
+            :param subdirs: list where the subdirectory paths to walk are appended
+            :param emit: optional callable receiving the JSON line of each hashed file
+            :param files: optional list where (size, path, device, inode) tuples
+                of the regular files are appended
+            :param columns: optional TreeColumns where a record of each
+                file and subdirectory is added
+            :param cancel: optional event for cancelling the collection while hashing
+            :raise: CollectionCancelled if cancel is set while hashing a file
+            """
+            # The filesystem root is the only path ending with a separator
+            level = path.rstrip(sep).count(sep) - base
+            descend = max_depth is None or level < max_depth
+            if columns is not None:
+                add_record = columns.add
+                parent = columns.parent_of(path)
+                level += 1
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        name = entry.name
+                        if exclude is not None and exclude(name):
+                            continue
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                metrics.dirs += 1
+                                if columns is not None:
+                                    try:
+                                        st = entry.stat(follow_symlinks=False)
+                                        record = add_record(name, parent, level, DIR, 0,
+                                                            st.st_mtime_ns, st.st_ino)
+                                    except OSError:
+                                        record = add_record(name, parent, level, DIR, 0, 0, 0)
+                                    if descend:
+                                        columns.pending[entry.path] = record
+                                if descend:
+                                    subdirs.append(entry.path)
+                                continue
+                            if include is not None and not include(name):
+                                continue
+                            st = entry.stat(follow_symlinks=False)
+                            size = st.st_size
+                            metrics.files += 1
+                            metrics.size += size
+                            if extensions:
+                                ext = splitext(name)[1].lower()
+                                metrics.ext_files[ext] += 1
+                                metrics.ext_size[ext] += size
+                            if mtimes:
+                                metrics.add_mtime(st.st_mtime)
+                            if hashing and emit is not None and entry.is_file(follow_symlinks=False):
+                                emit(file_record(entry.path, size, hash_file(entry.path, buffer, cancel)))
+                            if files is not None and entry.is_file(follow_symlinks=False):
+                                files.append((size, entry.path, st.st_dev, st.st_ino))
+                            if columns is not None:
+                                add_record(name, parent, level,
+                                           FILE if entry.is_file(follow_symlinks=False) else OTHER,
+                                           size, st.st_mtime_ns, st.st_ino)
+                        except OSError:
+                            metrics.errors += 1
+            except OSError:
+                metrics.errors += 1
+
+        return scan_dir
+
+
+def file_record(path, size, digest):
+    """
+    Serializes the record of a hashed file
+
+    :param path: the file path
+    :param size: the file size
+    :param digest: the content hash
+    :return: the JSON line
+    """
+    return dumps({'type': 'file', 'path': path, 'size': size, 'blake2b': digest})
+
+
+@functools.lru_cache(maxsize=None)
+def compile_profile(name):
+    """
+    Compiles a profile, only once per process
+
+    :param name: the name of the profile, the default one if empty
+    :raise: KeyError if there is no such profile
+    :return: the Visitor
+    """
+    name = name or DEFAULT_PROFILE
+    return Visitor(name, PROFILES[name])
@@ -0,0 +1,200 @@
+"""
+Module for querying the columnar stores of the collections, see
+model.columns. Every query works on whole columns with NumPy, grouping
+with bincount and picking the largest values with argpartition, so that
+stores with millions of records are answered without Python loops
+"""
+
+import datetime as dt
+from collections import namedtuple
+
+from common import deputils
+from common.exceptions.exceptions import MvcError
+from model.columns import DIR, FILE
+
+# Only imported by the first query, it costs more than the rest of the startup
+numpy = deputils.lazy_import('numpy')
+
+# Extensions are compared by their first bytes, dot included, a multiple of 8
+EXTENSION_WIDTH = 16
+DOT = ord('.')
+DAY_NS = 86400 * 10 ** 9
+
+# Names of the queries the views offer
+LARGEST_DIRS = 'largest_dirs'
+EXTENSIONS_BY_MONTH = 'extensions_by_month'
+OLDER_THAN = 'older_than'
+QUERIES = (LARGEST_DIRS, EXTENSIONS_BY_MONTH, OLDER_THAN)
+
+DirSize = namedtuple('DirSize', 'path files size')
+ExtensionMonth = namedtuple('ExtensionMonth', 'extension month files size')
+OldFiles = namedtuple('OldFiles', 'records oldest files size')
+
+
+def _require_numpy():
+    try:
+        numpy.ndarray
+    except ModuleNotFoundError:
+        raise MvcError('Queries need NumPy, please install it with: pip install numpy')
+
+
+def to_ns(when):
+    """
+    Converts a datetime, like the ones of DatetimePicker, to
+    nanoseconds since the epoch. Naive datetimes are local time
+
+    :param when: the datetime
+    :return: the nanoseconds
+    """
+    return int(when.timestamp()) * 10 ** 9 + when.microsecond * 1000
+
+
+def subtree_totals(store):
+    """
+    Computes the files and bytes below every directory. The entries are
+    added to their directory with bincount, then the directories are added
+    to the one above them a level at a time, deepest first
+
+    :param store: the ColumnStore
+    :return: (files, bytes) tuple of arrays by record, only meaningful for directories
+    """
+    _require_numpy()
+    kind = store.column('kind')
+    parent = store.column('parent')
+    count = len(store)
+    # The roots are counted in an extra slot which is dropped
+    owners = numpy.where(parent >= 0, parent, count)
+    files = numpy.bincount(owners, weights=kind == FILE, minlength=count + 1)[:count]
+    sizes = numpy.bincount(owners, weights=store.column('size'), minlength=count + 1)[:count]
+
+    dirs = numpy.flatnonzero(kind == DIR)
+    depth = store.column('depth')[dirs]
+    dirs = dirs[numpy.argsort(depth, kind='stable')]
+    ends = numpy.cumsum(numpy.bincount(depth))
+    for level in range(len(ends) - 1, 0, -1):
+        records = dirs[ends[level - 1]:ends[level]]
+        numpy.add.at(files, parent[records], files[records])
+        numpy.add.at(sizes, parent[records], sizes[records])
+    return files.astype(numpy.int64), numpy.rint(sizes).astype(numpy.int64)
+
+
+def largest_dirs(store, count=100):
+    """
+    Finds the directories holding the most bytes
+
+    :param store: the ColumnStore
+    :param count: the number of directories
+    :return: list of DirSize, largest first
+    """
+    files, sizes = subtree_totals(store)
+    dirs = numpy.flatnonzero(store.column('kind') == DIR)
+    if count < len(dirs):
+        dirs = dirs[numpy.argpartition(-sizes[dirs], count)[:count]]
+    dirs = dirs[numpy.argsort(-sizes[dirs], kind='stable')]
+    return [DirSize(store.path_of(record), int(files[record]), int(sizes[record])) for record in dirs]
+
+
+def name_extensions(store):
+    """
+    Gets the extension of every distinct name like os.path.splitext, lower
+    cased and cut to EXTENSION_WIDTH bytes, finding the dots in the blob of names
+
+    :param store: the ColumnStore
+    :return: (codes, extensions) tuple, codes has the number of the extension
+        of each name and extensions the bytes of each one
+    """
+    _require_numpy()
+    offsets = store.name_offsets
+    starts = numpy.asarray(offsets[:-1], dtype=numpy.int64)
+    ends = numpy.asarray(offsets[1:], dtype=numpy.int64)
+    blob = numpy.frombuffer(store.blob, dtype=numpy.uint8)
+    is_dot = blob == DOT
+    dots = numpy.flatnonzero(is_dot)
+    # Last dot before the end of each name, and whether it is inside the name
+    last = numpy.searchsorted(dots, ends) - 1
+    last_dot = numpy.where(last >= 0, dots[numpy.maximum(last, 0)], -1)
+    # Leading dots do not start an extension, there must be another byte before
+    not_dots = numpy.concatenate(([0], numpy.cumsum(~is_dot, dtype=numpy.int32)))
+    has_ext = (last_dot >= starts) & (not_dots[numpy.maximum(last_dot, 0)] > not_dots[starts])
+
+    width = numpy.arange(EXTENSION_WIDTH)
+    positions = numpy.where(has_ext, last_dot, ends)[:, None] + width
+    # Positions past the end of the name read the zero appended to the blob
+    padded = numpy.append(blob, numpy.uint8(0))
+    chars = padded[numpy.where(positions < ends[:, None], positions, len(blob))]
+    upper = (chars >= ord('A')) & (chars <= ord('Z'))
+    chars[upper] += ord('a') - ord('A')
+
+    # Sorting the extensions as pairs of integers is faster than as strings
+    words = chars.view(numpy.uint64)
+    order = numpy.lexsort(words.T[::-1])
+    ordered = words[order]
+    first = numpy.ones(len(order), dtype=bool)
+    first[1:] = (ordered[1:] != ordered[:-1]).any(axis=1)
+    codes = numpy.empty(len(order), dtype=numpy.int64)
+    codes[order] = numpy.cumsum(first) - 1
+    return codes, chars[order[first]].view(f'S{EXTENSION_WIDTH}').ravel()
+
+
+def extensions_by_month(store):
+    """
+    Counts the files and bytes of each extension by month of modification, in UTC
+
+    :param store: the ColumnStore
+    :return: list of ExtensionMonth, sorted by extension and month
+    """
+    _require_numpy()
+    files = numpy.flatnonzero(store.column('kind') == FILE)
+    if not len(files):
+        return []
+    codes, extensions = name_extensions(store)
+    ext = codes[store.column('name')[files]]
+    # Converting the few distinct days is faster than converting every mtime
+    days = store.column('mtime_ns')[files] // DAY_NS
+    first_day = days.min()
+    day_months = numpy.arange(first_day, days.max() + 1).astype('datetime64[D]').astype('datetime64[M]')
+    months = day_months.astype(numpy.int64)[days - first_day]
+    first = months.min()
+    span = int(months.max() - first) + 1
+    keys = ext * span + (months - first)
+    size = len(extensions) * span
+    counts = numpy.bincount(keys, minlength=size)
+    sizes = numpy.bincount(keys, weights=store.column('size')[files], minlength=size)
+    return sorted(ExtensionMonth(extensions[key // span].decode('utf-8', 'replace'),
+                                 str(numpy.datetime64(int(first + key % span), 'M')),
+                                 int(counts[key]), int(sizes[key]))
+                  for key in numpy.flatnonzero(counts))
+
+
+def files_older_than(store, cutoff, count=100):
+    """
+    Finds the files last modified before a datetime
+
+    :param store: the ColumnStore
+    :param cutoff: the datetime, like the ones of DatetimePicker
+    :param count: the number of oldest files sorted
+    :return: OldFiles with the record numbers of all of them in store
+        order, the ones of the oldest sorted, their count and their bytes
+    """
+    _require_numpy()
+    mtimes = store.column('mtime_ns')
+    old = (store.column('kind') == FILE) & (mtimes < to_ns(cutoff))
+    records = numpy.flatnonzero(old)
+    oldest = records
+    if count < len(records):
+        oldest = records[numpy.argpartition(mtimes[records], count)[:count]]
+    oldest = oldest[numpy.argsort(mtimes[oldest], kind='stable')]
+    return OldFiles(records, oldest, len(records), int(store.column('size')[old].sum()))
+
+
+if __name__ == '__main__':
+    import sys
+    from model.columns import ColumnStore
+
+    with ColumnStore(sys.argv[1]) as store:
+        for row in largest_dirs(store, 10):
+            print(row)
+        for row in extensions_by_month(store)[:20]:
+            print(row)
+        old = files_older_than(store, dt.datetime.now() - dt.timedelta(days=365))
+        print(old.files, 'files older than a year,', old.size, 'bytes')
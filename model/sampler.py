@@ -0,0 +1,180 @@
+"""
+Module for sampling the usage of the system and of this process while a
+collection runs. Samples are staged in a fixed size ring buffer and published
+in batches through the model events, the views keep the history they show
+"""
+
+import threading
+import time
+from array import array
+
+from common import deputils
+from common.events.events import SamplesEvent
+
+# Only imported once sampling starts, not with the model
+psutil = deputils.lazy_import('psutil')
+
+
+# Values of each sample, times are seconds since the epoch, rates are bytes
+# per second and proc_* are the sums of this process and its children
+COLUMNS = ('time', 'cpu', 'memory', 'read_rate', 'write_rate', 'proc_cpu', 'proc_rss')
+
+
+class SampleRing(object):
+    """
+    Fixed capacity table of samples, with one preallocated array of doubles
+    per column. Appending is O(1) and overwrites the oldest sample when full
+    """
+
+    def __init__(self, capacity, columns=COLUMNS):
+        self.capacity = capacity
+        self.columns = columns
+        self.data = [array('d', bytes(8 * capacity)) for __ in columns]
+        self.count = 0
+        self.total = 0
+
+    def append(self, row):
+        """
+        Stores a sample
+
+        :param row: the values, in the order of the columns
+        """
+        pos = self.total % self.capacity
+        for column, value in zip(self.data, row):
+            column[pos] = value
+        self.total += 1
+        if self.count < self.capacity:
+            self.count += 1
+
+    def clear(self):
+        self.count = 0
+        self.total = 0
+
+    def __len__(self):
+        return self.count
+
+
+class Sampler(object):
+    """
+    Background thread which samples the system at a fixed interval
+    """
+    DEFAULT_INTERVAL = 1.0
+    # Samples published together in each SamplesEvent
+    DEFAULT_BATCH = 5
+
+    def __init__(self, publish, interval=DEFAULT_INTERVAL, batch=DEFAULT_BATCH):
+        """
+        Initializes this sampler
+
+        :param publish: callable receiving each SamplesEvent, usually Model.notify
+        :param interval: seconds between samples
+        :param batch: number of samples published in each event, and kept until then
+        """
+        self.publish = publish
+        self.interval = interval
+        self.batch = batch
+        self.ring = SampleRing(batch)
+        self.pending = []
+        self.stopped = threading.Event()
+        self.thread = None
+        self.process = None
+        self.children = {}
+        self.last_io = None
+
+    def start(self):
+        """
+        Starts sampling, if it is not already running
+        """
+        if self.thread is not None:
+            return
+        self.stopped.clear()
+        self.process = psutil.Process()
+        self.process.cpu_percent()
+        psutil.cpu_percent()
+        self.last_io = (time.monotonic(), psutil.disk_io_counters())
+        self.thread = threading.Thread(target=self._run, name='sampler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops sampling and publishes the samples not published yet
+        """
+        if self.thread is None:
+            return
+        self.stopped.set()
+        self.thread.join()
+        self.thread = None
+        self._publish()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.ring.append(self.sample())
+            self.pending.append(self.ring.total - 1)
+            if len(self.pending) >= self.batch:
+                self._publish()
+
+    def _publish(self):
+        """
+        Publishes the pending samples as rows of a single event
+        """
+        if not self.pending:
+            return
+        first = self.pending[0]
+        self.pending = []
+        newest = self.ring.total
+        first = max(first, newest - self.ring.count)
+        rows = [tuple(column[idx % self.ring.capacity] for column in self.ring.data)
+                for idx in range(first, newest)]
+        self.publish(SamplesEvent({'columns': self.ring.columns, 'rows': rows}))
+
+    def sample(self):
+        """
+        Takes a sample of the system and of this process and its children
+
+        :return: the values, in the order of COLUMNS
+        """
+        now = time.monotonic()
+        io = psutil.disk_io_counters()
+        last_time, last_io = self.last_io
+        self.last_io = (now, io)
+        elapsed = max(now - last_time, 1e-6)
+        if io is not None and last_io is not None:
+            read_rate = (io.read_bytes - last_io.read_bytes) / elapsed
+            write_rate = (io.write_bytes - last_io.write_bytes) / elapsed
+        else:
+            read_rate = write_rate = 0.0
+
+        proc_cpu, proc_rss = self._process_usage(self.process)
+        children = {}
+        for child in self.process.children(recursive=True):
+            # The same Process objects are kept so that cpu_percent has a previous reading
+            child = self.children.get(child.pid, child)
+            children[child.pid] = child
+            cpu, rss = self._process_usage(child)
+            proc_cpu += cpu
+            proc_rss += rss
+        self.children = children
+
+        return (time.time(), psutil.cpu_percent(), psutil.virtual_memory().percent,
+                read_rate, write_rate, proc_cpu, proc_rss)
+
+    @staticmethod
+    def _process_usage(process):
+        """
+        Gets the cpu percent and resident memory of a process
+
+        :param process: the psutil Process
+        :return: (cpu percent, rss bytes) tuple, zeros if it has exited
+        """
+        try:
+            with process.oneshot():
+                return process.cpu_percent(), process.memory_info().rss
+        except psutil.Error:
+            return 0.0, 0
+
+
+if __name__ == '__main__':
+    sampler = Sampler(lambda e: print(e.info['rows']), interval=0.2)
+    sampler.start()
+    time.sleep(2)
+    sampler.stop()
@@ -0,0 +1,625 @@
+"""
+Module for walking directory trees and computing their metrics
+"""
+
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter, deque, namedtuple
+from contextlib import ExitStack
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from common import instrumentation
+from common.exceptions.exceptions import CollectionCancelled
+from model.columns import COLUMNS_PART_SUFFIX, ColumnWriter, TreeColumns
+from model.index import MetricsIndex
+from model.iosched import AdaptiveLimit, RateLimiter, group_by_device
+from model.output import dumps
+from model.profiles import DEFAULT_PROFILE, compile_profile
+
+# How many tasks per worker we try to get when splitting the trees
+TASKS_PER_WORKER = 4
+# Upper bound for the directories expanded in the main process while splitting
+MAX_SPLIT_EXPANSIONS = 1024
+# How many more tasks we try to get when the rate is capped
+LIMITED_SPLIT = 4
+# Seconds between checks for cancellation while waiting for the workers
+CANCEL_POLL_INTERVAL = 0.02
+
+# Cancel event of a worker process, set by init_worker
+worker_cancel = None
+
+
+class Metrics(object):
+    """
+    Aggregated metrics of a set of files and directories
+    """
+
+    def __init__(self, files=0, dirs=0, size=0, errors=0,
+                 ext_files=None, ext_size=None, mtime_min=None, mtime_max=None):
+        self.files = files
+        self.dirs = dirs
+        self.size = size
+        self.errors = errors
+        self.ext_files = Counter(ext_files or {})
+        self.ext_size = Counter(ext_size or {})
+        self.mtime_min = mtime_min
+        self.mtime_max = mtime_max
+
+    def add_file(self, name, size):
+        """
+        Accounts for a single file
+
+        :param name: the file name, used for the extension histogram
+        :param size: the file size in bytes
+        """
+        ext = os.path.splitext(name)[1].lower()
+        self.files += 1
+        self.size += size
+        self.ext_files[ext] += 1
+        self.ext_size[ext] += size
+
+    def add_mtime(self, mtime):
+        """
+        Widens the mtime range with the mtime of a file
+
+        :param mtime: the mtime, in seconds since the epoch
+        """
+        if self.mtime_min is None or mtime < self.mtime_min:
+            self.mtime_min = mtime
+        if self.mtime_max is None or mtime > self.mtime_max:
+            self.mtime_max = mtime
+
+    def merge(self, other):
+        """
+        Adds the metrics of other into these ones
+
+        :param other: the other metrics
+        :return: self, for chaining
+        """
+        self.files += other.files
+        self.dirs += other.dirs
+        self.size += other.size
+        self.errors += other.errors
+        self.ext_files.update(other.ext_files)
+        self.ext_size.update(other.ext_size)
+        if other.mtime_min is not None:
+            self.add_mtime(other.mtime_min)
+            self.add_mtime(other.mtime_max)
+        return self
+
+    def subtract(self, other):
+        """
+        Removes the metrics of other, which must be part of these ones. The
+        mtime range is kept, it cannot be narrowed without every other mtime
+
+        :param other: the other metrics
+        :return: self, for chaining
+        """
+        self.files -= other.files
+        self.dirs -= other.dirs
+        self.size -= other.size
+        self.errors -= other.errors
+        self.ext_files.subtract(other.ext_files)
+        self.ext_size.subtract(other.ext_size)
+        self.ext_files = +self.ext_files
+        self.ext_size = Counter({ext: size for ext, size in self.ext_size.items()
+                                 if ext in self.ext_files})
+        return self
+
+    def to_json(self):
+        """
+        Returns these metrics as a compact JSON string
+
+        :return: the string
+        """
+        return json.dumps([self.files, self.dirs, self.size, self.errors,
+                           {ext: [count, self.ext_size[ext]] for ext, count in self.ext_files.items()},
+                           self.mtime_min, self.mtime_max],
+                          separators=(',', ':'))
+
+    @staticmethod
+    def from_json(raw):
+        """
+        Builds metrics from a string returned by to_json
+
+        :param raw: the string
+        :return: the metrics
+        """
+        files, dirs, size, errors, extensions, *mtimes = json.loads(raw)
+        return Metrics(files, dirs, size, errors,
+                       {ext: v[0] for ext, v in extensions.items()},
+                       {ext: v[1] for ext, v in extensions.items()},
+                       *mtimes)
+
+    def to_dict(self):
+        """
+        Returns these metrics as a JSON serializable dict
+
+        :return: the dict
+        """
+        return {
+            'files': self.files,
+            'dirs': self.dirs,
+            'size': self.size,
+            'errors': self.errors,
+            'extensions': {ext: {'files': count, 'size': self.ext_size[ext]}
+                           for ext, count in self.ext_files.most_common()},
+            'mtime_min': self.mtime_min,
+            'mtime_max': self.mtime_max,
+        }
+
+
+def init_worker(cancel):
+    """
+    Initializes a worker process
+
+    :param cancel: the event set for cancelling the collection
+    """
+    global worker_cancel
+    worker_cancel = cancel
+
+
+def check_cancel(cancel):
+    """
+    Stops the collection if it has been cancelled
+
+    :param cancel: the cancel event, or None
+    :raise: CollectionCancelled if the event is set
+    """
+    if cancel is not None and cancel.is_set():
+        raise CollectionCancelled()
+
+
+def dir_record(path, files, dirs, size):
+    """
+    Serializes the record of the direct entries of a directory
+
+    :param path: the directory path
+    :param files: the number of files directly inside
+    :param dirs: the number of subdirectories
+    :param size: the bytes of the files directly inside
+    :return: the JSON line
+    """
+    return dumps({'type': 'dir', 'path': path, 'files': files, 'dirs': dirs, 'size': size})
+
+
+class DirVisit(object):
+    """
+    A directory visited by an incremental scan. When its mtime matches the
+    indexed one, its entries are not listed again and the indexed ones are used
+    """
+
+    def __init__(self, path, mtime_ns, direct, subdirs, cached=None):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.direct = direct
+        self.subdirs = subdirs
+        self.cached = cached
+        self.removed = []
+        self.dirty = True
+        self._tree = None
+        # While walking, the visit of the parent and the resolved subdirectories
+        self.parent = None
+        self.children = {}
+        if direct is not None and cached is not None:
+            names = {os.path.basename(p) for p in subdirs}
+            self.removed = [os.path.join(path, n) for n in cached.subdirs if n not in names]
+
+    @property
+    def tree(self):
+        """
+        The metrics of the whole subtree, parsed from the index only if needed
+        """
+        if self._tree is None:
+            self._tree = Metrics.from_json(self.cached.tree)
+        return self._tree
+
+    def resolve(self, children):
+        """
+        Computes the subtree metrics from the already resolved children
+
+        :param children: mapping of path to resolved DirVisit or TreeResult
+        """
+        resolved = [children[p] for p in self.subdirs]
+        self.dirty = self.direct is not None or any(c.dirty for c in resolved)
+        if self.dirty:
+            if self.direct is None:
+                self.direct = Metrics.from_json(self.cached.direct)
+            self._tree = Metrics().merge(self.direct)
+            for child in resolved:
+                self._tree.merge(child.tree)
+
+    def to_record(self):
+        """
+        Returns the output record for this directory
+
+        :return: the JSON line
+        """
+        direct = self.direct if self.direct is not None else Metrics.from_json(self.cached.direct)
+        return dir_record(self.path, direct.files, direct.dirs, direct.size)
+
+    def to_row(self):
+        """
+        Returns the index row for this directory
+
+        :return: (path, mtime_ns, subdirs, direct, tree) tuple
+        """
+        names = [os.path.basename(p) for p in self.subdirs]
+        return (self.path, self.mtime_ns, json.dumps(names),
+                self.direct.to_json(), self.tree.to_json())
+
+
+# ops counts the directories stated or listed and the entries of the listed ones
+TreeResult = namedtuple('TreeResult', 'tree dirty rows removed ops')
+
+
+def root_base(root):
+    """
+    Gets the number of separators in a root path, the depth of a directory
+    below it is its own number minus this one. Both are counted without the
+    trailing separator of the filesystem root, so that the children of '/'
+    are at depth 1 like the children of any other root
+
+    :param root: the root path
+    :return: the number of separators
+    """
+    return root.rstrip(os.sep).count(os.sep)
+
+
+def visit_dir(path, index, visitor, base, cancel=None):
+    """
+    Visits a directory, listing its entries only if its mtime
+    differs from the indexed one
+
+    :param path: the directory path
+    :param index: the MetricsIndex
+    :param visitor: the compiled profile
+    :param base: the number of separators in the root path
+    :param cancel: optional event for cancelling the collection
+    :return: the DirVisit
+    """
+    check_cancel(cancel)
+    cached = index.get(path)
+    try:
+        mtime_ns = os.stat(path, follow_symlinks=False).st_mtime_ns
+    except OSError:
+        return DirVisit(path, 0, Metrics(errors=1), [], cached)
+
+    if cached is not None and cached.mtime_ns == mtime_ns:
+        return DirVisit(path, mtime_ns, None,
+                        [os.path.join(path, n) for n in cached.subdirs], cached)
+
+    direct = Metrics()
+    subdirs = []
+    visitor.scan_dir(path, base, direct, subdirs)
+    return DirVisit(path, mtime_ns, direct, subdirs, cached)
+
+
+def resolve_visits(visits, children):
+    """
+    Resolves the visits bottom up collecting the index changes
+
+    :param visits: the visits in the order they were done
+    :param children: mapping of path to already resolved subtrees
+    :return: tuple with the rows to store and the paths to forget
+    """
+    rows = []
+    removed = []
+    for visit in reversed(visits):
+        visit.resolve(children)
+        if visit.dirty:
+            rows.append(visit.to_row())
+            removed.extend(visit.removed)
+        children[visit.path] = visit
+    return rows, removed
+
+
+def resolve_up(visit, rows, removed):
+    """
+    Resolves a visit whose subdirectories are all resolved, and then every
+    ancestor left with all of them resolved, collecting the index changes.
+    The resolved children are dropped so that only the visits of the
+    directories still being walked are kept
+
+    :param visit: the DirVisit
+    :param rows: list where the rows to store are appended
+    :param removed: list where the paths to forget are appended
+    :return: the root visit once the whole tree is resolved, None otherwise
+    """
+    while len(visit.children) == len(visit.subdirs):
+        visit.resolve(visit.children)
+        visit.children = None
+        if visit.dirty:
+            rows.append(visit.to_row())
+            removed.extend(visit.removed)
+        parent, visit.parent = visit.parent, None
+        if parent is None:
+            return visit
+        parent.children[visit.path] = visit
+        visit = parent
+    return None
+
+
+def scan_tree(path, index_path=None, index=None, emit=None, cancel=None,
+              profile=DEFAULT_PROFILE, base=None, columns=None, files=None):
+    """
+    Walks a whole directory tree computing its metrics. With an index,
+    the directories whose mtime did not change are not listed again
+
+    Only the mtime of the directories is checked, so files whose size changed
+    in place are not noticed until their directory changes
+
+    :param path: the root of the tree
+    :param index_path: the path of the MetricsIndex, used in worker processes
+    :param index: the MetricsIndex, used in the main process
+    :param emit: optional callable receiving the JSON line of every directory,
+        and of every file if the profile hashes them
+    :param cancel: optional event for cancelling the collection
+    :param profile: the name of the profile
+    :param base: the number of separators in the root path, the ones of path by default
+    :param columns: optional TreeColumns where the records of the entries
+        are added, only for full scans
+    :param files: optional list where (size, path, device, inode) tuples of
+        the regular files are appended, only for full scans
+    :raise: CollectionCancelled if cancel is set
+    :return: the TreeResult, whose metrics include the entries of path
+        but not path itself
+    """
+    if index is None and index_path is not None:
+        index = MetricsIndex.shared(index_path)
+    visitor = compile_profile(profile)
+    if base is None:
+        base = root_base(path)
+
+    if index is None:
+        metrics = Metrics()
+        stack = [path]
+        listed = 0
+        while stack:
+            check_cancel(cancel)
+            current = stack.pop()
+            listed += 1
+            if emit is None:
+                visitor.scan_dir(current, base, metrics, stack, files=files, columns=columns)
+            else:
+                counts = metrics.files, metrics.dirs, metrics.size
+                visitor.scan_dir(current, base, metrics, stack, emit, files, columns, cancel)
+                emit(dir_record(current, metrics.files - counts[0], metrics.dirs - counts[1],
+                                metrics.size - counts[2]))
+        return TreeResult(metrics, True, [], [], listed + metrics.files + metrics.dirs)
+
+    rows = []
+    removed = []
+    ops = 0
+    root = None
+    stack = [(path, None)]
+    while stack:
+        current, parent = stack.pop()
+        visit = visit_dir(current, index, visitor, base, cancel)
+        visit.parent = parent
+        ops += 1 if visit.direct is None else 1 + visit.direct.files + visit.direct.dirs
+        if emit is not None:
+            emit(visit.to_record())
+        stack.extend((sub, visit) for sub in visit.subdirs)
+        root = resolve_up(visit, rows, removed) or root
+    return TreeResult(root.tree, root.dirty, rows, removed, ops)
+
+
+def split_tasks(roots, min_tasks, visitor, index=None, cancel=None, emit=None, columns=None,
+                files=None):
+    """
+    Expands the roots breadth first until there are enough subtrees
+    to keep every worker busy
+
+    :param roots: the root paths
+    :param min_tasks: the number of subtrees we want
+    :param visitor: the compiled profile
+    :param index: the MetricsIndex, None for a full scan
+    :param cancel: optional event for cancelling the collection
+    :param emit: optional callable receiving the JSON line of each hashed file
+    :param columns: optional TreeColumns where the records of the entries
+        are added, only for full scans
+    :param files: optional list where the regular files are appended, only for full scans
+    :return: tuple with the list of (root index, subtree path) tasks and the
+        list of visits done while expanding
+    """
+    pending = deque((idx, root) for idx, root in enumerate(roots))
+    bases = [root_base(root) for root in roots]
+    visits = []
+    while pending and len(pending) < min_tasks and len(visits) < MAX_SPLIT_EXPANSIONS:
+        idx, path = pending.popleft()
+        if index is None:
+            check_cancel(cancel)
+            visit = DirVisit(path, None, Metrics(), [])
+            visitor.scan_dir(path, bases[idx], visit.direct, visit.subdirs, emit, files, columns, cancel)
+        else:
+            visit = visit_dir(path, index, visitor, bases[idx], cancel)
+        visits.append(visit)
+        pending.extend((idx, sub) for sub in visit.subdirs)
+    return list(pending), visits
+
+
+# What a worker sends back for a subtree: its TreeResult, the paths of its
+# part file of records and of its part column store, and its list of
+# regular files, each one None when not asked for
+TaskOutput = namedtuple('TaskOutput', 'result part columns files')
+
+
+def scan_task(path, index_path=None, parts_dir=None, profile=DEFAULT_PROFILE, base=None,
+              columns_dir=None, list_files=False):
+    """
+    Scans a subtree in a worker process, writing the directory records
+    and the column records to part files so that they are not kept in memory
+
+    :param path: the root of the subtree
+    :param index_path: the path of the MetricsIndex, None for a full scan
+    :param parts_dir: folder for the part file, None for not writing records
+    :param profile: the name of the profile
+    :param base: the number of separators in the root path
+    :param columns_dir: folder for the part column store, None for not saving columns
+    :param list_files: True for sending back the (size, path, device, inode)
+        tuples of the regular files
+    :return: the TaskOutput
+    """
+    emit = part = columns = columns_part = None
+    files = [] if list_files else None
+    with ExitStack() as stack:
+        if parts_dir is not None:
+            part_file = stack.enter_context(tempfile.NamedTemporaryFile(
+                'w', encoding='utf-8', dir=parts_dir, suffix='.ndjson', delete=False))
+            part = part_file.name
+            emit = lambda line: part_file.write(line + '\n')
+        if columns_dir is not None:
+            columns_part = tempfile.mkdtemp(suffix=COLUMNS_PART_SUFFIX, dir=columns_dir)
+            columns = TreeColumns(stack.enter_context(ColumnWriter(columns_part)))
+        result = scan_tree(path, index_path, emit=emit, cancel=worker_cancel,
+                           profile=profile, base=base, columns=columns, files=files)
+    return TaskOutput(result, part, columns_part, files)
+
+
+def scan_roots(roots, workers=None, index=None, progress=None, emit=None,
+               parts_dir=None, cancel=None, profile=DEFAULT_PROFILE, iops=None, bandwidth=None,
+               columns=None, files=None):
+    """
+    Computes the metrics of several directory trees spreading their
+    subtrees over a process pool per device. The subtrees scanned at
+    once on each device adapt to how it copes with them, see model.iosched
+
+    :param roots: the root paths
+    :param workers: number of worker processes, the cpu count by default
+    :param index: the MetricsIndex updated with the changed directories,
+        None for a full scan
+    :param progress: optional callable receiving (root index, path, metrics)
+        as each subtree is done
+    :param emit: optional callable receiving the JSON line of every directory,
+        and of every file if the profile hashes them, as soon as its subtree is done
+    :param parts_dir: folder for the temporary files of the workers,
+        the system one by default
+    :param cancel: optional event for cancelling the collection, the workers
+        stop after the directory they are listing
+    :param profile: the name of the profile, compiled once in each process
+    :param iops: optional cap of the directories and entries stated per second
+    :param bandwidth: optional cap of the bytes per second read by hashing profiles
+    :param columns: optional TreeColumns where a record of every root, file and
+        directory is added, only for full scans. The workers write theirs to
+        part stores which are appended as their subtrees are done
+    :param files: optional list where the (size, path, device, inode) tuples
+        of the regular files are appended, only for full scans
+    :raise: CollectionCancelled if cancel is set, the index is left untouched
+    :return: list with the metrics of each root
+    """
+    workers = workers or os.cpu_count() or 1
+    visitor = compile_profile(profile)
+    bases = [root_base(root) for root in roots]
+    limiter = RateLimiter(iops, bandwidth) if iops or bandwidth else None
+    # Smaller subtrees keep the rate closer to the caps
+    min_tasks = workers * TASKS_PER_WORKER * (LIMITED_SPLIT if limiter is not None else 1)
+    if columns is not None:
+        for root in roots:
+            columns.add_root(root)
+    # The rows of each subtree are written as it is done, and committed
+    # together at the end so that a cancelled scan leaves the index untouched
+    with ExitStack() as transaction:
+        if index is not None:
+            transaction.enter_context(index.transaction())
+        with instrumentation.stage('split'):
+            tasks, visits = split_tasks(roots, min_tasks, visitor, index, cancel, emit, columns, files)
+
+        trees = {}
+
+        def task_done(idx, path, result, part, columns_part, task_files, estimate=None):
+            if limiter is not None:
+                limiter.done(estimate or limiter.estimate(), result.ops,
+                             result.tree.size if visitor.hashing else 0)
+            trees[path] = result
+            if index is not None:
+                index.write(result.rows, result.removed)
+            if part is not None:
+                with open(part, encoding='utf-8') as f:
+                    for line in f:
+                        emit(line.rstrip('\n'))
+                os.remove(part)
+            if columns_part is not None:
+                columns.append_part(columns_part, path)
+                shutil.rmtree(columns_part)
+            if task_files is not None:
+                files.extend(task_files)
+            if progress is not None:
+                progress(idx, path, result.tree)
+
+        if workers == 1 or len(tasks) <= 1:
+            for idx, path in tasks:
+                if limiter is not None:
+                    limiter.wait(cancel, CANCEL_POLL_INTERVAL)
+                result = scan_tree(path, index=index, emit=emit, cancel=cancel,
+                                   profile=profile, base=bases[idx], columns=columns, files=files)
+                task_done(idx, path, result, None, None, None)
+        else:
+            records_dir = None
+            if emit is not None or columns is not None:
+                records_dir = tempfile.mkdtemp(prefix='.records-', dir=parts_dir)
+            stop_workers = multiprocessing.Event()
+            devices = group_by_device(tasks)
+            limits = {device: AdaptiveLimit(min(workers, len(queued))) for device, queued in devices.items()}
+            # The processes of each pool are started as its limit grows
+            executors = {device: ProcessPoolExecutor(max_workers=limit.maximum, initializer=init_worker,
+                                                     initargs=(stop_workers,))
+                         for device, limit in limits.items()}
+            futures = {}
+
+            def submit_ready():
+                for device, queued in devices.items():
+                    limit = limits[device]
+                    while queued and limit.ready() and (limiter is None or limiter.ready()):
+                        idx, path = queued.popleft()
+                        future = executors[device].submit(scan_task, path, index_path,
+                                                          records_dir if emit is not None else None,
+                                                          profile, bases[idx],
+                                                          records_dir if columns is not None else None,
+                                                          files is not None)
+                        futures[future] = (idx, path, device, limit.started(),
+                                           limiter.estimate() if limiter is not None else None)
+
+            try:
+                index_path = index.path if index is not None else None
+                submit_ready()
+                while futures or any(devices.values()):
+                    if futures:
+                        done, __ = wait(futures, timeout=CANCEL_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                    else:
+                        # Everything left waits for the rate cap
+                        done = ()
+                        time.sleep(min(CANCEL_POLL_INTERVAL, limiter.delay()))
+                    for future in done:
+                        idx, path, device, started, estimate = futures.pop(future)
+                        output = future.result()
+                        limits[device].done(started, output.result.ops)
+                        task_done(idx, path, *output, estimate)
+                    if cancel is not None and cancel.is_set():
+                        stop_workers.set()
+                        raise CollectionCancelled()
+                    submit_ready()
+            finally:
+                for executor in executors.values():
+                    executor.shutdown(cancel_futures=True)
+                if records_dir is not None:
+                    shutil.rmtree(records_dir, ignore_errors=True)
+                if instrumentation.enabled:
+                    for device, limit in limits.items():
+                        instrumentation.count(f'device {device} final limit', limit.limit)
+                        instrumentation.count(f'device {device} limit decreases', limit.decreases)
+        if limiter is not None and instrumentation.enabled:
+            instrumentation.count('rate limit waits', limiter.waits)
+
+        split_rows, split_removed = resolve_visits(visits, trees)
+        if emit is not None:
+            for visit in visits:
+                emit(visit.to_record())
+        if index is not None:
+            with instrumentation.stage('index update'):
+                index.write(split_rows, split_removed)
+        return [trees[root].tree for root in roots]
@@ -0,0 +1,329 @@
+"""
+Module for keeping the metrics of collected trees up to date. Changed
+directories are reported by inotify where it is available, or found by
+polling the mtime of every directory, and only the totals of the
+directories above them are updated
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+from model.index import subtree_bounds
+from model.scanner import Metrics, root_base
+
+# Seconds during which more changes are gathered after the first one
+DEBOUNCE = 0.1
+POLL_INTERVAL = 1.0
+
+# Flags of inotify, see inotify(7)
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_DONT_FOLLOW = 0x2000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW)
+EVENT_HEADER = struct.Struct('iIII')
+READ_SIZE = 64 * 1024
+
+
+class InotifyWatcher(object):
+    """
+    Watches directories with inotify, through a ctypes binding of libc
+    """
+
+    def __init__(self):
+        """
+        Initializes the inotify instance
+
+        :raise: OSError if inotify is not available
+        """
+        if not sys.platform.startswith('linux'):
+            raise OSError('inotify is only available on Linux')
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.paths = {}
+        self.descriptors = {}
+
+    def add(self, path):
+        """
+        Starts watching a directory
+
+        :param path: the directory path
+        :raise: OSError if the limit of watches is reached
+        """
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise OSError(err, 'Too many directories for inotify, see fs.inotify.max_user_watches')
+            # The directory is gone, its parent reports it
+            return
+        self.paths[wd] = path
+        self.descriptors[path] = wd
+
+    def remove(self, path):
+        wd = self.descriptors.pop(path, None)
+        if wd is not None:
+            self.paths.pop(wd, None)
+            self.libc.inotify_rm_watch(self.fd, wd)
+
+    def wait(self, timeout):
+        """
+        Waits for changes, gathering the ones which come right after the first
+
+        :param timeout: the seconds to wait for the first change
+        :return: set of the changed directories, empty if there were none
+        """
+        changed = set()
+        ready, __, __ = select.select([self.fd], [], [], timeout)
+        deadline = time.monotonic() + DEBOUNCE
+        while ready:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                data = b''
+            pos = 0
+            while pos < len(data):
+                wd, mask, __, length = EVENT_HEADER.unpack_from(data, pos)
+                pos += EVENT_HEADER.size + length
+                if mask & IN_Q_OVERFLOW:
+                    changed.update(self.descriptors)
+                elif mask & IN_IGNORED:
+                    path = self.paths.pop(wd, None)
+                    self.descriptors.pop(path, None)
+                elif wd in self.paths:
+                    changed.add(self.paths[wd])
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            ready, __, __ = select.select([self.fd], [], [], remaining)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher(object):
+    """
+    Watches directories by checking their mtime at a fixed interval. Like the
+    incremental scans, it notices created, deleted and renamed entries, but not
+    files modified in place until their directory changes
+    """
+
+    def __init__(self, interval=POLL_INTERVAL):
+        self.interval = interval
+        self.mtimes = {}
+        self.next_poll = time.monotonic() + interval
+
+    def add(self, path):
+        try:
+            self.mtimes[path] = os.stat(path, follow_symlinks=False).st_mtime_ns
+        except OSError:
+            pass
+
+    def remove(self, path):
+        self.mtimes.pop(path, None)
+
+    def wait(self, timeout):
+        """
+        Waits until the next poll if it is within timeout, and does it
+
+        :param timeout: the maximum seconds to wait
+        :return: set of the changed directories, empty if there were none
+        """
+        delay = self.next_poll - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return set()
+        time.sleep(max(delay, 0))
+        self.next_poll = time.monotonic() + self.interval
+        changed = set()
+        for path, mtime_ns in self.mtimes.items():
+            try:
+                if os.stat(path, follow_symlinks=False).st_mtime_ns != mtime_ns:
+                    changed.add(path)
+            except OSError:
+                changed.add(path)
+        for path in changed:
+            self.add(path)
+        return changed
+
+    def close(self):
+        self.mtimes.clear()
+
+
+def make_watcher():
+    """
+    Gets an inotify watcher, or a polling one where inotify is not available
+
+    :return: the watcher
+    """
+    try:
+        return InotifyWatcher()
+    except (OSError, AttributeError):
+        return PollingWatcher()
+
+
+class LiveNode(object):
+    __slots__ = ('direct', 'subdirs', 'tree')
+
+    def __init__(self, direct, subdirs):
+        self.direct = direct
+        self.subdirs = subdirs
+        self.tree = None
+
+
+class LiveTree(object):
+    """
+    In memory metrics of every directory of a root, kept up to date
+    by rescanning only the directories which changed
+    """
+
+    def __init__(self, root, visitor):
+        self.root = root
+        self.visitor = visitor
+        self.base = root_base(root)
+        self.nodes = {}
+
+    @property
+    def tree(self):
+        return self.nodes[self.root].tree
+
+    def load(self, index=None):
+        """
+        Builds the metrics of the whole tree, from the index of the last
+        collection if it has the root, and by scanning it otherwise
+
+        :param index: the MetricsIndex, or None
+        :return: the paths of every directory
+        """
+        if index is not None:
+            for path, entry in index.subtree(self.root):
+                self.nodes[path] = LiveNode(Metrics.from_json(entry.direct),
+                                            [os.path.join(path, name) for name in entry.subdirs])
+        if self.root not in self.nodes:
+            self.nodes.clear()
+            self._scan(self.root)
+        self._sum(self.root)
+        return list(self.nodes)
+
+    def _scan(self, path):
+        """
+        Lists a subtree, adding a node for every directory
+
+        :return: the paths of the directories added
+        """
+        added = []
+        pending = [path]
+        while pending:
+            current = pending.pop()
+            node = LiveNode(Metrics(), [])
+            self.visitor.scan_dir(current, self.base, node.direct, node.subdirs)
+            self.nodes[current] = node
+            pending.extend(node.subdirs)
+            added.append(current)
+        return added
+
+    def _sum(self, path):
+        """
+        Computes the subtree metrics bottom up, for a directory whose nodes have none
+
+        :return: the metrics of the subtree
+        """
+        order = []
+        pending = [path]
+        while pending:
+            current = pending.pop()
+            order.append(current)
+            pending.extend(p for p in self.nodes[current].subdirs if p in self.nodes)
+        for current in reversed(order):
+            node = self.nodes[current]
+            node.tree = Metrics().merge(node.direct)
+            for sub in node.subdirs:
+                if sub in self.nodes:
+                    node.tree.merge(self.nodes[sub].tree)
+        return self.nodes[path].tree
+
+    def _drop(self, path):
+        """
+        Forgets a subtree
+
+        :return: the paths of the directories dropped
+        """
+        dropped = []
+        pending = [path]
+        while pending:
+            node = self.nodes.pop(pending[-1], None)
+            dropped.append(pending.pop())
+            if node is not None:
+                pending.extend(node.subdirs)
+        return dropped
+
+    def _ancestors(self, path):
+        while path != self.root:
+            path = os.path.dirname(path)
+            yield self.nodes[path]
+
+    def update(self, changed):
+        """
+        Rescans the changed directories of this tree and updates the
+        totals of the directories above them
+
+        :param changed: the changed directory paths, of any root
+        :return: (added, removed) tuple with the directory paths which
+            appeared and disappeared
+        """
+        added = []
+        removed = []
+        prefix, upper = subtree_bounds(self.root)
+        # Parents first, so that the subtrees they drop are not rescanned
+        for path in sorted((p for p in changed if p == self.root or prefix <= p < upper),
+                           key=lambda p: p.rstrip(os.sep).count(os.sep)):
+            node = self.nodes.get(path)
+            if node is None:
+                continue
+            old_tree = node.tree
+            direct = Metrics()
+            subdirs = []
+            if os.path.isdir(path):
+                self.visitor.scan_dir(path, self.base, direct, subdirs)
+            elif path == self.root:
+                direct.errors += 1
+
+            before = set(node.subdirs)
+            after = set(subdirs)
+            for gone in before - after:
+                if gone in self.nodes:
+                    removed.extend(self._drop(gone))
+            for new in after - before:
+                added.extend(self._scan(new))
+                self._sum(new)
+
+            node.direct = direct
+            node.subdirs = subdirs
+            node.tree = Metrics().merge(direct)
+            for sub in subdirs:
+                node.tree.merge(self.nodes[sub].tree)
+            for ancestor in self._ancestors(path):
+                ancestor.tree.subtract(old_tree).merge(node.tree)
+        return added, removed
@@ -3,6 +3,7 @@ Module for dialogs
 """
 
 import datetime as dt
+import re
 import sys
 
 import tkinter as tk
@@ -25,9 +26,12 @@ PLEASE_INSTALL_MODULES = "Please install dependency modules by doing this(use pi
 
 dependency = 'tkfilebrowser'
 
-try:
-    tkfilebrowser = deputils.do_import(dependency)
-except ModuleNotFoundError as e:
+
+def _on_missing_dependency(e):
+    """
+    Shows how to install the missing dependency of a lazily imported module
+    :param e: the ModuleNotFoundError
+    """
     if e.name == 'win32com':
         print(PLEASE_INSTALL_MODULES)
         print("C:\\> pip install pywin32")
@@ -35,6 +39,9 @@ except ModuleNotFoundError as e:
         sys.exit(MISSING_DEPENDENCIES_ERROR_CODE)
 
 
+tkfilebrowser = deputils.lazy_import(dependency, on_error=_on_missing_dependency)
+
+
 class LayoutDialog(Dialog):
     """
     Class for the dialog in which we ask for data so that
@@ -48,6 +55,7 @@ class LayoutDialog(Dialog):
     DATETIME_ROW = 3
     SELECT_TEMPLATE_FILE_ROW = 4
     ENTRY_TEMPLATE_PATH_ROW = 5
+    HARDLINK_SEEDS_ROW = 6
 
     def __init__(self, parent, *args, **kwargs):
         super().__init__(parent, *args, **kwargs)
@@ -67,6 +75,8 @@ class LayoutDialog(Dialog):
             self.path2 = tk.StringVar()
         if not hasattr(self, 'field3'):
             self.field3 = tk.StringVar()
+        if not hasattr(self, 'hardlink_seeds'):
+            self.hardlink_seeds = tk.BooleanVar()
         if not hasattr(self, 'datetime'):
             self.datetime = None
             raise MvcError(['Datetime picker error'])
@@ -92,6 +102,7 @@ class LayoutDialog(Dialog):
         self.path1.set(f'{Path.home()}')
         self.path2 = tk.StringVar()
         self.path2.set(f'{Path.home()}')
+        self.hardlink_seeds = tk.BooleanVar(value=False)
 
         # Row
         btn_projects_dir = ttk.Button(master, text='txt_btn_projects_path',
@@ -147,6 +158,11 @@ class LayoutDialog(Dialog):
                                        dateformat='dd/mm/y')
 
         self.datetime.grid(row=LayoutDialog.DATETIME_ROW, column=1, sticky='we', columnspan=3, padx=LayoutDialog.DEFAULT_PADDING, pady=LayoutDialog.DEFAULT_PADDING)
+
+        # Row
+        chk_hardlink = ttk.Checkbutton(master, text='txt_chk_hardlink_seeds', variable=self.hardlink_seeds)
+        Tooltip(chk_hardlink, text='txt_ttip_hardlink_seeds')
+        chk_hardlink.grid(row=LayoutDialog.HARDLINK_SEEDS_ROW, column=0, columnspan=4, sticky='w', padx=LayoutDialog.DEFAULT_PADDING, pady=LayoutDialog.DEFAULT_PADDING)
         self.resizable(False, False)
         return ent_prefix
 
@@ -155,11 +171,29 @@ class LayoutDialog(Dialog):
         if not project_path.exists() or not project_path.is_dir():
             return False
 
+        if not Path(self.path2.get()).is_file():
+            return False
+
         if any(x.get().strip() == '' for x in (self.field1, self.field2, self.field3)):
             return False
 
         return self.datetime.validate()
 
+    def apply(self):
+        """
+        Keeps the values of the dialog in self.result. Several project
+        codes can be given separated by commas or spaces
+        """
+        self.result = {
+            'projects_path': self.path1.get(),
+            'template_path': self.path2.get(),
+            'projects': [code for code in re.split(r'[,\s]+', self.field2.get()) if code],
+            'prefix': self.field1.get().strip(),
+            'suffix': self.field3.get().strip(),
+            'when': self.datetime.get_datetime(),
+            'hardlink_seeds': self.hardlink_seeds.get(),
+        }
+
     def _on_open_save_dialog(self, __=None):
         """
         Handles event when the save button is pressed
@@ -184,6 +218,64 @@ class LayoutDialog(Dialog):
         )
 
 
+class QueryDialog(Dialog):
+    """
+    Class for the dialog in which we ask for a query over the file
+    records of the last collection, with its cutoff date
+    """
+    DEFAULT_PADDING = 5
+    QUERY_ROW = 0
+    DATETIME_ROW = 1
+
+    def __init__(self, parent, queries, *args, **kwargs):
+        """
+        Initializes this dialog
+
+        :param parent: the parent
+        :param queries: the names of the queries
+        """
+        # The parent class does body before returning
+        self.queries = queries
+        self.query = None
+        self.datetime = None
+        super().__init__(parent, *args, **kwargs)
+
+    def body(self, master):
+        super().body(master)
+        self.title('txt_title_query')
+        master.columnconfigure(1, weight=1)
+
+        self.query = tk.StringVar(value=self.queries[0])
+        Label(master, text='txt_lbl_query').grid(row=QueryDialog.QUERY_ROW, column=0, padx=QueryDialog.DEFAULT_PADDING, pady=QueryDialog.DEFAULT_PADDING)
+        cmb_query = ttk.Combobox(master, values=self.queries, state='readonly', textvariable=self.query)
+        Tooltip(cmb_query, text='txt_ttip_query')
+        cmb_query.grid(row=QueryDialog.QUERY_ROW, column=1, sticky='we', padx=QueryDialog.DEFAULT_PADDING, pady=QueryDialog.DEFAULT_PADDING)
+
+        # The cutoff of the queries of old files
+        Label(master, text='txt_lbl_cutoff').grid(row=QueryDialog.DATETIME_ROW, column=0, padx=QueryDialog.DEFAULT_PADDING, pady=QueryDialog.DEFAULT_PADDING)
+        year_ago = dt.datetime.today() - dt.timedelta(days=365)
+        self.datetime = DatetimePicker(master,
+                                       day=year_ago.day, month=year_ago.month,
+                                       year=year_ago.year, hour=year_ago.hour,
+                                       minute=year_ago.minute,
+                                       dateformat='dd/mm/y')
+        self.datetime.grid(row=QueryDialog.DATETIME_ROW, column=1, sticky='we', padx=QueryDialog.DEFAULT_PADDING, pady=QueryDialog.DEFAULT_PADDING)
+        self.resizable(False, False)
+        return cmb_query
+
+    def validate(self):
+        return self.datetime.validate()
+
+    def apply(self):
+        """
+        Keeps the query and its cutoff in self.result
+        """
+        self.result = {
+            'query': self.query.get(),
+            'cutoff': self.datetime.get_datetime(),
+        }
+
+
 if __name__ == '__main__':
     root = tk.Tk()
     d = LayoutDialog(root)
@@ -1,3 +1,7 @@
+import base64
+import threading
+from collections import OrderedDict
+
 import tkinter as tk
 from common.utils import ASSETS_PATH
 
@@ -7,15 +11,120 @@ class IconProvider(object):
     SAVE_DISK = 'save_disk'
     GARBAGE_BIN = 'garbage_bin'
     METRICS = 'metrics'
-    icons = {}
+    # Maximum number of images kept, the least recently used ones which
+    # no widget is showing are dropped
+    MAX_CACHED = 64
+    BASE_DPI = 96
+    icons = OrderedDict()
+    # Base64 PNG data by file stem, like 'metrics' or 'metrics@2x'
+    raw = {}
+    lock = threading.RLock()
+    loader = None
+    scale = None
+
+    @staticmethod
+    def preload(background=False):
+        """
+        Reads every PNG in the assets folder in a single batch, so that
+        building widgets does not wait for the disk
+
+        :param background: True for reading them in a background thread
+        """
+        with IconProvider.lock:
+            if IconProvider.loader is not None or IconProvider.raw:
+                return
+            if background:
+                IconProvider.loader = threading.Thread(target=IconProvider._read_assets,
+                                                       name='icon-preload', daemon=True)
+                IconProvider.loader.start()
+                return
+        IconProvider._read_assets()
 
     @staticmethod
-    def get(icon_key):
-        if icon_key in IconProvider.icons:
-            new_icon = IconProvider.icons.get(icon_key)
-        else:
-            new_icon = tk.PhotoImage(file=str(ASSETS_PATH / f'{icon_key}.png'))
-            IconProvider.icons[icon_key] = new_icon
+    def _read_assets():
+        raw = {path.stem: base64.b64encode(path.read_bytes())
+               for path in ASSETS_PATH.glob('*.png')}
+        IconProvider.raw.update(raw)
+
+    @staticmethod
+    def get_scale():
+        """
+        Gets the integer scale of the display, 2 for a HiDPI display
+
+        :return: the scale, at least 1
+        """
+        if IconProvider.scale is None:
+            root = tk._default_root
+            if root is None:
+                return 1
+            dpi = root.winfo_fpixels('1i')
+            IconProvider.scale = max(1, round(dpi / IconProvider.BASE_DPI))
+        return IconProvider.scale
+
+    @staticmethod
+    def get(icon_key, size=None):
+        """
+        Gets an icon, using its '@<size>x' variant if there is one and
+        zooming the base image otherwise
+
+        :param icon_key: the name of the icon
+        :param size: the integer scale, the one of the display by default
+        :return: the PhotoImage
+        """
+        size = size or IconProvider.get_scale()
+        key = (icon_key, size)
+        loader = IconProvider.loader
+        if loader is not None and loader.is_alive():
+            loader.join()
+
+        with IconProvider.lock:
+            new_icon = IconProvider.icons.get(key)
+            if new_icon is not None:
+                IconProvider.icons.move_to_end(key)
+                return new_icon
+
+            data = IconProvider._get_data(f'{icon_key}@{size}x') if size > 1 else None
+            if data is None:
+                data = IconProvider._get_data(icon_key)
+                zoom = size
+            else:
+                zoom = 1
+            if data is None:
+                new_icon = tk.PhotoImage(file=str(ASSETS_PATH / f'{icon_key}.png'))
+            else:
+                new_icon = tk.PhotoImage(data=data)
+            if zoom > 1:
+                new_icon = new_icon.zoom(zoom)
+            IconProvider.icons[key] = new_icon
+            IconProvider._evict()
         return new_icon
 
+    @staticmethod
+    def _get_data(stem):
+        """
+        Gets the data of a PNG, reading it if it was not preloaded
+
+        :param stem: the file name without the extension
+        :return: the base64 data, None if there is no such file
+        """
+        data = IconProvider.raw.get(stem)
+        if data is None:
+            path = ASSETS_PATH / f'{stem}.png'
+            if path.exists():
+                data = base64.b64encode(path.read_bytes())
+                IconProvider.raw[stem] = data
+        return data
 
+    @staticmethod
+    def _evict():
+        """
+        Drops the least recently used images no widget is showing
+        until there are no more than MAX_CACHED
+        """
+        icons = IconProvider.icons
+        for key in list(icons):
+            if len(icons) <= IconProvider.MAX_CACHED:
+                break
+            image = icons[key]
+            if not image.tk.getboolean(image.tk.call('image', 'inuse', image.name)):
+                del icons[key]
@@ -0,0 +1,161 @@
+"""
+Headless view for running collections from the command line.
+It must not import tkinter nor any module which does
+"""
+
+import argparse
+import datetime as dt
+import sys
+import time
+from pathlib import Path
+
+from common.events.events import EndTaskEvent, MetricsDeltaEvent, ProgressBatchEvent
+from common.exceptions.exceptions import MvcError
+from common.observer import Observer
+
+
+class TerminalView(Observer):
+    # Seconds between redraws of the progress line
+    REDRAW_INTERVAL = 0.1
+    # Seconds between deliveries of model events
+    PUMP_INTERVAL = 0.02
+
+    def __init__(self, controller, argv=None, out=sys.stdout):
+        """
+        Initializes this view from the command line arguments
+
+        :param controller: the controller
+        :param argv: the arguments, the ones after 'text' in sys.argv by default
+        :param out: the stream where the output is written
+        """
+        self.controller = controller
+        self.out = out
+        self.interactive = out.isatty()
+        self.errors = 0
+        self.progress = None
+        self.started = None
+        self.last_redraw = 0.0
+        self.status_width = 0
+        self.handlers = {
+            ProgressBatchEvent: self._on_progress,
+            str: self._print,
+            MvcError: self._on_error,
+            EndTaskEvent: self._on_end_task,
+            MetricsDeltaEvent: self._on_metrics_delta,
+        }
+
+        if argv is None:
+            argv = sys.argv[sys.argv.index('text') + 1:] if 'text' in sys.argv else sys.argv[1:]
+        self.args = self._parse_args(argv)
+
+    def _parse_args(self, argv):
+        """
+        Parses the arguments of the collection
+
+        :param argv: the arguments
+        :return: the parsed arguments
+        """
+        parser = argparse.ArgumentParser(prog='main.py text',
+                                         description='Collects metrics without a GUI')
+        parser.add_argument('paths', nargs='*', help='the folders to collect metrics from')
+        parser.add_argument('-d', '--dest', default=str(Path.home()),
+                            help='the folder where the metrics are saved')
+        parser.add_argument('-p', '--profile', default=self.controller.get_combo_options()[0],
+                            choices=self.controller.get_combo_options(),
+                            help='the collection profile')
+        parser.add_argument('-w', '--watch', action='store_true',
+                            help='keep the metrics up to date until Ctrl+C')
+        parser.add_argument('-q', '--query', choices=self.controller.get_query_options(),
+                            help='query the file records saved in --dest instead of collecting')
+        parser.add_argument('--before', type=dt.datetime.fromisoformat,
+                            help='the cutoff of the older_than query, like 2020-01-31 or 2020-01-31T12:00')
+        args = parser.parse_args(argv)
+        if not args.paths and not args.query:
+            parser.error('the paths are required unless querying')
+        return args
+
+    def start(self):
+        """
+        Runs the collection until it ends, cancelling it on Ctrl+C
+        """
+        self.started = time.monotonic()
+        if self.args.query:
+            self.controller.query_metrics(self.args.dest, self.args.query, self.args.before)
+        elif self.args.watch:
+            self.controller.watch_metrics(self.args.dest, self.args.paths, self.args.profile)
+        else:
+            self.controller.collect_metrics(self.args.dest, self.args.paths, self.args.profile)
+        try:
+            while self.controller.is_collecting():
+                self.controller.process_events()
+                time.sleep(TerminalView.PUMP_INTERVAL)
+        except KeyboardInterrupt:
+            self.controller.cancel_collection()
+            while self.controller.is_collecting():
+                time.sleep(TerminalView.PUMP_INTERVAL)
+        self.controller.process_events(None)
+        self._clear_status()
+        if self.errors:
+            sys.exit(1)
+
+    def update(self, value):
+        self.update_batch([value])
+
+    def update_batch(self, values):
+        """
+        Prints the messages of several model events and
+        redraws the progress line once
+
+        :param values: the events
+        """
+        for value in values:
+            self.dispatch(value)
+        self._redraw_status()
+
+    def _on_progress(self, event):
+        self.progress = event
+
+    def _on_error(self, error):
+        self.errors += 1
+        self._print(f'Error: {error.messages[0]}', file=sys.stderr)
+
+    def _on_end_task(self, event):
+        total = event.info['total']
+        self._print(f'Total: {total["files"]} files, {total["dirs"]} dirs, '
+                    f'{total["size"]} bytes in {time.monotonic() - self.started:.1f} s')
+
+    def _on_metrics_delta(self, event):
+        delta = event.info['delta']
+        total = event.info['total']
+        self._print(f'{event.info["root"]}: {delta["files"]:+} files, {delta["dirs"]:+} dirs, '
+                    f'{delta["size"]:+} bytes, now {total["files"]} files, {total["dirs"]} dirs, '
+                    f'{total["size"]} bytes')
+
+    def _print(self, msg, file=None):
+        self._clear_status()
+        print(msg, file=file or self.out, flush=True)
+        self.last_redraw = 0.0
+
+    def _clear_status(self):
+        if self.status_width:
+            self.out.write('\r' + ' ' * self.status_width + '\r')
+            self.out.flush()
+            self.status_width = 0
+
+    def _redraw_status(self):
+        """
+        Redraws the progress line, at most once every REDRAW_INTERVAL
+        and only if the output is a terminal
+        """
+        now = time.monotonic()
+        if not self.interactive or self.progress is None \
+                or now - self.last_redraw < TerminalView.REDRAW_INTERVAL:
+            return
+        self.last_redraw = now
+        elapsed = now - self.started
+        p = self.progress
+        status = (f'{elapsed:6.1f} s  {p["subtrees"]} subtrees  {p["files"]} files  '
+                  f'{p["size"] / 2 ** 20:.1f} MiB  {p["files"] / max(elapsed, 1e-3):.0f} files/s')
+        self.out.write('\r' + status.ljust(self.status_width))
+        self.out.flush()
+        self.status_width = len(status)
@@ -6,13 +6,15 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 
 from common import deputils
-from common.events.events import SetPathEvent
+from common.events.events import MetricsDeltaEvent, SamplesEvent, SetPathEvent
 from common.exceptions.exceptions import MvcError
-from common.observer import Observer
+from common.observer import Observer, Subscription
 from controller.controller import Controller
 from controller.testcontroller import MockController
-from view.dialogs import LayoutDialog
 from view.icons import IconProvider
+from view.widgets.chart import Chart
+from view.widgets.logpane import LogPane
+from view.widgets.pathlist import PathList
 from view.widgets.tooltip import Tooltip
 
 
@@ -20,11 +22,11 @@ PLEASE_INSTALL_MODULES = "Please install dependency modules by doing this(use pi
 dependency = 'tkfilebrowser'
 
 
-deputils.check_import(dependency)
-
-try:
-    tkfilebrowser = deputils.do_import(dependency)
-except ModuleNotFoundError as e:
+def _on_missing_dependency(e):
+    """
+    Shows how to install the missing dependency of a lazily imported module
+    :param e: the ModuleNotFoundError
+    """
     if e.name == 'win32com':
         error_msg = PLEASE_INSTALL_MODULES
         error_msg += f"\nC:\> pip install pywin32"
@@ -33,37 +35,60 @@ except ModuleNotFoundError as e:
         sys.exit(0)
 
 
+# Heavy modules are only imported the first time they are used
+tkfilebrowser = deputils.lazy_import(dependency, on_error=_on_missing_dependency)
+dialogs = deputils.lazy_import('view.dialogs')
+
+
 class GuiView(ttk.Frame, Observer):
     ROW_MINSIZE = 5
     COL_MINSIZE = 35
     PADDING = 5
     ICON_PLACE = 'right'
+    # Milliseconds between deliveries of model events, about 60 fps
+    PUMP_INTERVAL = 16
+    MAX_OUTPUT_LINES = 100000
+    MAX_SAMPLE_EVENTS = 64
+    # Samples charted, the last hour at the one second interval of the model
+    CHART_SAMPLES = 3600
 
     def __init__(self, controller: Controller, *args, **kwargs):
+        # The icons are read while Tk starts
+        IconProvider.preload(background=True)
         self.root = tk.Tk()
         super().__init__(master=self.root, *args, **kwargs)
         self.controller = controller
+        # Each handler returns the text to append to the output, if any
+        self.handlers = {
+            str: self._on_message,
+            MvcError: self._on_error,
+            SetPathEvent: self._on_set_path,
+            MetricsDeltaEvent: self._on_metrics_delta,
+        }
         self.selected_profile = tk.StringVar()
         self.destiny_path = tk.StringVar()
+        self.watch = tk.BooleanVar()
         self.destiny_path.set(f'{Path.home()}')
 
         # Dynamic resizing
         """
                 Col0    Col1    Col2    Col3    Col4
-        Row 0   ----------- Create -----------
+        Row 0   ------ Create -------   Query ----
         Row 1   Profile Cmb     Entry   SaveTo
-        Row 2   --- Add ----    --------------  Yscr
-        Row 3   --- Rmv ----    ---- List ----  Yscr
-        Row 4   -- Clear ---    --------------  Yscr
-        Row 5                   ---- Xscr ----
-        Row 6   ---------- Collect -----------
-        Row 7   ----------- Text -------------  Yscr
-        Row 8   ----------- Xscr -------------  Yscr
+        Row 2   --- Add ----    ------ List ------
+        Row 3   --- Rmv ----    ------ List ------
+        Row 4   -- Clear ---    ------ List ------
+        Row 5                   ------ List ------
+        Row 6   --- Collect ---     Watch   Cancel ---
+        Row 7   ------------- Log --------------
+        Row 8   ------------- Log --------------
+        Row 9   ------------ Usage -------------
         """
 
         rows = (0, 0, 0,
                 0, 0, 0,
-                0, 1, 0)
+                0, 1, 0,
+                0)
         columns = (0, 0, 1, 0, 0)
         for numrow, weight in enumerate(rows):
             self.rowconfigure(numrow, weight=weight, minsize=GuiView.ROW_MINSIZE)
@@ -77,9 +102,14 @@ class GuiView(ttk.Frame, Observer):
                                 image=folder_img, compound=GuiView.ICON_PLACE,
                                 command=self._on_btn_dialog)
         Tooltip(btn_dialog, text='this button opens a dialog')
-        btn_dialog.grid(row=0, column=0, columnspan=5,
+        btn_dialog.grid(row=0, column=0, columnspan=3,
                         sticky='ew', padx=GuiView.PADDING, pady=GuiView.PADDING)
 
+        btn_query = ttk.Button(self, text='txt_btn_query', command=self._on_btn_query)
+        Tooltip(btn_query, text='queries the file records of the last collection')
+        btn_query.grid(row=0, column=3, columnspan=2,
+                       sticky='ew', padx=GuiView.PADDING, pady=GuiView.PADDING)
+
         ops = Controller.get_combo_options()
         ttk.Label(self, text='txt_label').grid(row=1, column=0, padx=GuiView.PADDING, pady=GuiView.PADDING)
         cmb_profile = ttk.Combobox(self, values=ops, state='readonly',
@@ -125,39 +155,40 @@ class GuiView(ttk.Frame, Observer):
         btn_clear_metric_paths.grid(row=4, column=0, columnspan=2,
                                     sticky='nswe', padx=GuiView.PADDING, pady=GuiView.PADDING)
 
-        # Listbox with dynamic vertical scroll
-        xscr = ttk.Scrollbar(self, orient=tk.HORIZONTAL)
-        xscr.grid(row=5, column=2, rowspan=1, columnspan=2, sticky='WE')
-        yscr = ttk.Scrollbar(self, orient=tk.VERTICAL)
-        yscr.grid(row=2, rowspan=3, column=4, sticky='NS')
-        self.lst_path = tk.Listbox(self, height=5,
-                                   xscrollcommand=xscr.set, yscrollcommand=yscr.set)
-        self.lst_path.grid(row=2, column=2, rowspan=3, columnspan=2,
+        # Path list rendering only the visible rows, with its own scrollbars
+        self.lst_path = PathList(self, height=5)
+        self.lst_path.grid(row=2, column=2, rowspan=4, columnspan=3,
                            sticky='nswe', padx=GuiView.PADDING, pady=GuiView.PADDING)
-        xscr['command'] = self.lst_path.xview
-        yscr['command'] = self.lst_path.yview
 
         metrics_img = IconProvider.get('metrics')
         btn_collect = ttk.Button(self, text='txt_btn_dothings',
                                  image=metrics_img, compound=GuiView.ICON_PLACE,
                                  command=self._on_collect_metrics)
         Tooltip(btn_collect, text='this button gets the stuff done')
-        btn_collect.grid(row=6, column=0, columnspan=5,
+        btn_collect.grid(row=6, column=0, columnspan=2,
                          sticky='we', padx=GuiView.PADDING, pady=GuiView.PADDING)
 
-        # Text widget with dynamic scroll
-        xscr = ttk.Scrollbar(self, orient=tk.HORIZONTAL)
-        xscr.grid(row=8, column=0, columnspan=4, sticky='WE')
-        yscr = ttk.Scrollbar(self, orient=tk.VERTICAL)
-        yscr.grid(row=7, column=4, sticky='NS')
-        self.output = tk.Text(self, height=8,
-                              yscrollcommand=yscr.set,
-                              xscrollcommand=xscr.set)
-        self.output.configure(state=tk.DISABLED)
-        self.output.grid(row=7, column=0, columnspan=4,
+        chk_watch = ttk.Checkbutton(self, text='txt_chk_watch', variable=self.watch)
+        Tooltip(chk_watch, text='keeps the metrics up to date until cancelled')
+        chk_watch.grid(row=6, column=2, sticky='w', padx=GuiView.PADDING, pady=GuiView.PADDING)
+
+        btn_cancel = ttk.Button(self, text='txt_btn_cancel',
+                                command=self._on_cancel_collect_metrics)
+        Tooltip(btn_cancel, text='this button stops the stuff being done')
+        btn_cancel.grid(row=6, column=3, columnspan=2,
+                        sticky='we', padx=GuiView.PADDING, pady=GuiView.PADDING)
+
+        # Log pane keeping only the last lines, with its own scrollbars
+        self.output = LogPane(self, max_lines=GuiView.MAX_OUTPUT_LINES, height=8)
+        self.output.grid(row=7, column=0, columnspan=5, rowspan=2,
                          sticky='nswe', padx=GuiView.PADDING, pady=GuiView.PADDING)
-        yscr['command'] = self.output.yview
-        xscr['command'] = self.output.xview
+
+        # System and collection cpu usage sampled by the model
+        self.usage = Chart(self, height=80, max_points=GuiView.CHART_SAMPLES)
+        self.usage.grid(row=9, column=0, columnspan=5,
+                        sticky='we', padx=GuiView.PADDING, pady=GuiView.PADDING)
+        self.controller.subscribe(self._on_samples, maxsize=GuiView.MAX_SAMPLE_EVENTS,
+                                  policy=Subscription.DROP_OLDEST, types=(SamplesEvent,))
 
     def init_ui(self):
         self.root.title('MyProject')
@@ -166,34 +197,76 @@ class GuiView(ttk.Frame, Observer):
         self.root.update()
         self.root.deiconify()
         self.root.minsize(self.root.winfo_width(), self.root.winfo_height())
+        deputils.startup_checkpoint('first window')
+        self.after(GuiView.PUMP_INTERVAL, self._pump_events)
         self.root.mainloop()
 
     def start(self):
         self.init_ui()
 
     def update(self, value):
-        msg = '\n'
-        if isinstance(value, str):
-            msg += value
-        elif isinstance(value, MvcError):
-            msg += value.messages[0]
-            messagebox.showerror('Error', msg)
-        elif isinstance(value, SetPathEvent):
-            self.destiny_path.set(value.info)
-
-        if msg.strip():
-            self.output.config(state=tk.NORMAL)
-            self.output.insert(tk.END, msg)
-            self.output.config(state=tk.DISABLED)
+        self.update_batch([value])
+
+    def update_batch(self, values):
+        """
+        Renders several model events with a single append to the output
+        :param values: the events
+        """
+        lines = [line for msg in map(self.dispatch, values) if msg and msg.strip()
+                 for line in msg.split('\n')]
+        if lines:
+            self.output.extend(lines)
+
+    def _on_message(self, msg):
+        return msg
+
+    def _on_error(self, error):
+        msg = error.messages[0]
+        messagebox.showerror('Error', msg)
+        return msg
+
+    def _on_set_path(self, event):
+        self.destiny_path.set(event.info)
+
+    def _on_metrics_delta(self, event):
+        delta = event.info['delta']
+        total = event.info['total']
+        return (f'{event.info["root"]}: {delta["files"]:+} files, {delta["size"]:+} bytes, '
+                f'now {total["files"]} files, {total["dirs"]} dirs, {total["size"]} bytes')
+
+    def _on_samples(self, events):
+        """
+        Charts the usage samples, which skip the queue of the output so
+        that only the newest ones are kept if the GUI falls behind
+        :param events: the SamplesEvent list
+        """
+        for event in events:
+            columns = event.info['columns']
+            for name in ('cpu', 'proc_cpu'):
+                pos = columns.index(name)
+                self.usage.extend(name, [row[pos] for row in event.info['rows']])
+
+    def _pump_events(self):
+        """
+        Delivers the pending model events to update and schedules the next delivery
+        """
+        self.controller.process_events()
+        self.after(GuiView.PUMP_INTERVAL, self._pump_events)
 
     def _on_collect_metrics(self):
         """
         Handles event when the collect metrics button is pressed
         :param __: the event
         """
-        self.controller.collect_metrics(self.destiny_path.get(),
-                                        self.lst_path.get(0, tk.END),
-                                        self.selected_profile.get())
+        collect = self.controller.watch_metrics if self.watch.get() else self.controller.collect_metrics
+        collect(self.destiny_path.get(), self.lst_path.get_all(), self.selected_profile.get())
+
+    def _on_cancel_collect_metrics(self, __=None):
+        """
+        Handles event when the cancel button is pressed
+        :param __: the event
+        """
+        self.controller.cancel_collection()
 
     def _on_open_save_dialog(self, __=None):
         """
@@ -219,23 +292,21 @@ class GuiView(ttk.Frame, Observer):
         top_title_msg = 'txt_title_{}'.format(upper_selected_profile)
         collectd_paths = tkfilebrowser.askopendirnames(initialdir=initial_dir,
                                                        title=top_title_msg)
-        for p in collectd_paths:
-            self.lst_path.insert(tk.END, p)
+        self.lst_path.extend(collectd_paths)
 
     def _on_remove_collectd_selection(self, __=None):
         """
         Handles event when the remove metrics path button is pressed
         :param __: the event
         """
-        for idx in self.lst_path.curselection():
-            self.lst_path.delete(idx)
+        self.lst_path.delete_selection()
 
     def _on_clear_collectd_selection(self, __=None):
         """
         Handles event when the clear button is pressed
         :param __: the event
         """
-        self.lst_path.delete(0, tk.END)
+        self.lst_path.clear()
 
     def _on_btn_dialog(self, __=None):
         """
@@ -243,9 +314,21 @@ class GuiView(ttk.Frame, Observer):
         :param __: the event
         """
         try:
-            d = LayoutDialog(self)
+            d = dialogs.LayoutDialog(self)
         except MvcError as ge:
             self.update(ge)
+            return
+        if d.result:
+            self.controller.create_layouts(**d.result)
+
+    def _on_btn_query(self, __=None):
+        """
+        Handles event when the query button is pressed
+        :param __: the event
+        """
+        d = dialogs.QueryDialog(self, self.controller.get_query_options())
+        if d.result:
+            self.controller.query_metrics(self.destiny_path.get(), **d.result)
 
 
 if __name__ == '__main__':
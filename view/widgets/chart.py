@@ -0,0 +1,171 @@
+"""
+Widget for plotting long series of values, which are reduced to the
+minimum and maximum of each pixel column before being drawn
+"""
+
+import tkinter as tk
+from collections import deque
+
+from common import deputils
+
+# Only imported by the first redraw, so it does not delay the first window
+numpy = deputils.lazy_import('numpy')
+
+
+def decimate(values, columns):
+    """
+    Reduces a series to the minimum and the maximum of each column, which
+    draws the same line as every value when there is one column per pixel
+
+    :param values: the series, a list, a deque or a NumPy array
+    :param columns: the number of columns
+    :return: (positions, mins, maxs) tuple, positions being the index
+        of the first value of each column
+    """
+    count = len(values)
+    columns = min(columns, count)
+    if not columns:
+        return [], [], []
+    try:
+        values = numpy.asarray(values, dtype=numpy.float64)
+    except ModuleNotFoundError:
+        pass
+    else:
+        starts = numpy.linspace(0, count, columns, endpoint=False).astype(numpy.intp)
+        return (starts.tolist(), numpy.minimum.reduceat(values, starts).tolist(),
+                numpy.maximum.reduceat(values, starts).tolist())
+
+    if isinstance(values, deque):
+        values = list(values)
+    positions, mins, maxs = [], [], []
+    for idx in range(columns):
+        start = idx * count // columns
+        bucket = values[start:(idx + 1) * count // columns]
+        positions.append(start)
+        mins.append(min(bucket))
+        maxs.append(max(bucket))
+    return positions, mins, maxs
+
+
+class Chart(tk.Canvas):
+    """
+    Line chart of several series sharing the x and y axes. Each series
+    is a single line item whose coordinates are replaced on every redraw
+    """
+    PADDING = 4
+    COLORS = ('#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd')
+
+    def __init__(self, parent, width=400, height=120, max_points=None, **kwargs):
+        """
+        Initializes this chart
+
+        :param parent: the parent
+        :param width: the initial width in pixels
+        :param height: the initial height in pixels
+        :param max_points: the values kept of each extended series, the
+            oldest ones are dropped first. None for keeping all of them
+        :param kwargs: the kwargs for the Canvas widget
+        """
+        kwargs.setdefault('background', 'white')
+        kwargs.setdefault('highlightthickness', 0)
+        super().__init__(parent, width=width, height=height, **kwargs)
+        self.max_points = max_points
+        self.series = {}
+        self.lines = {}
+        self._redraw_pending = False
+        self.lbl_max = self.create_text(Chart.PADDING, Chart.PADDING, anchor='nw', fill='gray')
+        self.lbl_min = self.create_text(Chart.PADDING, height - Chart.PADDING, anchor='sw', fill='gray')
+        self.bind('<Configure>', lambda __: self._schedule_redraw())
+
+    def set_series(self, name, values, color=None):
+        """
+        Replaces the values of a series, adding it if it is new
+
+        :param name: the name of the series
+        :param values: the values, a list or a NumPy array
+        :param color: the line color, one of COLORS by default
+        """
+        self.series[name] = values
+        if name not in self.lines:
+            color = color or Chart.COLORS[len(self.lines) % len(Chart.COLORS)]
+            self.lines[name] = self.create_line(0, 0, 0, 0, fill=color, tags=(name,))
+        self._schedule_redraw()
+
+    def extend(self, name, values):
+        """
+        Appends values to a series, adding it if it is new
+
+        :param name: the name of the series
+        :param values: the new values
+        """
+        series = self.series.get(name)
+        if series is None:
+            self.set_series(name, deque(values, self.max_points))
+            return
+        if not isinstance(series, deque):
+            series = self.series[name] = deque(series, self.max_points)
+        series.extend(values)
+        self._schedule_redraw()
+
+    def clear(self):
+        for item in self.lines.values():
+            self.delete(item)
+        self.series.clear()
+        self.lines.clear()
+        self._schedule_redraw()
+
+    def _schedule_redraw(self):
+        if not self._redraw_pending:
+            self._redraw_pending = True
+            self.after_idle(self._redraw)
+
+    def _redraw(self):
+        """
+        Moves the line of every series to its decimated values
+        """
+        self._redraw_pending = False
+        pad = Chart.PADDING
+        width = max(self.winfo_width(), 2 * pad + 2)
+        height = max(self.winfo_height(), 2 * pad + 2)
+        columns = width - 2 * pad
+        length = max((len(v) for v in self.series.values()), default=0)
+
+        decimated = {}
+        for name, values in self.series.items():
+            # Every series shares the x axis, so shorter ones use fewer columns
+            decimated[name] = decimate(values, max(columns * len(values) // max(length, 1), 1))
+        lows = [min(mins) for __, mins, __ in decimated.values() if mins]
+        highs = [max(maxs) for __, __, maxs in decimated.values() if maxs]
+        low, high = (min(lows), max(highs)) if lows else (0.0, 1.0)
+        if high == low:
+            high = low + 1.0
+        x_scale = columns / max(length - 1, 1)
+        y_scale = (height - 2 * pad) / (high - low)
+
+        for name, (positions, mins, maxs) in decimated.items():
+            coords = []
+            for pos, vmin, vmax in zip(positions, mins, maxs):
+                x = pad + pos * x_scale
+                coords += (x, pad + (high - vmax) * y_scale, x, pad + (high - vmin) * y_scale)
+            if len(coords) == 4:
+                coords += coords
+            self.coords(self.lines[name], *(coords or (0, 0, 0, 0)))
+
+        self.itemconfigure(self.lbl_max, text=f'{high:g}')
+        self.itemconfigure(self.lbl_min, text=f'{low:g}')
+        self.coords(self.lbl_min, pad, height - pad)
+
+
+if __name__ == '__main__':
+    import math
+    import time
+
+    root = tk.Tk()
+    chart = Chart(root, width=800, height=300)
+    chart.pack(fill=tk.BOTH, expand=tk.TRUE)
+    chart.set_series('sin', [math.sin(i / 5000) + math.sin(i / 7) / 4 for i in range(1000000)])
+    root.update()
+    started = time.perf_counter()
+    chart._redraw()
+    print(f'Redraw of 1M points: {(time.perf_counter() - started) * 1000:.1f} ms')
+    root.mainloop()
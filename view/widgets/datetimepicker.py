@@ -6,9 +6,12 @@ import datetime as dt
 
 import tkinter as tk
 from tkinter import ttk
-from tkcalendar import DateEntry
+
+from common import deputils
 from .timepicker import Timepicker
 
+# Only imported when the first picker is built
+tkcalendar = deputils.lazy_import('tkcalendar')
 
 
 class DatetimePicker(ttk.Frame):
@@ -30,7 +33,7 @@ class DatetimePicker(ttk.Frame):
         if 'dateformat' in kwargs:
             self.dateformat = kwargs.get('dateformat')
 
-        self.date = DateEntry(self, date_pattern=self.dateformat, *args, **kwargs)
+        self.date = tkcalendar.DateEntry(self, date_pattern=self.dateformat, *args, **kwargs)
         self.time = Timepicker(self, *args, **kwargs)
         self.date.grid(row=0, column=0, sticky='we', padx=2)
         self.time.grid(row=0, column=1, padx=2)
@@ -0,0 +1,244 @@
+"""
+Widget for showing a log with a bounded number of lines which only keeps
+in the Text widget the lines that are visible
+"""
+
+import re
+
+import tkinter as tk
+from tkinter import ttk
+
+
+class RingBuffer(object):
+    """
+    Fixed capacity sequence which overwrites its oldest items
+    once it is full. Appending and indexing are O(1)
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.items = [None] * capacity
+        self.count = 0
+        self.total = 0
+
+    def append(self, item):
+        self.items[self.total % self.capacity] = item
+        self.total += 1
+        if self.count < self.capacity:
+            self.count += 1
+
+    def clear(self):
+        self.items = [None] * self.capacity
+        self.count = 0
+        self.total = 0
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, idx):
+        if not 0 <= idx < self.count:
+            raise IndexError(idx)
+        return self.items[(self.total - self.count + idx) % self.capacity]
+
+    def range(self, start, stop):
+        """
+        Gets the items between two positions
+
+        :param start: the first position, inclusive
+        :param stop: the last position, exclusive
+        :return: list of the items
+        """
+        return [self[idx] for idx in range(max(start, 0), min(stop, self.count))]
+
+
+class LogPane(ttk.Frame):
+    DEFAULT_MAX_LINES = 100000
+    WHEEL_LINES = 3
+    MATCH_TAG = 'match'
+
+    def __init__(self, parent, max_lines=DEFAULT_MAX_LINES, height=8, **kwargs):
+        """
+        Initializes this log pane
+
+        :param parent: the parent
+        :param max_lines: the number of lines kept, the oldest ones are dropped
+        :param height: the height of the text in lines
+        :param kwargs: the kwargs for the Text widget
+        """
+        super().__init__(parent)
+        self.lines = RingBuffer(max_lines)
+        self.top = 0
+        self.rows = height
+        self.follow = tk.BooleanVar(self, True)
+        self.search_text = tk.StringVar(self)
+        self._match = None
+        self._redraw_pending = False
+
+        self.rowconfigure(1, weight=1)
+        self.columnconfigure(0, weight=1)
+
+        toolbar = ttk.Frame(self)
+        toolbar.columnconfigure(0, weight=1)
+        ent_search = ttk.Entry(toolbar, textvariable=self.search_text)
+        ent_search.bind('<Return>', lambda __: self.search(self.search_text.get()))
+        ent_search.grid(row=0, column=0, sticky='we')
+        ttk.Button(toolbar, text='txt_btn_search',
+                   command=lambda: self.search(self.search_text.get())).grid(row=0, column=1, padx=2)
+        ttk.Checkbutton(toolbar, text='txt_chk_follow', variable=self.follow,
+                        command=self._on_follow).grid(row=0, column=2, padx=2)
+        toolbar.grid(row=0, column=0, columnspan=2, sticky='we', pady=(0, 2))
+
+        self.yscr = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.yscr.grid(row=1, column=1, sticky='NS')
+        xscr = ttk.Scrollbar(self, orient=tk.HORIZONTAL)
+        xscr.grid(row=2, column=0, sticky='WE')
+        self.text = tk.Text(self, height=height, wrap=tk.NONE,
+                            xscrollcommand=xscr.set, **kwargs)
+        self.text.configure(state=tk.DISABLED)
+        self.text.tag_configure(LogPane.MATCH_TAG, background='yellow')
+        self.text.grid(row=1, column=0, sticky='nswe')
+        xscr['command'] = self.text.xview
+
+        self.text.bind('<Configure>', self._on_configure)
+        self.text.bind('<MouseWheel>', lambda e: self._on_wheel(-1 if e.delta > 0 else 1))
+        self.text.bind('<Button-4>', lambda __: self._on_wheel(-1))
+        self.text.bind('<Button-5>', lambda __: self._on_wheel(1))
+
+    def append(self, text):
+        """
+        Appends text, which may span several lines
+
+        :param text: the text
+        """
+        self.extend(text.split('\n'))
+
+    def extend(self, lines):
+        """
+        Appends several lines with a single redraw
+
+        :param lines: the lines, without line breaks
+        """
+        before = len(self.lines)
+        added = 0
+        for line in lines:
+            self.lines.append(line)
+            added += 1
+        dropped = before + added - len(self.lines)
+        if self._match is not None:
+            self._match = self._match - dropped if self._match >= dropped else None
+        if self.follow.get():
+            self.top = self._max_top()
+        else:
+            # Keep looking at the same lines while older ones are dropped
+            self.top = max(self.top - dropped, 0)
+        self._schedule_redraw()
+
+    def clear(self):
+        self.lines.clear()
+        self.top = 0
+        self._match = None
+        self._schedule_redraw()
+
+    def search(self, pattern, regexp=False, nocase=True, backwards=False):
+        """
+        Looks for the next line containing pattern after the last match,
+        scrolling to it and highlighting it
+
+        :param pattern: the text or regular expression to look for
+        :param regexp: True if pattern is a regular expression
+        :param nocase: True for ignoring the case
+        :param backwards: True for looking from the last match upwards
+        :return: the position of the line found, None if there is none
+        """
+        if not pattern:
+            return None
+        flags = re.IGNORECASE if nocase else 0
+        matcher = re.compile(pattern if regexp else re.escape(pattern), flags).search
+
+        count = len(self.lines)
+        if self._match is None:
+            start = count - 1 if backwards else 0
+        else:
+            start = self._match + (-1 if backwards else 1)
+        positions = range(start, -1, -1) if backwards else range(start, count)
+        for idx in positions:
+            if matcher(self.lines[idx]):
+                self._match = idx
+                self.follow.set(False)
+                if not self.top <= idx < self.top + self.rows:
+                    self.top = min(max(idx - self.rows // 2, 0), self._max_top())
+                self._schedule_redraw()
+                return idx
+
+        self._match = None
+        self._schedule_redraw()
+        return None
+
+    def yview(self, *args):
+        """
+        Scrolls the visible window, with the same arguments
+        the Scrollbar passes to its command
+        """
+        count = len(self.lines)
+        if args[0] == tk.MOVETO:
+            self.top = int(float(args[1]) * count)
+        elif args[0] == tk.SCROLL:
+            step = self.rows if args[2] == tk.PAGES else 1
+            self.top += int(args[1]) * step
+        self.top = min(max(self.top, 0), self._max_top())
+        self.follow.set(self.top == self._max_top())
+        self._schedule_redraw()
+
+    def _max_top(self):
+        return max(len(self.lines) - self.rows, 0)
+
+    def _on_wheel(self, direction):
+        self.yview(tk.SCROLL, direction * LogPane.WHEEL_LINES, tk.UNITS)
+        return 'break'
+
+    def _on_follow(self):
+        if self.follow.get():
+            self.top = self._max_top()
+            self._schedule_redraw()
+
+    def _on_configure(self, __=None):
+        linespace = max(self.text.tk.call('font', 'metrics', self.text.cget('font'), '-linespace'), 1)
+        rows = max(self.text.winfo_height() // int(linespace), 1)
+        if rows != self.rows:
+            self.rows = rows
+            if self.follow.get():
+                self.top = self._max_top()
+            self._schedule_redraw()
+
+    def _schedule_redraw(self):
+        if not self._redraw_pending:
+            self._redraw_pending = True
+            self.after_idle(self._redraw)
+
+    def _redraw(self):
+        """
+        Replaces the content of the Text widget with the visible lines
+        """
+        self._redraw_pending = False
+        visible = self.lines.range(self.top, self.top + self.rows)
+        self.text.configure(state=tk.NORMAL)
+        self.text.delete('1.0', tk.END)
+        self.text.insert('1.0', '\n'.join(visible))
+        if self._match is not None and self.top <= self._match < self.top + self.rows:
+            line = self._match - self.top + 1
+            self.text.tag_add(LogPane.MATCH_TAG, f'{line}.0', f'{line}.end')
+        self.text.configure(state=tk.DISABLED)
+
+        count = len(self.lines)
+        if count:
+            self.yscr.set(self.top / count, min(self.top + self.rows, count) / count)
+        else:
+            self.yscr.set(0.0, 1.0)
+
+
+if __name__ == '__main__':
+    root = tk.Tk()
+    pane = LogPane(root, max_lines=1000)
+    pane.pack(fill=tk.BOTH, expand=tk.TRUE)
+    pane.extend(f'line {i}' for i in range(5000))
+    root.mainloop()
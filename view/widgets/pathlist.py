@@ -0,0 +1,261 @@
+"""
+Widget for very long lists of paths which only renders the visible rows
+"""
+
+import sys
+import tkinter as tk
+from tkinter import ttk
+
+# Modifier bits of the event state which extend the selection instead of
+# replacing it: Shift, Control and, on macOS, Command
+SHIFT_MASK = 0x1
+CONTROL_MASK = 0x4
+COMMAND_MASK = 0x8
+EXTEND_MASK = SHIFT_MASK | CONTROL_MASK | (COMMAND_MASK if sys.platform == 'darwin' else 0)
+
+
+class PathListModel(object):
+    """
+    Python side list of unique paths, in insertion or sorted order
+    """
+
+    def __init__(self):
+        self.items = []
+        self.members = set()
+        self.sorted = False
+        self._sorted_items = None
+
+    def extend(self, paths):
+        """
+        Appends the paths which are not in the list yet
+
+        :param paths: the paths
+        :return: the number of paths added
+        """
+        added = 0
+        for path in paths:
+            if path not in self.members:
+                self.members.add(path)
+                self.items.append(path)
+                added += 1
+        if added:
+            self._sorted_items = None
+        return added
+
+    def delete(self, indexes):
+        """
+        Deletes several rows in a single pass
+
+        :param indexes: the positions in the current view of the rows to delete
+        :return: the number of paths deleted
+        """
+        view = self.view()
+        doomed = {view[idx] for idx in indexes if 0 <= idx < len(view)}
+        if doomed:
+            self.members -= doomed
+            self.items = [path for path in self.items if path not in doomed]
+            self._sorted_items = None
+        return len(doomed)
+
+    def clear(self):
+        self.items = []
+        self.members = set()
+        self._sorted_items = None
+
+    def view(self):
+        """
+        Gets the paths in the order they are shown, sorting them
+        only once after each change
+
+        :return: the list of paths, which must not be modified
+        """
+        if not self.sorted:
+            return self.items
+        if self._sorted_items is None:
+            self._sorted_items = sorted(self.items)
+        return self._sorted_items
+
+    def __len__(self):
+        return len(self.items)
+
+
+class PathList(ttk.Frame):
+    WHEEL_ROWS = 3
+
+    def __init__(self, parent, height=5, **kwargs):
+        """
+        Initializes this path list
+
+        :param parent: the parent
+        :param height: the height of the list in rows
+        :param kwargs: the kwargs for the Listbox widget
+        """
+        super().__init__(parent)
+        self.model = PathListModel()
+        self.selection = set()
+        # Whether the click or key which changes the selection extends it
+        self._extending = False
+        self.top = 0
+        self.rows = height
+        self.sort_paths = tk.BooleanVar(self, False)
+        self._redraw_pending = False
+
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+
+        self.yscr = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.yscr.grid(row=0, column=1, sticky='NS')
+        xscr = ttk.Scrollbar(self, orient=tk.HORIZONTAL)
+        xscr.grid(row=1, column=0, sticky='WE')
+        self.listbox = tk.Listbox(self, height=height, selectmode=tk.EXTENDED,
+                                  xscrollcommand=xscr.set, **kwargs)
+        self.listbox.grid(row=0, column=0, sticky='nswe')
+        xscr['command'] = self.listbox.xview
+        ttk.Checkbutton(self, text='txt_chk_sorted', variable=self.sort_paths,
+                        command=self._on_sort).grid(row=1, column=1, sticky='e')
+
+        self.listbox.bind('<ButtonPress-1>', self._on_input, add='+')
+        self.listbox.bind('<KeyPress>', self._on_input, add='+')
+        self.listbox.bind('<<ListboxSelect>>', self._on_select)
+        self.listbox.bind('<<Paste>>', self._on_paste)
+        self.listbox.bind('<Configure>', self._on_configure)
+        self.listbox.bind('<MouseWheel>', lambda e: self._on_wheel(-1 if e.delta > 0 else 1))
+        self.listbox.bind('<Button-4>', lambda __: self._on_wheel(-1))
+        self.listbox.bind('<Button-5>', lambda __: self._on_wheel(1))
+
+    def extend(self, paths):
+        """
+        Appends the paths which are not in the list yet
+
+        :param paths: the paths
+        :return: the number of paths added
+        """
+        added = self.model.extend(paths)
+        if added:
+            if self.model.sorted:
+                self.selection.clear()
+            self._schedule_redraw()
+        return added
+
+    def delete_selection(self):
+        """
+        Deletes the selected rows, including the ones scrolled out of view
+
+        :return: the number of paths deleted
+        """
+        deleted = self.model.delete(self.selection)
+        self.selection.clear()
+        self.top = min(self.top, self._max_top())
+        self._schedule_redraw()
+        return deleted
+
+    def clear(self):
+        self.model.clear()
+        self.selection.clear()
+        self.top = 0
+        self._schedule_redraw()
+
+    def get_all(self):
+        """
+        Gets every path, in the order they are shown
+
+        :return: tuple of paths
+        """
+        return tuple(self.model.view())
+
+    def curselection(self):
+        """
+        Gets the selected rows, including the ones scrolled out of view
+
+        :return: sorted tuple of positions
+        """
+        return tuple(sorted(self.selection))
+
+    def yview(self, *args):
+        """
+        Scrolls the visible rows, with the same arguments
+        the Scrollbar passes to its command
+        """
+        if args[0] == tk.MOVETO:
+            self.top = int(float(args[1]) * len(self.model))
+        elif args[0] == tk.SCROLL:
+            step = self.rows if args[2] == tk.PAGES else 1
+            self.top += int(args[1]) * step
+        self.top = min(max(self.top, 0), self._max_top())
+        self._schedule_redraw()
+
+    def _max_top(self):
+        return max(len(self.model) - self.rows, 0)
+
+    def _on_sort(self):
+        self.model.sorted = self.sort_paths.get()
+        self.selection.clear()
+        self._schedule_redraw()
+
+    def _on_input(self, event):
+        self._extending = bool(event.state & EXTEND_MASK)
+
+    def _on_select(self, __=None):
+        """
+        Follows the Listbox: a plain click or key replaces the whole
+        selection, only Shift and Control keep the rows out of view
+        """
+        if self._extending:
+            self.selection.difference_update(range(self.top, self.top + self.listbox.size()))
+        else:
+            self.selection.clear()
+        self.selection.update(self.top + idx for idx in self.listbox.curselection())
+
+    def _on_paste(self, __=None):
+        """
+        Appends the paths in the clipboard, one per line
+        """
+        try:
+            text = self.clipboard_get()
+        except tk.TclError:
+            return
+        self.extend(line.strip() for line in text.splitlines() if line.strip())
+
+    def _on_wheel(self, direction):
+        self.yview(tk.SCROLL, direction * PathList.WHEEL_ROWS, tk.UNITS)
+        return 'break'
+
+    def _on_configure(self, __=None):
+        linespace = max(self.listbox.tk.call('font', 'metrics', self.listbox.cget('font'), '-linespace'), 1)
+        rows = max(self.listbox.winfo_height() // int(linespace), 1)
+        if rows != self.rows:
+            self.rows = rows
+            self.top = min(self.top, self._max_top())
+            self._schedule_redraw()
+
+    def _schedule_redraw(self):
+        if not self._redraw_pending:
+            self._redraw_pending = True
+            self.after_idle(self._redraw)
+
+    def _redraw(self):
+        """
+        Replaces the rows of the Listbox with the visible paths
+        """
+        self._redraw_pending = False
+        visible = self.model.view()[self.top:self.top + self.rows]
+        self.listbox.delete(0, tk.END)
+        if visible:
+            self.listbox.insert(tk.END, *visible)
+        for idx in range(len(visible)):
+            if self.top + idx in self.selection:
+                self.listbox.selection_set(idx)
+
+        count = len(self.model)
+        if count:
+            self.yscr.set(self.top / count, min(self.top + self.rows, count) / count)
+        else:
+            self.yscr.set(0.0, 1.0)
+
+
+if __name__ == '__main__':
+    root = tk.Tk()
+    path_list = PathList(root)
+    path_list.pack(fill=tk.BOTH, expand=tk.TRUE)
+    path_list.extend(f'/tmp/path{i:06}' for i in range(100000))
+    root.mainloop()